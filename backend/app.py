@@ -1,22 +1,41 @@
-from flask import Flask, request, jsonify, send_file
+import startup
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
-import anthropic
-from consts import prompt
+from flask_socketio import SocketIO, send, join_room
+startup.mark("import flask")
+import llm_gateway
+import tool_use
+import intent_router
+import summarizer
+import page_cache
+import navigation
+import explainer
+import explain_cache
+import form_filler
+import form_cache
+import knowledge_index
+import log_config
+import metrics
+import response_cache
+import prompt_cache
+import structured_output
+import audio_cache
+import tts_stream
+import cancellation
 import os
 import io
 import time
 import dotenv
-from langchain.tools import tool
-from langchain_anthropic import ChatAnthropic
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from flask_socketio import SocketIO, send
 import json
-import openai
-import re
+import threading
+from concurrent.futures import as_completed
+startup.mark("import backend modules")
 
 dotenv.load_dotenv()
 
+log_config.configure()
+log = log_config.get_logger("app")
+
 app = Flask(__name__)
 # Configure CORS to allow requests from any origin
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -24,81 +43,110 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 # Initialize SocketIO with proper CORS handling
 socketio = SocketIO(app, 
                    cors_allowed_origins="*", 
-                   logger=True, 
-                   engineio_logger=True,
+                   logger=log_config.SOCKETIO_LOGGING, 
+                   engineio_logger=log_config.SOCKETIO_LOGGING,
                    async_mode='threading')
 
-# Debug flag to show all events
-DEBUG = True
-
-# Initialize OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY")
-# openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Debug mode (LOG_LEVEL=DEBUG) also turns on Flask's debugger and reloader
+DEBUG = log_config.DEBUG
 
 # Cache for storing generated audio to avoid redundant API calls
-tts_cache = {}
+# (bounded by TTS_CACHE_MAX_BYTES, optionally backed by TTS_CACHE_DIR on disk)
+tts_cache = audio_cache.tts_cache
 
-# Add global variable to track TTS tasks
-tts_active = False
+# Valid voice options for OpenAI
+TTS_VOICES = ['alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer']
 
 # Define available tools
-AVAILABLE_TOOLS = [
-    {
-        "name": "summarize",
-        "description": "Summarize the given text content"
-    },
-    {
-        "name": "fill the form",
-        "description": "fill the form with the basic user information"
-    },
-    {
-        "name": "find",
-        "description": "Find specific information within the text"
-    },
-    {
-        "name": "extract_entities",
-        "description": "Extract named entities from the text"
-    },
-    {
-        "name": "analyze_sentiment",
-        "description": "Analyze the sentiment of the text"
-    },
-    {
-        "name": "translate",
-        "description": "Translate the text to another language"
-    }
-]
+AVAILABLE_TOOLS = tool_use.AVAILABLE_TOOLS
+
+# Native tool-use definitions generated from AVAILABLE_TOOLS (used by fused mode)
+TOOL_DEFINITIONS, TOOL_NAME_MAP = tool_use.build_tool_definitions(AVAILABLE_TOOLS)
+
+# /transcript mode: "fused" selects and runs the tool in a single Claude call,
+# "two_step" makes a selection call followed by execute_tool
+TRANSCRIPT_MODE = os.getenv("TRANSCRIPT_MODE", "fused")
+
+# Cache and coalescing counters exported on /metrics
+metrics.register_caches({
+    'response_cache': response_cache.response_cache.stats,
+    'page_index_cache': page_cache.page_index_cache.stats,
+    'tts_cache': tts_cache.stats,
+    'form_structure_cache': form_cache.structure_cache.stats,
+    'explanation_cache': explain_cache.explanation_cache.stats
+}, {
+    'llm': llm_gateway.message_flights.stats,
+    'tts': tts_stream.speech_flights.stats
+})
+
+@app.before_request
+def start_request_log():
+    g.request_id = log_config.new_request_id(request.headers.get('X-Request-ID'))
+    g.request_id_token = log_config.set_request_id(g.request_id)
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def reset_request_log(error=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        log_config.reset_request_id(token)
+
+@app.before_request
+def start_request_metrics():
+    # Label stage and upstream metrics with the route, not the raw path
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_token = metrics.set_endpoint(g.metrics_endpoint)
+    g.metrics_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint, method, status, started = g.metrics_endpoint, request.method, response.status_code, g.metrics_started
+    # Streamed responses are timed until their last chunk has been sent
+    response.call_on_close(lambda: metrics.observe_request(endpoint, method, status, time.perf_counter() - started))
+    return response
+
+@app.teardown_request
+def reset_request_metrics(error=None):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        metrics.reset_endpoint(token)
+
 # Additional Socket.io event handlers
 @socketio.on("connect")
 def handle_connect():
-    print("Client connected to Socket.io server")
+    log.debug("Socket.IO client connected", sid=request.sid)
     # Send a welcome message to confirm connection
     socketio.emit('welcome', {'message': 'Connected to DEI Voice Assistant backend'})
 
 @socketio.on("disconnect")
 def handle_disconnect():
-    print("Client disconnected from Socket.io server")
+    log.debug("Socket.IO client disconnected", sid=request.sid)
 
 @socketio.on("message") 
 def handle_message(msg):
-    print(f"Received Socket.io message: {msg}")
+    log.debug("Socket.IO message received", chars=len(str(msg)))
     # Echo the message back as confirmation
     socketio.emit('message', f"Server received: {msg}")
 
-# Setup logging function
-def log_debug(message):
-    if DEBUG:
-        print(f"[DEBUG] {message}")
-
 # Define the multiplication tool
-@tool
 def multiply(a: float, b: float) -> float:
     """Multiply two numbers together."""
-    print(f"Multiplying {a} and {b}")
+    log.debug("Multiplying", a=a, b=b)
     return a * b
 
 # Set up LangChain agent
 def setup_agent():
+    # LangChain is only needed by /calculate, so it is imported here
+    # instead of slowing down every cold start
+    from langchain.tools import tool
+    from langchain_anthropic import ChatAnthropic
+    from langchain.agents import create_tool_calling_agent, AgentExecutor
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    
     # Retrieve the API key and validate it
     api_key = os.getenv("ANTHROPIC_API_KEY")
     if not api_key:
@@ -112,7 +160,7 @@ def setup_agent():
     )
     
     # Define tools
-    tools = [multiply]
+    tools = [tool(multiply)]
     
     # Create prompt
     prompt = ChatPromptTemplate.from_messages([
@@ -125,10 +173,27 @@ def setup_agent():
     agent = create_tool_calling_agent(llm, tools, prompt)
     
     # Create agent executor
-    return AgentExecutor(agent=agent, tools=tools, verbose=True)
+    return AgentExecutor(agent=agent, tools=tools, verbose=DEBUG)
+
+# The agent executor is built on first use (or by the "agent" warm-up task)
+agent_executor = None
+_agent_lock = threading.Lock()
 
-# Initialize the agent executor
-agent_executor = setup_agent()
+def get_agent_executor():
+    global agent_executor
+    if agent_executor is None:
+        with _agent_lock:
+            if agent_executor is None:
+                with startup.timed("agent"):
+                    agent_executor = setup_agent()
+    return agent_executor
+
+# Tasks that STARTUP_WARMUP can run after startup
+WARMUP_TASKS = {
+    'sdk': llm_gateway.preload_sdks,
+    'clients': lambda: (llm_gateway.get_anthropic_client(), llm_gateway.get_openai_client()),
+    'agent': get_agent_executor
+}
 
 @app.route('/calculate', methods=['POST'])
 def calculate():
@@ -139,13 +204,13 @@ def calculate():
         return jsonify({'error': 'No query provided'}), 400
     
     try:
-        result = agent_executor.invoke({"input": user_input})
+        result = get_agent_executor().invoke({"input": user_input})
         return jsonify({
             'result': result['output'],
             'success': True
         }), 200
     except Exception as e:
-        print(f"Error: {str(e)}")
+        log.exception("Calculation failed")
         return jsonify({
             'error': str(e),
             'success': False
@@ -162,100 +227,63 @@ def execute_tool(tool_name, transcript_text):
     Returns:
         dict: The result of the tool execution
     """
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    
-    if tool_name == "summarize":
-        # Emit socket message for summarize tool
-        log_debug(f"Emitting 'tool_called' socket event for summarize tool")
-        socketio.emit('tool_called', {'tool': 'summarize', 'message': 'Summarize tool called'})
-        print("Summarize tool called AYOOOO")
-        
-        # Just return a confirmation that the socket event was emitted
-        # The actual summarization will happen on the frontend
-        result = {
-            "status": "initiated", 
-            "message": "Summarize tool called. Frontend will extract page content and request summarization."
-        }
-    elif tool_name == "fill the form":
-        log_debug(f"Emitting 'tool_called' socket event for fill the form tool")
-        socketio.emit('tool_called', {'tool': 'fill the form', 'message': 'Fill the form tool called'})
-        print("Fill tool called AYOOOO")
-        
-        # Just return a confirmation that the socket event was emitted
-        # The actual summarization will happen on the frontend
-        result = {
-            "status": "initiated", 
-            "message": "Fill the form tool called. Frontend will extract page content and request filling the form."
-        }
-    
-    elif tool_name == "find":
-        # Handle finding specific information
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022", 
-            max_tokens=1000,
-            temperature=0.0,
-            messages=[
-                {"role": "user", "content": f"Extract the most important facts and key information from this transcript: \n\n{transcript_text}"}
-            ]
-        )
-        result = {"key_information": response.content[0].text}
-        
-    elif tool_name == "extract_entities":
-        # Handle entity extraction
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022", 
-            max_tokens=1000,
-            temperature=0.0,
-            messages=[
-                {"role": "user", "content": f"Extract named entities (people, organizations, locations, dates) from this transcript and return them as a JSON object with these categories as keys and arrays of entities as values. ONLY respond with the JSON object, no other text or explanations: \n\n{transcript_text}"}
-            ]
-        )
-        
-        # Try to parse the JSON response
-        try:
-            entities_json = response.content[0].text.strip()
-            result = {"entities": json.loads(entities_json)}
-        except json.JSONDecodeError:
-            # If parsing fails, return the raw text
-            result = {"entities": response.content[0].text, "parsing_error": True}
-        
-    elif tool_name == "analyze_sentiment":
-        # Handle sentiment analysis
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022", 
-            max_tokens=1000,
-            temperature=0.0,
-            messages=[
-                {"role": "user", "content": f"Analyze the sentiment of this transcript. Return a JSON object with 'sentiment' (positive, negative, or neutral), 'confidence' (0-1), and 'explanation' keys. ONLY respond with the JSON object, no other text or explanations: \n\n{transcript_text}"}
-            ]
-        )
-        
-        # Try to parse the JSON response
-        try:
-            sentiment_json = response.content[0].text.strip()
-            result = {"sentiment_analysis": json.loads(sentiment_json)}
-        except json.JSONDecodeError:
-            # If parsing fails, return the raw text
-            result = {"sentiment_analysis": response.content[0].text, "parsing_error": True}
-        
-    elif tool_name == "translate":
-        # Handle translation (default to English to Spanish)
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022", 
-            max_tokens=1000,
-            temperature=0.0,
-            messages=[
-                {"role": "user", "content": f"Translate the following transcript to Spanish: \n\n{transcript_text}"}
-            ]
-        )
-        result = {"translation": response.content[0].text}
-        
+    if tool_name in tool_use.FRONTEND_TOOL_MESSAGES:
+        # Summarize and fill the form are handed off to the frontend: emit a
+        # socket event and return a confirmation that it was emitted
+        log.debug("Emitting tool_called socket event", tool=tool_name)
+        socketio.emit('tool_called', {'tool': tool_name, 'message': f'{tool_name.capitalize()} tool called'})
+        result = tool_use.frontend_tool_result(tool_name)
+    elif tool_name in tool_use.TEXT_TOOL_OUTPUTS:
+        with metrics.stage("tool"):
+            tool_request = tool_use.text_tool_request(tool_name, transcript_text)
+            try:
+                tool_input = structured_output.generate(
+                    llm_gateway.create_message, tool_request, tool_use.TEXT_TOOL_OUTPUTS[tool_name]
+                )
+                result = tool_use.tool_result_from_input(tool_name, tool_input)
+            except structured_output.StructuredOutputError as e:
+                log.warning("Unparseable tool output", tool=tool_name, error=str(e))
+                result = tool_use.unparsed_tool_result(tool_name, e.raw)
+    elif tool_name in tool_use.TEXT_TOOL_PROMPTS:
+        with metrics.stage("tool"):
+            response = llm_gateway.create_message(**tool_use.text_tool_request(tool_name, transcript_text))
+            result = tool_use.text_tool_result(tool_name, response)
     else:
         # Handle unknown tool
         result = {"error": f"Unknown tool: {tool_name}"}
     
     return result
 
+def run_fused_transcript(transcript_text):
+    """
+    Select and run a tool on the transcript with a single Claude call.
+    
+    The model is given native tool definitions whose input schemas are the
+    tool results, so the tool_use block it returns already holds the result.
+    
+    Args:
+        transcript_text (str): The transcript text to process
+        
+    Returns:
+        tuple: (selected tool name or None, tool result dict or None)
+    """
+    with metrics.stage("select"):
+        response = llm_gateway.create_message(**tool_use.fused_request(transcript_text, TOOL_DEFINITIONS))
+    
+    with metrics.stage("select_parse"):
+        tool_call = tool_use.find_tool_use(response)
+        if tool_call is None:
+            return None, None
+        
+        selected_tool = TOOL_NAME_MAP.get(tool_call.name, tool_call.name)
+        log.debug("Fused mode selected tool", tool=selected_tool)
+        
+        result = tool_use.tool_result_from_input(selected_tool, tool_call.input)
+    if result is None:
+        # summarize / fill the form are handed off to the frontend
+        result = execute_tool(selected_tool, transcript_text)
+    return selected_tool, result
+
 @app.route('/transcript', methods=['POST'])
 def transcript():
     data = request.get_json()
@@ -264,66 +292,85 @@ def transcript():
     if not transcript_text:
         return jsonify({'error': 'No transcript provided'}), 400
     
-    log_debug(f"Received transcript request with {len(transcript_text)} characters")
+    log.debug("Transcript request received", chars=len(transcript_text))
     
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-    # Create the tool selection prompt
-    agent_prompt = """
-    Based on the transcript below, select the most appropriate tool to process this content.
-    Your response must be a valid JSON object with a single 'tool' field containing the name of the selected tool.
-    
-    Available tools:
-    """
+    # Fast path: resolve obvious intents locally without an LLM selection call
+    with metrics.stage("route"):
+        route = intent_router.route(transcript_text)
+    if route:
+        log.debug("Local router selected tool", tool=route.tool, path=route.path, confidence=round(route.confidence, 2))
+        try:
+            tool_result = execute_tool(route.tool, transcript_text)
+        except Exception as e:
+            log.exception("Tool execution failed", tool=route.tool)
+            return jsonify({'error': f'Error executing tool: {str(e)}'}), 500
+        
+        return jsonify({
+            'message': 'Transcript processed successfully!',
+            'selected_tool': route.tool,
+            'result': tool_result,
+            'routing': {'path': route.path, 'confidence': route.confidence}
+        }), 200
     
-    # Add tool descriptions to the prompt
-    for tool in AVAILABLE_TOOLS:
-        agent_prompt += f"\n- {tool['name']}: {tool['description']}"
+    mode = data.get('mode', TRANSCRIPT_MODE)
+    if mode == 'fused':
+        try:
+            selected_tool, tool_result = run_fused_transcript(transcript_text)
+        except Exception as e:
+            log.exception("Fused tool call failed")
+            return jsonify({'error': f'Error executing tool: {str(e)}'}), 500
+        
+        if not selected_tool:
+            return jsonify({'error': 'No tool was selected by the agent'}), 500
+        
+        intent_router.record_example(transcript_text, selected_tool)
+        return jsonify({
+            'message': 'Transcript processed successfully!',
+            'selected_tool': selected_tool,
+            'result': tool_result,
+            'mode': 'fused',
+            'routing': {'path': 'llm'}
+        }), 200
     
-    agent_prompt += f"\n\nTranscript: {transcript_text}\n\nYou must respond with ONLY a valid JSON object like this: {{\"tool\": \"tool_name\"}}. Do not include any other text, explanations, or markdown formatting."
 
     # Call Claude to select a tool
-    log_debug("Sending request to Claude for tool selection")
-    response = client.messages.create(
-        model="claude-3-5-sonnet-20241022", 
-        max_tokens=500,
-        temperature=0.0,
-        messages=[
-            {"role": "user", "content": agent_prompt}
-        ]
-    )
-
-    # Extract the JSON response
-    tool_selection_json = response.content[0].text.strip()
-    log_debug(f"Raw Claude response: {tool_selection_json}")
-    
+    log.debug("Sending tool selection request")
+    selected_tool = None
     try:
-        # Parse the JSON response
-        tool_data = json.loads(tool_selection_json)
-        selected_tool = tool_data.get("tool")
-        log_debug(f"Selected tool: {selected_tool}")
+        with metrics.stage("select"):
+            selected_tool = structured_output.generate(
+                llm_gateway.create_message,
+                tool_use.selection_request(transcript_text, AVAILABLE_TOOLS),
+                tool_use.selection_output(AVAILABLE_TOOLS)
+            )
+        log.debug("Selected tool", tool=selected_tool)
         
         if not selected_tool:
             return jsonify({'error': 'No tool was selected by the agent'}), 500
             
         # Execute the selected tool
-        log_debug(f"Executing tool: {selected_tool}")
         tool_result = execute_tool(selected_tool, transcript_text)
         
+        intent_router.record_example(transcript_text, selected_tool)
         return jsonify({
             'message': 'Transcript processed successfully!',
             'selected_tool': selected_tool,
-            'result': tool_result
+            'result': tool_result,
+            'mode': 'two_step',
+            'routing': {'path': 'llm'}
         }), 200
         
-    except json.JSONDecodeError as e:
-        log_debug(f"JSON decode error: {e}")
-        log_debug(f"Raw response: {tool_selection_json}")
-        return jsonify({'error': f'Failed to parse tool selection response: {tool_selection_json}'}), 500
+    except structured_output.StructuredOutputError as e:
+        log.warning("Unparseable tool selection response", error=str(e), chars=len(e.raw))
+        return jsonify({'error': f'Failed to parse tool selection response: {e.raw}'}), 500
     except Exception as e:
-        log_debug(f"Error executing tool: {e}")
+        log.exception("Tool execution failed", tool=selected_tool)
         return jsonify({'error': f'Error executing tool: {str(e)}'}), 500
 
+def sse_event(event, data):
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route("/summarize", methods=['POST'])
 def summarize():
     data = request.get_json()
@@ -333,31 +380,87 @@ def summarize():
         return jsonify({'error': 'No text content provided'}), 400
     
     try:
-        # Use Claude to summarize the text content
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022", 
-            max_tokens=1000,
-            temperature=0.0,
-            messages=[
-                {"role": "user", "content": f"Provide a concise summary of the following text content. Focus on the main points and key information:\n\n{text_content}"}
-            ]
-        )
-        
-        summary = response.content[0].text
+        # Use Claude to summarize the text content (map-reduce for large pages)
+        summary, mode = summarizer.summarize_text(text_content, data.get('mode', 'auto'))
         
         return jsonify({
             'message': 'Text content summarized successfully!',
-            'summary': summary
+            'summary': summary,
+            'mode': mode
         }), 200
     except Exception as e:
-        print(f"Error during summarization: {str(e)}")
+        log.exception("Summarization failed")
         return jsonify({
             'error': f'Error during summarization: {str(e)}',
             'success': False
         }), 500
 
+@app.route("/summarize/stream", methods=['POST'])
+def summarize_stream():
+    """
+    Stream a summary as Server-Sent Events.
+    
+    Sends a "token" event with {"text": delta} as each token arrives,
+    then a final "done" event with {"summary": full_text}, or an "error"
+    event if the upstream call fails. For large pages the map step runs
+    first and only the reduce call is streamed.
+    """
+    data = request.get_json()
+    text_content = data.get('text') if data else None
+    
+    if not text_content:
+        return jsonify({'error': 'No text content provided'}), 400
+    
+    mode = summarizer.choose_mode(text_content, data.get('mode', 'auto'))
+    
+    def generate():
+        parts = []
+        try:
+            final_request = summarizer.final_request(text_content, mode)
+            for delta in llm_gateway.stream_text(**final_request):
+                parts.append(delta)
+                yield sse_event('token', {'text': delta})
+            yield sse_event('done', {'summary': ''.join(parts), 'mode': mode})
+        except Exception as e:
+            log.exception("Streaming summarization failed")
+            yield sse_event('error', {'error': f'Error during summarization: {str(e)}'})
+    
+    return Response(
+        stream_with_context(metrics.iter_in_context(generate())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@socketio.on("summarize_stream")
+def handle_summarize_stream(data):
+    """
+    Stream a summary over Socket.IO to the requesting client only.
+    
+    Expects {"text": ..., "request_id": optional}. Emits "summary_token"
+    for every delta and "summary_complete" (or "summary_error") at the end,
+    each echoing the request_id.
+    """
+    sid = request.sid
+    data = data or {}
+    text_content = data.get('text')
+    request_id = data.get('request_id')
+    
+    if not text_content:
+        socketio.emit('summary_error', {'error': 'No text content provided', 'request_id': request_id}, to=sid)
+        return
+    
+    parts = []
+    try:
+        mode = summarizer.choose_mode(text_content, data.get('mode', 'auto'))
+        final_request = summarizer.final_request(text_content, mode)
+        for delta in llm_gateway.stream_text(**final_request):
+            parts.append(delta)
+            socketio.emit('summary_token', {'text': delta, 'request_id': request_id}, to=sid)
+        socketio.emit('summary_complete', {'summary': ''.join(parts), 'mode': mode, 'request_id': request_id}, to=sid)
+    except Exception as e:
+        log.exception("Socket summarization failed")
+        socketio.emit('summary_error', {'error': f'Error during summarization: {str(e)}', 'request_id': request_id}, to=sid)
+
 @app.route('/execute-tool', methods=['POST'])
 def execute_tool_route():
     """
@@ -376,7 +479,7 @@ def execute_tool_route():
     
     try:
         # Execute the selected tool
-        log_debug(f"Directly executing tool: {tool_name}")
+        log.debug("Directly executing tool", tool=tool_name)
         tool_result = execute_tool(tool_name, transcript_text)
         
         return jsonify({
@@ -385,9 +488,47 @@ def execute_tool_route():
         }), 200
         
     except Exception as e:
-        log_debug(f"Error executing tool directly: {e}")
+        log.exception("Direct tool execution failed", tool=tool_name)
         return jsonify({'error': f'Error executing tool: {str(e)}'}), 500
 
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    Endpoint that returns hit/miss counters and sizes of the server-side caches,
+    how many requests were coalesced onto an in-flight upstream call, and
+    the input tokens read from / written to the upstream prompt cache.
+    """
+    return jsonify({
+        'response_cache': response_cache.response_cache.stats(),
+        'page_index_cache': page_cache.page_index_cache.stats(),
+        'tts_cache': tts_cache.stats(),
+        'form_structure_cache': form_cache.structure_cache.stats(),
+        'explanation_cache': explain_cache.explanation_cache.stats(),
+        'prompt_cache': prompt_cache.token_stats.stats(),
+        'coalescing': {
+            'llm': llm_gateway.message_flights.stats(),
+            'tts': tts_stream.speech_flights.stats()
+        }
+    }), 200
+
+@app.route('/startup-stats', methods=['GET'])
+def startup_stats():
+    """
+    Endpoint that returns the startup time breakdown (seconds per phase)
+    and how long each lazily initialized component took on first use.
+    """
+    return jsonify(startup.report()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """
+    Endpoint that exposes request, stage and upstream timings, token counts
+    and cache counters in the Prometheus text format.
+    """
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/list-tools', methods=['GET'])
 def list_tools():
     """
@@ -404,7 +545,7 @@ def test_socket():
     Endpoint to manually test socket.io emission
     """
     tool = request.args.get('tool', 'summarize')
-    log_debug(f"Manually emitting tool_called event for tool: {tool}")
+    log.debug("Manually emitting tool_called event", tool=tool)
     
     socketio.emit('tool_called', {'tool': tool, 'message': f'{tool} tool called'})
     
@@ -564,30 +705,64 @@ def debug_console():
 @app.route('/stop_audio', methods=['POST'])
 def stop_audio():
     """
-    Endpoint to stop any active text-to-speech processes
+    Endpoint to stop active text-to-speech processes
     
     This endpoint is called when a recording starts to ensure TTS doesn't
     interfere with speech recording.
     
+    Optional JSON payload:
+    {
+        "session_id": "Client session whose requests should stop",
+        "request_id": "A single request to stop"
+    }
+    
+    In-flight OpenAI requests of the targeted session/request are aborted.
+    Without either field only requests sent without a session_id are stopped.
+    
     Returns a JSON response indicating success
     """
-    global tts_active
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id')
+    request_id = data.get('request_id')
     
-    log_debug("Stop audio request received")
+    log.debug("Stop audio request received", session_id=session_id, tts_request_id=request_id)
     
-    # Set the flag to indicate TTS should be stopped
-    tts_active = False
+    cancelled = cancellation.tts_requests.cancel(session_id=session_id, request_id=request_id)
     
-    # Send a socket event to notify clients that audio should stop
-    socketio.emit('stop_audio', {
-        'message': 'Audio playback interrupted by recording'
-    })
+    # Send a socket event to notify clients that audio should stop; clients
+    # that joined their session room are the only ones notified
+    payload = {
+        'message': 'Audio playback interrupted by recording',
+        'session_id': session_id,
+        'request_id': request_id
+    }
+    if session_id:
+        socketio.emit('stop_audio', payload, to=session_id)
+    else:
+        socketio.emit('stop_audio', payload)
     
     return jsonify({
         "success": True,
-        "message": "Audio playback stopped"
+        "message": "Audio playback stopped",
+        "cancelled": cancelled
     })
 
+@socketio.on("join_session")
+def handle_join_session(data):
+    """
+    Join the Socket.IO room for a client session so stop_audio events for
+    that session reach only this client.
+    """
+    session_id = (data or {}).get('session_id')
+    if session_id:
+        join_room(session_id)
+
+def tts_cancelled_response():
+    return jsonify({
+        "success": False,
+        "error": "TTS request cancelled due to user interruption"
+    }), 200
+
 @app.route('/text_to_speech', methods=['POST'])
 def text_to_speech():
     """
@@ -596,57 +771,43 @@ def text_to_speech():
     Expected JSON payload:
     {
         "text": "Text to convert to speech",
-        "voice": "alloy"  # Optional: can be alloy, echo, fable, onyx, nova, or shimmer
+        "voice": "alloy",  # Optional: can be alloy, echo, fable, onyx, nova, or shimmer
+        "session_id": "...",  # Optional: lets /stop_audio target this client
+        "request_id": "..."  # Optional: lets /stop_audio target this request
     }
     
     Returns audio file in MP3 format
     """
-    global tts_active
+    # Get request data
+    data = request.json
+    
+    if not data or 'text' not in data:
+        return jsonify({"error": "Missing required 'text' field"}), 400
+    
+    cancel_token = cancellation.tts_requests.register(data.get('session_id'), data.get('request_id'))
     
     try:
-        # Set the active flag to indicate TTS is in progress
-        tts_active = True
-        
-        # Get request data
-        data = request.json
-        
-        if not data or 'text' not in data:
-            return jsonify({"error": "Missing required 'text' field"}), 400
-        
         text = data['text']
-        log_debug(f"Text-to-speech request received with {len(text)} characters")
-        
-        # If audio was stopped before processing, return early
-        if not tts_active:
-            log_debug("TTS request cancelled due to interruption")
-            return jsonify({
-                "success": False,
-                "error": "TTS request cancelled due to user interruption"
-            }), 200
+        log.debug("Text-to-speech request received", chars=len(text))
             
         # Limit text length to avoid excessive API usage
         if len(text) > 4096:
             text = text[:4096]
-            log_debug(f"Text truncated to 4096 characters")
+            log.debug("Text truncated", chars=4096)
             
         # Optional voice parameter (defaults to 'alloy')
         voice = data.get('voice', 'alloy')
         
-        # Valid voice options for OpenAI
-        valid_voices = ['alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer']
-        if voice not in valid_voices:
+        if voice not in TTS_VOICES:
             voice = 'alloy'
         
         # Generate a cache key from the text and voice
-        cache_key = f"{voice}:{text}"
+        cache_key = audio_cache.AudioCache.key(voice, text)
         
         # Check if we already have this audio in cache
-        if cache_key in tts_cache:
-            log_debug(f"Using cached audio for TTS request")
-            audio_data = tts_cache[cache_key]['data']
-            
-            # Reset the active flag before returning
-            tts_active = False
+        audio_data = tts_cache.get(cache_key)
+        if audio_data is not None:
+            log.debug("Serving audio from cache")
             
             # Return the cached audio
             return send_file(
@@ -657,58 +818,17 @@ def text_to_speech():
             )
         
         # If not in cache, call OpenAI API
-        log_debug(f"Generating new speech with OpenAI API using voice: {voice}")
+        log.debug("Generating speech", voice=voice)
         
         # Check if OpenAI API key is available
         if not os.getenv("OPENAI_API_KEY"):
-            tts_active = False
             return jsonify({"error": "OpenAI API key not configured"}), 500
         
-        # Verify TTS hasn't been interrupted
-        if not tts_active:
-            log_debug("TTS request cancelled during API preparation")
-            return jsonify({
-                "success": False,
-                "error": "TTS request cancelled due to user interruption"
-            }), 200
-        
         try:
-            # For OpenAI v1.0.0+
-            client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
-            )
-            
-            # Check for interruption after API call
-            if not tts_active:
-                log_debug("TTS request cancelled after API call")
-                return jsonify({
-                    "success": False,
-                    "error": "TTS request cancelled due to user interruption"
-                }), 200
-            
-            # Get the audio content
-            audio_data = response.content
-            
-            # Store in cache (with simple expiration)
-            tts_cache[cache_key] = {
-                'data': audio_data,
-                'timestamp': time.time()
-            }
-            
-            # Clear old cache entries (older than 1 hour)
-            current_time = time.time()
-            keys_to_remove = [k for k, v in tts_cache.items() 
-                            if current_time - v['timestamp'] > 3600]
-            for k in keys_to_remove:
-                del tts_cache[k]
-            
-            log_debug(f"Text-to-speech conversion successful, returning audio file")
-            
-            # Reset the active flag before returning
-            tts_active = False
+            # Shared, pooled OpenAI client via the gateway; concurrent identical
+            # requests share one upstream call and the result is cached
+            # (LRU with byte budget and TTL). Cancelling the token aborts it.
+            audio_data = tts_stream.fetch_speech(cache_key, text, voice, cancel_token)
             
             # Return the audio
             return send_file(
@@ -718,15 +838,81 @@ def text_to_speech():
                 download_name=f"tts_{int(time.time())}.mp3"
             )
             
+        except cancellation.RequestCancelled:
+            log.debug("Text-to-speech request cancelled")
+            return tts_cancelled_response()
         except Exception as e:
-            log_debug(f"OpenAI API error: {str(e)}")
-            tts_active = False
+            log.warning("OpenAI API error", error=str(e))
             return jsonify({"error": f"OpenAI API error: {str(e)}"}), 500
         
     except Exception as e:
-        log_debug(f"Error in text_to_speech: {str(e)}")
-        tts_active = False
+        log.exception("Text-to-speech failed")
         return jsonify({"error": str(e)}), 500
+    finally:
+        cancellation.tts_requests.unregister(cancel_token)
+
+@app.route('/text_to_speech/stream', methods=['POST'])
+def text_to_speech_stream():
+    """
+    Endpoint to stream text to speech sentence by sentence
+    
+    Expected JSON payload is the same as /text_to_speech. The text is not
+    truncated: it is split at sentence boundaries, segments are synthesized
+    concurrently, and MP3 audio is streamed back in order as each segment
+    is ready, so playback can start after the first sentence.
+    
+    Returns a chunked audio/mpeg stream
+    """
+    data = request.json
+    
+    # Whitespace-only text would synthesize nothing and return empty audio
+    text = (data or {}).get('text')
+    if not isinstance(text, str) or not text.strip():
+        return jsonify({"error": "Missing required 'text' field"}), 400
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        return jsonify({"error": "OpenAI API key not configured"}), 500
+    
+    voice = data.get('voice', 'alloy')
+    if voice not in TTS_VOICES:
+        voice = 'alloy'
+    
+    log.debug("Streaming text-to-speech request received", chars=len(text))
+    cancel_token = cancellation.tts_requests.register(data.get('session_id'), data.get('request_id'))
+    
+    chunks = tts_stream.stream_speech(text, voice, cancel_token=cancel_token)
+    
+    # Synthesize the first segment before responding so upstream errors
+    # still produce a proper error response
+    try:
+        first_chunk = next(chunks, b'')
+    except Exception as e:
+        log.warning("OpenAI API error", error=str(e))
+        cancellation.tts_requests.unregister(cancel_token)
+        return jsonify({"error": f"OpenAI API error: {str(e)}"}), 500
+    
+    if cancel_token.cancelled:
+        cancellation.tts_requests.unregister(cancel_token)
+        return tts_cancelled_response()
+    
+    def generate():
+        try:
+            yield first_chunk
+            for chunk in chunks:
+                yield chunk
+        except Exception:
+            log.exception("Streaming speech failed")
+        finally:
+            # Also runs when the client disconnects mid-stream
+            cancel_token.cancel()
+            chunks.close()
+            cancellation.tts_requests.unregister(cancel_token)
+    
+    return Response(
+        stream_with_context(metrics.iter_in_context(generate())),
+        mimetype='audio/mpeg',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/explain', methods=['POST'])
 def explain():
@@ -736,12 +922,9 @@ def explain():
     and returns a simplified explanation.
     """
     try:
-        if DEBUG:
-            app.logger.info(f"Received request to /explain endpoint")
-        
         # Check if we have a valid JSON body
         if not request.is_json:
-            app.logger.error("Request to /explain did not contain JSON data")
+            log.warning("Request to /explain did not contain JSON data")
             return jsonify({
                 'status': 'error',
                 'message': 'Request must contain JSON data'
@@ -749,126 +932,60 @@ def explain():
             
         data = request.json
         
-        if DEBUG:
-            text_present = 'text' in data
-            image_present = 'image_data' in data
-            app.logger.info(f"/explain request contains text: {text_present}, image: {image_present}")
-        
         # Check if we have either text or image data
         if not (data.get('text') or data.get('image_data')):
-            app.logger.error("Request to /explain missing both text and image_data")
+            log.warning("Request to /explain missing both text and image_data")
             return jsonify({
                 'status': 'error',
                 'message': 'Either text or image data is required'
             }), 400
-            
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
         
-        messages = []
-        
-        # Handle text explanation
         if data.get('text'):
-            if DEBUG:
-                app.logger.info(f"Processing text explanation request of length {len(data['text'])}")
-                
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Please explain the following text in simple, straightforward language. Use short sentences, avoid jargon, and focus on making the content accessible to everyone including neurodivergent individuals and non-native speakers. Keep the explanation very brief and to the point (2-3 short paragraphs maximum):\n\n{data['text']}"
-                        }
-                    ]
-                }
-            ]
+            log.debug("Explaining text", chars=len(data['text']))
+        else:
+            log.debug("Explaining image", chars=len(data['image_data']))
         
-        # Handle image explanation
-        elif data.get('image_data'):
-            # The image data is expected to be base64 encoded
-            image_data = data['image_data']
-            
-            if DEBUG:
-                app.logger.info(f"Processing image explanation request, data length: {len(image_data)}")
-            
-            # Determine image format from data URL
-            media_type = "image/png"  # Default
-            
-            # Remove the data URL prefix if present (e.g., "data:image/png;base64,")
-            if ',' in image_data:
-                prefix = image_data.split(',', 1)[0]
-                image_data = image_data.split(',', 1)[1]
-                
-                # Extract media type from prefix if possible
-                if 'image/jpeg' in prefix:
-                    media_type = 'image/jpeg'
-                elif 'image/jpg' in prefix:
-                    media_type = 'image/jpeg'
-                elif 'image/png' in prefix:
-                    media_type = 'image/png'
-                elif 'image/webp' in prefix:
-                    media_type = 'image/webp'
-                    
-                if DEBUG:
-                    app.logger.info(f"Detected image media type: {media_type}")
-            
-            try:
-                messages = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Please explain what you see in this image in simple, straightforward language. Use short sentences, avoid jargon, and focus on making the description accessible to everyone including neurodivergent individuals and non-native speakers. Keep the explanation very brief (2-3 short paragraphs maximum)."
-                            },
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": image_data
-                                }
-                            }
-                        ]
-                    }
-                ]
-            except Exception as e:
-                app.logger.error(f"Error preparing image message: {str(e)}")
-                return jsonify({
-                    'status': 'error',
-                    'message': f'Error processing image data: {str(e)}'
-                }), 400
+        try:
+            cache_key = explain_cache.explanation_cache.key(data)
+            explain_request = explainer.explanation_request(data)
+        except Exception as e:
+            log.warning("Invalid image data", error=str(e))
+            return jsonify({
+                'status': 'error',
+                'message': f'Error processing image data: {str(e)}'
+            }), 400
+        
+        # Repeat explanations of the same text or image are served from the cache
+        explanation = explain_cache.explanation_cache.get(cache_key)
+        if explanation is not None:
+            log.debug("Serving explanation from cache")
+            return jsonify({
+                'status': 'success',
+                'explanation': explanation
+            })
         
-        if DEBUG:
-            app.logger.info("Sending request to Claude API")
-            
         # Get response from Claude
         try:
-            response = client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=messages
-            )
+            response = llm_gateway.create_message(**explain_request)
             
             explanation = response.content[0].text
+            explain_cache.explanation_cache.put(cache_key, explanation)
+            log.debug("Explanation generated", chars=len(explanation))
             
-            if DEBUG:
-                app.logger.info(f"Received explanation from Claude, length: {len(explanation)}")
-                
             return jsonify({
                 'status': 'success',
                 'explanation': explanation
             })
             
         except Exception as e:
-            app.logger.error(f"Error from Claude API: {str(e)}")
+            log.warning("Claude API error", error=str(e))
             return jsonify({
                 'status': 'error',
                 'message': f'Claude API error: {str(e)}'
             }), 500
         
     except Exception as e:
-        app.logger.error(f"Error in explain endpoint: {str(e)}")
+        log.exception("Explain request failed")
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -882,12 +999,11 @@ def fill_form():
     The endpoint expects:
     - form_data: Array of form elements with their details
     - user_data: String containing user knowledge base information
+    - knowledge_base_id: Optional stable id of the user's knowledge base (the
+      extension sends one per profile); without it the index is keyed by user_data
     
     Returns form answers to fill the form.
     """
-    if DEBUG:
-        app.logger.info("Processing form fill request")
-    
     try:
         data = request.json
         
@@ -899,19 +1015,17 @@ def fill_form():
         
         form_data = data.get('form_data', [])
         user_data = data.get('user_data', '')
-        print("Form data is here: ", form_data)
-        print("User data is here: ", user_data)
         if not form_data:
             return jsonify({
                 'status': 'error',
                 'message': 'No form data provided'
             }), 400
         
-        if DEBUG:
-            app.logger.info(f"Received {len(form_data)} form elements to fill")
+        log.debug("Form fill request received", elements=len(form_data), user_data_chars=len(user_data))
         
         # Step 1: Structure the form data using OpenAI
-        structured_form = structure_form_data(form_data)
+        with metrics.stage("structure"):
+            structured_form = structure_form_data(form_data)
         
         if not structured_form:
             return jsonify({
@@ -920,7 +1034,8 @@ def fill_form():
             }), 500
         
         # Step 2: Use Claude to generate answers based on the user data
-        form_answers = generate_form_answers(structured_form, user_data)
+        with metrics.stage("answers"):
+            form_answers = generate_form_answers(structured_form, user_data, data.get('knowledge_base_id'))
         
         if not form_answers:
             return jsonify({
@@ -934,238 +1049,187 @@ def fill_form():
         })
         
     except Exception as e:
-        app.logger.error(f"Error in form fill: {str(e)}")
+        log.exception("Form fill failed")
         return jsonify({
             'status': 'error',
             'message': f'Error processing form: {str(e)}'
         }), 500
 
+@app.route('/fill-form/stream', methods=['POST'])
+def fill_form_stream():
+    """
+    Fill a form like /fill-form, streaming answers as Server-Sent Events.
+    
+    The form is structured before responding, then an "answers" event
+    with {"form_answers": [...]} is sent as each batch of fields is
+    answered, and a final "done" event carries all answers merged by
+    html_id (or an "error" event).
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            'status': 'error',
+            'message': 'No data provided'
+        }), 400
+    
+    form_data = data.get('form_data', [])
+    user_data = data.get('user_data', '')
+    if not form_data:
+        return jsonify({
+            'status': 'error',
+            'message': 'No form data provided'
+        }), 400
+    
+    with metrics.stage("structure"):
+        structured_form = structure_form_data(form_data)
+    if not structured_form:
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to structure form data'
+        }), 500
+    
+    def generate():
+        answer_batches = []
+        try:
+            with metrics.stage("answers"):
+                for answers in iter_form_answers(structured_form, user_data, data.get('knowledge_base_id')):
+                    answer_batches.append(answers)
+                    if answers:
+                        yield sse_event('answers', {'form_answers': answers})
+            form_answers = form_filler.merge_answers(structured_form, answer_batches)
+            if form_answers:
+                yield sse_event('done', {'status': 'success', 'form_answers': form_answers})
+            else:
+                yield sse_event('error', {'message': 'Failed to generate form answers'})
+        except Exception as e:
+            log.exception("Streaming form fill failed")
+            yield sse_event('error', {'message': f'Error processing form: {str(e)}'})
+    
+    return Response(
+        stream_with_context(metrics.iter_in_context(generate())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 def structure_form_data(form_data):
+    """
+    Structure the form data into a standardized format.
+    
+    Forms seen before are served from the fingerprint cache. Otherwise
+    elements with a clear label, id/name and options are structured
+    locally; only the ambiguous ones are sent to Claude, in batches of
+    FORM_BATCH_SIZE, and the call is skipped when there are none.
+    
+    Returns a list of structured questions with possible answers and IDs.
+    """
+    # Forms filled before are answered from the schema fingerprint cache
+    cached = form_cache.structure_cache.get(form_data)
+    if cached is not None:
+        log.debug("Using cached form structure", elements=len(form_data))
+        return cached
+    
+    with metrics.stage("structure_local"):
+        fields, ambiguous = form_filler.structure_locally(form_data)
+    log.debug("Structured form elements locally", local=len(form_data) - len(ambiguous), elements=len(form_data))
+    
+    # Large sets of ambiguous elements are structured in concurrent batches
+    index_batches = form_filler.batches(ambiguous)
+    futures = form_filler.submit_batches(
+        lambda indexes: structure_with_claude([form_data[i] for i in indexes]), index_batches
+    )
+    model_batches = [(indexes, future.result()) for indexes, future in zip(index_batches, futures)]
+    structured = form_filler.merge_structured(fields, model_batches)
+    
+    # Only cache complete structures
+    if all(model_fields for _, model_fields in model_batches):
+        form_cache.structure_cache.put(form_data, structured)
+    return structured
+
+def structure_with_claude(form_data):
     """
     Use Claude to structure the form data into a standardized format.
     
     Returns a list of structured questions with possible answers and IDs.
     """
     try:
-        if DEBUG:
-            app.logger.info(f"Structuring {len(form_data)} form elements with Claude")
-            app.logger.info(f"Form data preview: {json.dumps(form_data[:2])}")
-        
-        # Prepare the prompt
-        prompt = """Structure the following form elements into a standard format. 
-For each element, provide the question, possible answers, and the html_id.
-
-IMPORTANT INSTRUCTIONS:
-1. Make sure to create an entry for EVERY form element provided, don't skip any.
-2. If no possible values are provided, use common sense to suggest appropriate values.
-3. For text fields, suggest appropriate formats or examples.
-4. If the label is unclear, try to determine the likely question based on context.
-5. Use the ID or name as the html_id, keeping it exactly as provided.
-6. For elements with the same label, use the position and surrounding context to differentiate them.
-
-Form elements to structure:
-"""
-        
-        # Add form elements details with better formatting
-        for i, element in enumerate(form_data):
-            prompt += f"\n--- ELEMENT {i+1} ---\n"
-            prompt += f"Type: {element.get('type', 'text')}\n"
-            prompt += f"Label: {element.get('label', 'Unlabeled field')}\n"
-            prompt += f"ID: {element.get('id', '')}\n"
-            prompt += f"Name: {element.get('name', '')}\n"
-            prompt += f"Position: {element.get('position', i)}\n"
-            
-            # Include path and context if available
-            if element.get('positionPath'):
-                prompt += f"Position path: {element.get('positionPath')}\n"
-            
-            if element.get('surroundingContext'):
-                prompt += f"Surrounding context: {element.get('surroundingContext')}\n"
-            
-            if element.get('possibleValues') and len(element.get('possibleValues')) > 0:
-                prompt += "Possible values:\n"
-                for value in element.get('possibleValues'):
-                    prompt += f"- {value.get('text', '')} (value: {value.get('value', '')})\n"
-        
-        # Define the expected output format with more explicit instructions
-        prompt += "\n--- OUTPUT FORMAT ---\n"
-        prompt += "Respond with a JSON array of objects (one for each form element), each with the following structure:\n"
-        prompt += """
-{
-  "question": "The question or field label (make this user-friendly and clear)",
-  "possible_answers": ["array", "of", "possible", "answers", "or", "appropriate", "formats"],
-  "html_id": "The exact HTML ID or name to identify the field (use id, or if empty, use name)"
-}
-
-Make sure to:
-1. Parse ALL form elements
-2. Return an array with one entry per element
-3. Use exactly this JSON structure
-4. Include only the JSON array in your response, no other text
-5. For duplicate fields (same label), create a unique question by adding context or numbering
-"""
-        
-        # Logging the full prompt for debugging
-        if DEBUG:
-            app.logger.info(f"Generated prompt: {prompt}")
+        log.debug("Structuring form elements with Claude", elements=len(form_data))
         
         # Call Claude API to structure the form
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        
-        # Fix: use system as a top-level parameter
-        response = client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=1500,
-            temperature=0.2,  # Lower temperature for more deterministic output
-            system="You are a helpful assistant that structures form data into a standard format. You always follow instructions exactly and return properly formatted JSON arrays.",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-        )
-        
-        # Extract the structured form data
-        structured_text = response.content[0].text.strip()
-        
-        # Clean the response to extract just the JSON part
-        json_match = re.search(r'\[.*\]', structured_text, re.DOTALL)
-        if json_match:
-            structured_text = json_match.group(0)
-        
-        if DEBUG:
-            app.logger.info(f"Claude response: {structured_text[:200]}...")
+        with metrics.stage("structure_prompt"):
+            structure_request = form_filler.structure_request(form_data)
         
-        # Parse the JSON response
+        # The fields come back as record_form_structure input, validated and repaired if needed
         try:
-            structured_data = json.loads(structured_text)
-            
-            # Additional validation
-            if isinstance(structured_data, list):
-                if DEBUG:
-                    app.logger.info(f"Successfully parsed {len(structured_data)} form elements")
-                return structured_data
-            elif isinstance(structured_data, dict) and 'form_structure' in structured_data:
-                if DEBUG:
-                    app.logger.info(f"Successfully parsed {len(structured_data['form_structure'])} form elements")
-                return structured_data['form_structure']
-            else:
-                app.logger.error(f"Unexpected structure in Claude response: {structured_data}")
-                return []
+            structured_data = structured_output.generate(
+                llm_gateway.create_message, structure_request, form_filler.STRUCTURE_OUTPUT
+            )
+            log.debug("Parsed structured form elements", fields=len(structured_data))
+            return structured_data
                 
-        except json.JSONDecodeError as e:
-            app.logger.error(f"Failed to parse Claude JSON response: {e}")
-            app.logger.error(f"Raw response: {structured_text}")
+        except structured_output.StructuredOutputError as e:
+            log.warning("Unparseable form structuring response", error=str(e), chars=len(e.raw))
             return []
             
-    except Exception as e:
-        app.logger.error(f"Error structuring form data: {str(e)}")
+    except Exception:
+        log.exception("Structuring form data failed")
         return []
 
-def generate_form_answers(structured_form, user_data):
+def generate_form_answers(structured_form, user_data, knowledge_base_id=None):
     """
     Use Claude to generate answers for the form fields based on the user's knowledge base data.
     
-    Returns a list of answers for the form fields.
+    Returns a list of answers for the form fields, merged by html_id.
     """
-    try:
-        if DEBUG:
-            app.logger.info(f"Generating answers for {len(structured_form)} form fields")
-            app.logger.info(f"User data length: {len(user_data)}")
-            
-        # Prepare the prompt
-        prompt = """Based on the user's personal information, generate appropriate answers for the following form fields.
-If the user data doesn't contain relevant information for a field, make a reasonable guess based on the context.
+    return form_filler.merge_answers(
+        structured_form, iter_form_answers(structured_form, user_data, knowledge_base_id)
+    )
 
-USER'S PERSONAL INFORMATION:
-"""
-        prompt += user_data if user_data else "No personal information provided."
-        
-        prompt += "\n\nFORM FIELDS TO FILL:\n"
-        
-        # Add form fields
-        for i, field in enumerate(structured_form):
-            prompt += f"\n--- FIELD {i+1} ---\n"
-            prompt += f"Question: {field.get('question', 'Unlabeled field')}\n"
-            
-            if field.get('possible_answers') and len(field.get('possible_answers')) > 0:
-                prompt += "Possible answers:\n"
-                for answer in field.get('possible_answers'):
-                    prompt += f"- {answer}\n"
-            
-            prompt += f"HTML ID: {field.get('html_id', '')}\n"
-        
-        # Define the expected output format
-        prompt += """\n--- OUTPUT INSTRUCTIONS ---
-Return a JSON array with answers for each field, following this structure:
-[
-  {
-    "html_id": "The HTML ID of the field (from the input)",
-    "answer": "The appropriate answer based on user data"
-  },
-  ...
-]
+def iter_form_answers(structured_form, user_data, knowledge_base_id=None):
+    """
+    Answer the fields in batches of FORM_BATCH_SIZE concurrently, yielding
+    each batch's answers as soon as it is done.
+    """
+    field_batches = form_filler.batches(structured_form)
+    log.debug("Answering form fields", fields=len(structured_form), batches=len(field_batches))
+    futures = form_filler.submit_batches(
+        lambda fields: answer_fields(fields, user_data, knowledge_base_id), field_batches
+    )
+    for future in as_completed(futures):
+        yield future.result()
 
-IMPORTANT:
-1. If a field has possible answers, choose the most appropriate one from the list.
-2. For text fields, provide a valid response based on user data or make a reasonable guess.
-3. Make sure to provide an answer for EVERY field, don't skip any.
-4. If you're unsure about a field, make your best guess based on the context.
-5. Keep your answers realistic and appropriate.
-6. Return only the JSON array, no additional text.
-"""
-        
-        if DEBUG:
-            app.logger.info(f"Generate answers prompt length: {len(prompt)}")
-        
-        # Call Claude API to generate answers
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        
-        # Fix: use system as a top-level parameter
-        response = client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=1500,
-            temperature=0.2,  # Lower temperature for more deterministic output
-            system="You are a helpful assistant that fills in forms based on user data. You are accurate, concise, and follow instructions precisely.",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-        )
-        
-        # Extract the generated answers
-        answer_text = response.content[0].text.strip()
-        
-        # Clean the response to extract just the JSON part
-        json_match = re.search(r'\[.*\]', answer_text, re.DOTALL)
-        if json_match:
-            answer_text = json_match.group(0)
+def answer_fields(structured_form, user_data, knowledge_base_id=None):
+    """
+    Use Claude to answer one batch of form fields.
+    
+    Only the knowledge base snippets relevant to the fields are sent (see knowledge_index).
+    
+    Returns a list of answers for the fields.
+    """
+    try:
+        user_data_chars = len(user_data)
+        with metrics.stage("retrieval"):
+            user_data = knowledge_index.relevant_user_data(user_data, structured_form, knowledge_base_id)
+        log.debug("Selected relevant user data", fields=len(structured_form),
+                  user_data_chars=user_data_chars, relevant_chars=len(user_data))
             
-        if DEBUG:
-            app.logger.info(f"Claude answer response: {answer_text[:200]}...")
+        # Call Claude API to generate answers
+        with metrics.stage("answer_prompt"):
+            answers_request = form_filler.answers_request(structured_form, user_data)
         
-        # Parse the JSON response
+        # The answers come back as record_form_answers input, validated and repaired if needed
         try:
-            answers_data = json.loads(answer_text)
-            
-            if isinstance(answers_data, list):
-                if DEBUG:
-                    app.logger.info(f"Successfully generated {len(answers_data)} answers")
-                return answers_data
-            else:
-                app.logger.error(f"Unexpected structure in Claude answer response: {answers_data}")
-                return []
+            answers_data = structured_output.generate(
+                llm_gateway.create_message, answers_request, form_filler.ANSWERS_OUTPUT
+            )
+            log.debug("Generated form answers", answers=len(answers_data))
+            return answers_data
                 
-        except json.JSONDecodeError as e:
-            app.logger.error(f"Failed to parse Claude JSON answer response: {e}")
-            app.logger.error(f"Raw answer response: {answer_text}")
+        except structured_output.StructuredOutputError as e:
+            log.warning("Unparseable form answer response", error=str(e), chars=len(e.raw))
             return []
             
-    except Exception as e:
-        app.logger.error(f"Error generating form answers: {str(e)}")
+    except Exception:
+        log.exception("Generating form answers failed")
         return []
 
 @app.route('/navigation-chrome', methods=['POST'])
@@ -1179,9 +1243,17 @@ def navigation_chrome():
         "transcript": "User's voice transcript"
     }
     
+    On follow-up commands against the same page, send "page_hash" (from a
+    previous response) instead of "html_content", optionally with
+    "dom_patches": [{"selector": "#region", "html": "<div id=region>...</div>"}]
+    for the parts of the page that changed. If the hash is no longer
+    cached the endpoint answers 409 with code "page_not_cached" and the
+    client should resend html_content.
+    
     Returns:
     {
         "status": "success" | "error",
+        "page_hash": "Hash identifying the page's element index",
         "commands": [
             {
                 "type": "click" | "scroll" | "focus" | "navigate",
@@ -1194,9 +1266,6 @@ def navigation_chrome():
     }
     """
     try:
-        if DEBUG:
-            app.logger.info("Received request to /navigation-chrome endpoint")
-        
         if not request.is_json:
             return jsonify({
                 'status': 'error',
@@ -1205,85 +1274,82 @@ def navigation_chrome():
             
         data = request.json
         html_content = data.get('html_content')
+        page_hash = data.get('page_hash')
         transcript = data.get('transcript')
         
-        if not html_content or not transcript:
+        if not (html_content or page_hash) or not transcript:
             return jsonify({
                 'status': 'error',
-                'message': 'Both html_content and transcript are required'
+                'message': 'Both html_content (or page_hash) and transcript are required'
             }), 400
             
-        if DEBUG:
-            app.logger.info(f"Processing navigation request with transcript: {transcript}")
-            
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        
-        # Prepare the prompt for Claude
-        prompt = f"""
-        Based on the HTML content and user's voice transcript below, determine the appropriate navigation commands.
-        Focus on identifying clickable elements, form inputs, or areas that match the user's intent.
-        
-        Return ONLY a JSON array of commands, where each command has:
-        - "type": "click" | "scroll" | "focus" | "navigate"
-        - "target": CSS selector or descriptive target
-        - "confidence": 0.0 to 1.0 indicating confidence in the command
-        - "explanation": Brief explanation of why this action was chosen
-        
-        HTML Content:
-        {html_content}
+        log.debug("Navigation request received", transcript_chars=len(transcript))
+        
+        # Distill the page down to its interactive elements instead of sending
+        # raw HTML, reusing the cached index for pages we have already seen
+        if html_content:
+            page_hash, page = page_cache.index_for_html(html_content)
+        else:
+            page_hash, page = page_cache.index_for_hash(page_hash, data.get('dom_patches'))
+            if page is None:
+                return jsonify({
+                    'status': 'error',
+                    'code': 'page_not_cached',
+                    'message': 'Unknown page_hash, resend html_content'
+                }), 409
         
-        User Transcript:
-        {transcript}
+        page_elements = navigation.page_elements_text(page, html_content)
         
-        Respond ONLY with the JSON array. No other text or explanation.
-        """
+        log.debug("Using element index", page_hash=page_hash[:12], elements=len(page['elements']), chars=len(page_elements))
         
         try:
-            response = client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                temperature=0.0,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            commands = structured_output.generate(
+                llm_gateway.create_message,
+                navigation.navigation_request(page_elements, transcript),
+                navigation.NAVIGATION_OUTPUT
             )
             
-            # Parse the response as JSON
-            try:
-                commands = json.loads(response.content[0].text)
+            log.debug("Generated navigation commands", commands=len(commands))
                 
-                if DEBUG:
-                    app.logger.info(f"Generated navigation commands: {commands}")
-                    
-                return jsonify({
-                    'status': 'success',
-                    'commands': commands
-                })
-                
-            except json.JSONDecodeError as e:
-                app.logger.error(f"Error parsing Claude response as JSON: {str(e)}")
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Failed to parse navigation commands',
-                    'raw_response': response.content[0].text
-                }), 500
+            return jsonify({
+                'status': 'success',
+                'page_hash': page_hash,
+                'commands': commands
+            })
                 
+        except structured_output.StructuredOutputError as e:
+            log.warning("Unparseable navigation response", error=str(e))
+            return jsonify({
+                'status': 'error',
+                'message': 'Failed to parse navigation commands',
+                'raw_response': e.raw
+            }), 500
         except Exception as e:
-            app.logger.error(f"Error from Claude API: {str(e)}")
+            log.warning("Claude API error", error=str(e))
             return jsonify({
                 'status': 'error',
                 'message': f'Claude API error: {str(e)}'
             }), 500
             
     except Exception as e:
-        app.logger.error(f"Error in navigation-chrome endpoint: {str(e)}")
+        log.exception("Navigation request failed")
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+startup.mark("app setup")
+
 if __name__ == '__main__':
-    print("Starting DEI Voice Assistant backend server...")
-    print(f"Debug mode: {'ON' if DEBUG else 'OFF'}")
-    # Use socketio.run instead of app.run
-    socketio.run(app, debug=True, host='0.0.0.0', port=5001, allow_unsafe_werkzeug=True)
+    PORT = int(os.getenv("PORT", "5001"))
+    if os.getenv("SERVER_MODE", "threading") == "asyncio":
+        # Serve the same API from asgi_app.py on an event loop
+        import uvicorn
+        log.info("Starting DEI Voice Assistant backend server", mode="asyncio", port=PORT)
+        uvicorn.run("asgi_app:app", host='0.0.0.0', port=PORT, log_config=None)
+    else:
+        log.info("Starting DEI Voice Assistant backend server", mode="threading", port=PORT, debug=DEBUG)
+        startup.warm_up(WARMUP_TASKS)
+        log.info("Startup time", **startup.report())
+        # Use socketio.run instead of app.run
+        socketio.run(app, debug=DEBUG, host='0.0.0.0', port=PORT, allow_unsafe_werkzeug=True)
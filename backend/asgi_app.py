@@ -0,0 +1,848 @@
+"""
+Asyncio serving mode for the DEI Voice Assistant backend.
+
+app.py runs Flask-SocketIO in threading mode, so every request holds an
+OS thread for as long as its LLM or TTS call takes. This module serves
+the same API as an ASGI application (Starlette plus a python-socketio
+AsyncServer) with every handler running on one event loop and talking
+to the upstream through the AsyncAnthropic / AsyncOpenAI clients in
+llm_gateway.py. A waiting request costs a coroutine instead of a thread,
+so a single process can hold thousands of concurrent upstream calls
+(bounded by the LLM_* pool and concurrency settings).
+
+Prompts, parsing, caching and cancellation are shared with app.py
+through the same modules. The LangChain /calculate demo and the
+/debug-console page are only served by the Flask app. The startup time
+breakdown is served at /startup-stats, as in app.py.
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+or:
+    SERVER_MODE=asyncio python app.py
+"""
+import dotenv
+
+dotenv.load_dotenv()
+
+import startup
+import asyncio
+import json
+import os
+import time
+
+import socketio
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+startup.mark("import starlette")
+
+import llm_gateway
+import tool_use
+import intent_router
+import summarizer
+import page_cache
+import navigation
+import explainer
+import explain_cache
+import form_filler
+import form_cache
+import knowledge_index
+import log_config
+import metrics
+import response_cache
+import prompt_cache
+import structured_output
+import audio_cache
+import tts_stream
+import cancellation
+startup.mark("import backend modules")
+
+log_config.configure()
+log = log_config.get_logger("asgi_app")
+
+tts_cache = audio_cache.tts_cache
+
+# Valid voice options for OpenAI
+TTS_VOICES = ['alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer']
+
+AVAILABLE_TOOLS = tool_use.AVAILABLE_TOOLS
+TOOL_DEFINITIONS, TOOL_NAME_MAP = tool_use.build_tool_definitions(AVAILABLE_TOOLS)
+TRANSCRIPT_MODE = os.getenv("TRANSCRIPT_MODE", "fused")
+
+# Cache and coalescing counters exported on /metrics
+metrics.register_caches({
+    'response_cache': response_cache.response_cache.stats,
+    'page_index_cache': page_cache.page_index_cache.stats,
+    'tts_cache': tts_cache.stats,
+    'form_structure_cache': form_cache.structure_cache.stats,
+    'explanation_cache': explain_cache.explanation_cache.stats
+}, {
+    'llm': llm_gateway.async_message_flights.stats,
+    'tts': tts_stream.async_speech_flights.stats
+})
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    logger=log_config.SOCKETIO_LOGGING,
+    engineio_logger=log_config.SOCKETIO_LOGGING
+)
+
+
+def sse_event(event, data):
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def json_body(request):
+    """Return the parsed JSON body, or None if it is missing or invalid."""
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+# Socket.io event handlers
+@sio.on("connect")
+async def handle_connect(sid, environ):
+    log.debug("Socket.IO client connected", sid=sid)
+    # Send a welcome message to confirm connection
+    await sio.emit('welcome', {'message': 'Connected to DEI Voice Assistant backend'})
+
+
+@sio.on("disconnect")
+async def handle_disconnect(sid, *args):
+    log.debug("Socket.IO client disconnected", sid=sid)
+
+
+@sio.on("message")
+async def handle_message(sid, msg):
+    log.debug("Socket.IO message received", chars=len(str(msg)))
+    # Echo the message back as confirmation
+    await sio.emit('message', f"Server received: {msg}")
+
+
+@sio.on("join_session")
+async def handle_join_session(sid, data):
+    """Join the room for a client session (see app.handle_join_session)."""
+    session_id = (data or {}).get('session_id')
+    if session_id:
+        await sio.enter_room(sid, session_id)
+
+
+@sio.on("summarize_stream")
+async def handle_summarize_stream(sid, data):
+    """Stream a summary over Socket.IO (see app.handle_summarize_stream)."""
+    data = data or {}
+    text_content = data.get('text')
+    request_id = data.get('request_id')
+
+    if not text_content:
+        await sio.emit('summary_error', {'error': 'No text content provided', 'request_id': request_id}, to=sid)
+        return
+
+    parts = []
+    try:
+        mode = summarizer.choose_mode(text_content, data.get('mode', 'auto'))
+        final_request = await summarizer.afinal_request(text_content, mode)
+        async for delta in llm_gateway.astream_text(**final_request):
+            parts.append(delta)
+            await sio.emit('summary_token', {'text': delta, 'request_id': request_id}, to=sid)
+        await sio.emit('summary_complete', {'summary': ''.join(parts), 'mode': mode, 'request_id': request_id}, to=sid)
+    except Exception as e:
+        log.exception("Socket summarization failed")
+        await sio.emit('summary_error', {'error': f'Error during summarization: {str(e)}', 'request_id': request_id}, to=sid)
+
+
+async def execute_tool(tool_name, transcript_text):
+    """Async version of app.execute_tool."""
+    if tool_name in tool_use.FRONTEND_TOOL_MESSAGES:
+        log.debug("Emitting tool_called socket event", tool=tool_name)
+        await sio.emit('tool_called', {'tool': tool_name, 'message': f'{tool_name.capitalize()} tool called'})
+        return tool_use.frontend_tool_result(tool_name)
+    if tool_name in tool_use.TEXT_TOOL_OUTPUTS:
+        with metrics.stage("tool"):
+            tool_request = tool_use.text_tool_request(tool_name, transcript_text)
+            try:
+                tool_input = await structured_output.agenerate(
+                    llm_gateway.acreate_message, tool_request, tool_use.TEXT_TOOL_OUTPUTS[tool_name]
+                )
+            except structured_output.StructuredOutputError as e:
+                log.warning("Unparseable tool output", tool=tool_name, error=str(e))
+                return tool_use.unparsed_tool_result(tool_name, e.raw)
+            return tool_use.tool_result_from_input(tool_name, tool_input)
+    if tool_name in tool_use.TEXT_TOOL_PROMPTS:
+        with metrics.stage("tool"):
+            response = await llm_gateway.acreate_message(**tool_use.text_tool_request(tool_name, transcript_text))
+            return tool_use.text_tool_result(tool_name, response)
+    return {"error": f"Unknown tool: {tool_name}"}
+
+
+async def run_fused_transcript(transcript_text):
+    """Async version of app.run_fused_transcript."""
+    with metrics.stage("select"):
+        response = await llm_gateway.acreate_message(**tool_use.fused_request(transcript_text, TOOL_DEFINITIONS))
+
+    with metrics.stage("select_parse"):
+        tool_call = tool_use.find_tool_use(response)
+        if tool_call is None:
+            return None, None
+
+        selected_tool = TOOL_NAME_MAP.get(tool_call.name, tool_call.name)
+        log.debug("Fused mode selected tool", tool=selected_tool)
+
+        result = tool_use.tool_result_from_input(selected_tool, tool_call.input)
+    if result is None:
+        result = await execute_tool(selected_tool, transcript_text)
+    return selected_tool, result
+
+
+async def transcript(request):
+    data = await json_body(request) or {}
+    transcript_text = data.get('transcript')
+
+    if not transcript_text:
+        return JSONResponse({'error': 'No transcript provided'}, status_code=400)
+
+    log.debug("Transcript request received", chars=len(transcript_text))
+
+    with metrics.stage("route"):
+        route = intent_router.route(transcript_text)
+    if route:
+        log.debug("Local router selected tool", tool=route.tool, path=route.path, confidence=round(route.confidence, 2))
+        try:
+            tool_result = await execute_tool(route.tool, transcript_text)
+        except Exception as e:
+            log.exception("Tool execution failed", tool=route.tool)
+            return JSONResponse({'error': f'Error executing tool: {str(e)}'}, status_code=500)
+
+        return JSONResponse({
+            'message': 'Transcript processed successfully!',
+            'selected_tool': route.tool,
+            'result': tool_result,
+            'routing': {'path': route.path, 'confidence': route.confidence}
+        })
+
+    mode = data.get('mode', TRANSCRIPT_MODE)
+    try:
+        if mode == 'fused':
+            selected_tool, tool_result = await run_fused_transcript(transcript_text)
+        else:
+            mode = 'two_step'
+            log.debug("Sending tool selection request")
+            try:
+                with metrics.stage("select"):
+                    selected_tool = await structured_output.agenerate(
+                        llm_gateway.acreate_message,
+                        tool_use.selection_request(transcript_text, AVAILABLE_TOOLS),
+                        tool_use.selection_output(AVAILABLE_TOOLS)
+                    )
+            except structured_output.StructuredOutputError as e:
+                log.warning("Unparseable tool selection response", error=str(e), chars=len(e.raw))
+                return JSONResponse({'error': f'Failed to parse tool selection response: {e.raw}'}, status_code=500)
+            tool_result = await execute_tool(selected_tool, transcript_text) if selected_tool else None
+    except Exception as e:
+        log.exception("Tool execution failed")
+        return JSONResponse({'error': f'Error executing tool: {str(e)}'}, status_code=500)
+
+    if not selected_tool:
+        return JSONResponse({'error': 'No tool was selected by the agent'}, status_code=500)
+
+    await asyncio.to_thread(intent_router.record_example, transcript_text, selected_tool)
+    return JSONResponse({
+        'message': 'Transcript processed successfully!',
+        'selected_tool': selected_tool,
+        'result': tool_result,
+        'mode': mode,
+        'routing': {'path': 'llm'}
+    })
+
+
+async def summarize(request):
+    data = await json_body(request) or {}
+    text_content = data.get('text')
+
+    if not text_content:
+        return JSONResponse({'error': 'No text content provided'}, status_code=400)
+
+    try:
+        summary, mode = await summarizer.asummarize_text(text_content, data.get('mode', 'auto'))
+        return JSONResponse({
+            'message': 'Text content summarized successfully!',
+            'summary': summary,
+            'mode': mode
+        })
+    except Exception as e:
+        log.exception("Summarization failed")
+        return JSONResponse({
+            'error': f'Error during summarization: {str(e)}',
+            'success': False
+        }, status_code=500)
+
+
+async def summarize_stream(request):
+    """Stream a summary as Server-Sent Events (see app.summarize_stream)."""
+    data = await json_body(request) or {}
+    text_content = data.get('text')
+
+    if not text_content:
+        return JSONResponse({'error': 'No text content provided'}, status_code=400)
+
+    mode = summarizer.choose_mode(text_content, data.get('mode', 'auto'))
+
+    async def generate():
+        parts = []
+        try:
+            final_request = await summarizer.afinal_request(text_content, mode)
+            async for delta in llm_gateway.astream_text(**final_request):
+                parts.append(delta)
+                yield sse_event('token', {'text': delta})
+            yield sse_event('done', {'summary': ''.join(parts), 'mode': mode})
+        except Exception as e:
+            log.exception("Streaming summarization failed")
+            yield sse_event('error', {'error': f'Error during summarization: {str(e)}'})
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def execute_tool_route(request):
+    data = await json_body(request) or {}
+    tool_name = data.get('tool')
+    transcript_text = data.get('transcript')
+
+    if not tool_name:
+        return JSONResponse({'error': 'No tool specified'}, status_code=400)
+
+    if not transcript_text:
+        return JSONResponse({'error': 'No transcript provided'}, status_code=400)
+
+    try:
+        log.debug("Directly executing tool", tool=tool_name)
+        tool_result = await execute_tool(tool_name, transcript_text)
+        return JSONResponse({
+            'message': f'Successfully executed tool: {tool_name}',
+            'result': tool_result
+        })
+    except Exception as e:
+        log.exception("Direct tool execution failed", tool=tool_name)
+        return JSONResponse({'error': f'Error executing tool: {str(e)}'}, status_code=500)
+
+
+async def cache_stats(request):
+    return JSONResponse({
+        'response_cache': response_cache.response_cache.stats(),
+        'page_index_cache': page_cache.page_index_cache.stats(),
+        'tts_cache': tts_cache.stats(),
+        'form_structure_cache': form_cache.structure_cache.stats(),
+        'explanation_cache': explain_cache.explanation_cache.stats(),
+        'prompt_cache': prompt_cache.token_stats.stats(),
+        'coalescing': {
+            'llm': llm_gateway.async_message_flights.stats(),
+            'tts': tts_stream.async_speech_flights.stats()
+        }
+    })
+
+
+async def startup_stats(request):
+    return JSONResponse(startup.report())
+
+
+async def metrics_route(request):
+    if not metrics.METRICS_ENABLED:
+        return JSONResponse({'error': 'Metrics are disabled'}, status_code=404)
+    return Response(metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def list_tools(request):
+    return JSONResponse({'tools': AVAILABLE_TOOLS})
+
+
+async def test_socket(request):
+    tool = request.query_params.get('tool', 'summarize')
+    log.debug("Manually emitting tool_called event", tool=tool)
+    await sio.emit('tool_called', {'tool': tool, 'message': f'{tool} tool called'})
+    return JSONResponse({'message': f'Emitted tool_called event for {tool}'})
+
+
+async def stop_audio(request):
+    """Cancel in-flight TTS requests (see app.stop_audio)."""
+    data = await json_body(request) or {}
+    session_id = data.get('session_id')
+    request_id = data.get('request_id')
+
+    log.debug("Stop audio request received", session_id=session_id, tts_request_id=request_id)
+
+    cancelled = cancellation.tts_requests.cancel(session_id=session_id, request_id=request_id)
+
+    payload = {
+        'message': 'Audio playback interrupted by recording',
+        'session_id': session_id,
+        'request_id': request_id
+    }
+    if session_id:
+        await sio.emit('stop_audio', payload, to=session_id)
+    else:
+        await sio.emit('stop_audio', payload)
+
+    return JSONResponse({
+        "success": True,
+        "message": "Audio playback stopped",
+        "cancelled": cancelled
+    })
+
+
+def tts_cancelled_response():
+    return JSONResponse({
+        "success": False,
+        "error": "TTS request cancelled due to user interruption"
+    })
+
+
+def audio_response(audio_data):
+    return Response(
+        audio_data,
+        media_type="audio/mpeg",
+        headers={'Content-Disposition': f'attachment; filename=tts_{int(time.time())}.mp3'}
+    )
+
+
+def tts_voice(data):
+    voice = data.get('voice', 'alloy')
+    return voice if voice in TTS_VOICES else 'alloy'
+
+
+async def text_to_speech(request):
+    """Convert text to speech (see app.text_to_speech)."""
+    data = await json_body(request)
+
+    if not data or 'text' not in data:
+        return JSONResponse({"error": "Missing required 'text' field"}, status_code=400)
+
+    cancel_token = cancellation.tts_requests.register(data.get('session_id'), data.get('request_id'))
+    try:
+        text = data['text']
+        log.debug("Text-to-speech request received", chars=len(text))
+
+        # Limit text length to avoid excessive API usage
+        if len(text) > 4096:
+            text = text[:4096]
+            log.debug("Text truncated", chars=4096)
+
+        voice = tts_voice(data)
+        cache_key = audio_cache.AudioCache.key(voice, text)
+        # The disk tier (TTS_CACHE_DIR) does blocking file I/O
+        audio_data = await asyncio.to_thread(tts_cache.get, cache_key)
+        if audio_data is not None:
+            log.debug("Serving audio from cache")
+            return audio_response(audio_data)
+
+        if not os.getenv("OPENAI_API_KEY"):
+            return JSONResponse({"error": "OpenAI API key not configured"}, status_code=500)
+
+        try:
+            audio_data = await tts_stream.afetch_speech(cache_key, text, voice, cancel_token)
+        except cancellation.RequestCancelled:
+            log.debug("Text-to-speech request cancelled")
+            return tts_cancelled_response()
+        except Exception as e:
+            log.warning("OpenAI API error", error=str(e))
+            return JSONResponse({"error": f"OpenAI API error: {str(e)}"}, status_code=500)
+
+        return audio_response(audio_data)
+    finally:
+        cancellation.tts_requests.unregister(cancel_token)
+
+
+async def text_to_speech_stream(request):
+    """Stream text to speech sentence by sentence (see app.text_to_speech_stream)."""
+    data = await json_body(request)
+
+    # Whitespace-only text would synthesize nothing and return empty audio
+    text = (data or {}).get('text')
+    if not isinstance(text, str) or not text.strip():
+        return JSONResponse({"error": "Missing required 'text' field"}, status_code=400)
+
+    if not os.getenv("OPENAI_API_KEY"):
+        return JSONResponse({"error": "OpenAI API key not configured"}, status_code=500)
+
+    voice = tts_voice(data)
+
+    log.debug("Streaming text-to-speech request received", chars=len(text))
+    cancel_token = cancellation.tts_requests.register(data.get('session_id'), data.get('request_id'))
+
+    chunks = tts_stream.astream_speech(text, voice, cancel_token=cancel_token)
+
+    # Synthesize the first segment before responding so upstream errors
+    # still produce a proper error response
+    try:
+        first_chunk = await anext(chunks, b'')
+    except Exception as e:
+        log.warning("OpenAI API error", error=str(e))
+        cancellation.tts_requests.unregister(cancel_token)
+        return JSONResponse({"error": f"OpenAI API error: {str(e)}"}, status_code=500)
+
+    if cancel_token.cancelled:
+        cancellation.tts_requests.unregister(cancel_token)
+        return tts_cancelled_response()
+
+    async def generate():
+        try:
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+        except Exception:
+            log.exception("Streaming speech failed")
+        finally:
+            # Also runs when the client disconnects mid-stream
+            cancel_token.cancel()
+            await chunks.aclose()
+            cancellation.tts_requests.unregister(cancel_token)
+
+    return StreamingResponse(
+        generate(),
+        media_type='audio/mpeg',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def explain(request):
+    """Explain selected text or an image (see app.explain)."""
+    data = await json_body(request)
+    if data is None:
+        log.warning("Request to /explain did not contain JSON data")
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Request must contain JSON data'
+        }, status_code=400)
+
+    if not (data.get('text') or data.get('image_data')):
+        log.warning("Request to /explain missing both text and image_data")
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Either text or image data is required'
+        }, status_code=400)
+
+    try:
+        # Image decoding and resizing is CPU-bound
+        cache_key = await asyncio.to_thread(explain_cache.explanation_cache.key, data)
+        explain_request = await asyncio.to_thread(explainer.explanation_request, data)
+    except Exception as e:
+        log.warning("Invalid image data", error=str(e))
+        return JSONResponse({
+            'status': 'error',
+            'message': f'Error processing image data: {str(e)}'
+        }, status_code=400)
+
+    explanation = explain_cache.explanation_cache.get(cache_key)
+    if explanation is not None:
+        return JSONResponse({
+            'status': 'success',
+            'explanation': explanation
+        })
+
+    try:
+        response = await llm_gateway.acreate_message(**explain_request)
+    except Exception as e:
+        log.warning("Claude API error", error=str(e))
+        return JSONResponse({
+            'status': 'error',
+            'message': f'Claude API error: {str(e)}'
+        }, status_code=500)
+
+    explanation = response.content[0].text
+    explain_cache.explanation_cache.put(cache_key, explanation)
+    return JSONResponse({
+        'status': 'success',
+        'explanation': explanation
+    })
+
+
+async def structure_form_data(form_data):
+    """Async version of app.structure_form_data."""
+    cached = form_cache.structure_cache.get(form_data)
+    if cached is not None:
+        return cached
+
+    with metrics.stage("structure_local"):
+        fields, ambiguous = form_filler.structure_locally(form_data)
+    index_batches = form_filler.batches(ambiguous)
+    semaphore = asyncio.Semaphore(form_filler.MAX_WORKERS)
+
+    async def structure_batch(indexes):
+        async with semaphore:
+            return await structure_with_claude([form_data[i] for i in indexes])
+
+    results = await asyncio.gather(*(structure_batch(indexes) for indexes in index_batches))
+    model_batches = list(zip(index_batches, results))
+    structured = form_filler.merge_structured(fields, model_batches)
+
+    # Only cache complete structures
+    if all(model_fields for _, model_fields in model_batches):
+        # Appends to FORM_CACHE_PATH when set
+        await asyncio.to_thread(form_cache.structure_cache.put, form_data, structured)
+    return structured
+
+
+async def structure_with_claude(form_data):
+    """Async version of app.structure_with_claude."""
+    try:
+        with metrics.stage("structure_prompt"):
+            structure_request = form_filler.structure_request(form_data)
+        return await structured_output.agenerate(
+            llm_gateway.acreate_message, structure_request, form_filler.STRUCTURE_OUTPUT
+        )
+    except structured_output.StructuredOutputError as e:
+        log.warning("Unparseable form structuring response", error=str(e), chars=len(e.raw))
+        return []
+    except Exception:
+        log.exception("Structuring form data failed")
+        return []
+
+
+async def generate_form_answers(structured_form, user_data, knowledge_base_id=None):
+    """Async version of app.generate_form_answers."""
+    answer_batches = [answers async for answers in iter_form_answers(structured_form, user_data, knowledge_base_id)]
+    return form_filler.merge_answers(structured_form, answer_batches)
+
+
+async def iter_form_answers(structured_form, user_data, knowledge_base_id=None):
+    """Async version of app.iter_form_answers: yields each batch's answers as it finishes."""
+    semaphore = asyncio.Semaphore(form_filler.MAX_WORKERS)
+
+    async def answer_batch(fields):
+        async with semaphore:
+            return await answer_fields(fields, user_data, knowledge_base_id)
+
+    tasks = [asyncio.ensure_future(answer_batch(fields)) for fields in form_filler.batches(structured_form)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # The client went away mid-stream
+        for task in tasks:
+            task.cancel()
+
+
+async def answer_fields(structured_form, user_data, knowledge_base_id=None):
+    """Async version of app.answer_fields."""
+    try:
+        with metrics.stage("retrieval"):
+            user_data = knowledge_index.relevant_user_data(user_data, structured_form, knowledge_base_id)
+        with metrics.stage("answer_prompt"):
+            answers_request = form_filler.answers_request(structured_form, user_data)
+        return await structured_output.agenerate(
+            llm_gateway.acreate_message, answers_request, form_filler.ANSWERS_OUTPUT
+        )
+    except structured_output.StructuredOutputError as e:
+        log.warning("Unparseable form answer response", error=str(e), chars=len(e.raw))
+        return []
+    except Exception:
+        log.exception("Generating form answers failed")
+        return []
+
+
+async def fill_form(request):
+    """Fill a form from the user's knowledge base (see app.fill_form)."""
+    data = await json_body(request)
+
+    if not data:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No data provided'
+        }, status_code=400)
+
+    form_data = data.get('form_data', [])
+    user_data = data.get('user_data', '')
+    if not form_data:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No form data provided'
+        }, status_code=400)
+
+    with metrics.stage("structure"):
+        structured_form = await structure_form_data(form_data)
+    if not structured_form:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Failed to structure form data'
+        }, status_code=500)
+
+    with metrics.stage("answers"):
+        form_answers = await generate_form_answers(structured_form, user_data, data.get('knowledge_base_id'))
+    if not form_answers:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Failed to generate form answers'
+        }, status_code=500)
+
+    return JSONResponse({
+        'status': 'success',
+        'form_answers': form_answers
+    })
+
+
+async def fill_form_stream(request):
+    """Fill a form, streaming answers per batch as Server-Sent Events (see app.fill_form_stream)."""
+    data = await json_body(request)
+    if not data:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No data provided'
+        }, status_code=400)
+
+    form_data = data.get('form_data', [])
+    user_data = data.get('user_data', '')
+    if not form_data:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No form data provided'
+        }, status_code=400)
+
+    with metrics.stage("structure"):
+        structured_form = await structure_form_data(form_data)
+    if not structured_form:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Failed to structure form data'
+        }, status_code=500)
+
+    async def generate():
+        answer_batches = []
+        try:
+            with metrics.stage("answers"):
+                async for answers in iter_form_answers(structured_form, user_data, data.get('knowledge_base_id')):
+                    answer_batches.append(answers)
+                    if answers:
+                        yield sse_event('answers', {'form_answers': answers})
+            form_answers = form_filler.merge_answers(structured_form, answer_batches)
+            if form_answers:
+                yield sse_event('done', {'status': 'success', 'form_answers': form_answers})
+            else:
+                yield sse_event('error', {'message': 'Failed to generate form answers'})
+        except Exception as e:
+            log.exception("Streaming form fill failed")
+            yield sse_event('error', {'message': f'Error processing form: {str(e)}'})
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def navigation_chrome(request):
+    """Generate navigation commands for a page (see app.navigation_chrome)."""
+    data = await json_body(request)
+    if data is None:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Request must contain JSON data'
+        }, status_code=400)
+
+    html_content = data.get('html_content')
+    page_hash = data.get('page_hash')
+    transcript_text = data.get('transcript')
+
+    if not (html_content or page_hash) or not transcript_text:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Both html_content (or page_hash) and transcript are required'
+        }, status_code=400)
+
+    # Distilling a large page is CPU work, keep it off the event loop
+    if html_content:
+        page_hash, page = await asyncio.to_thread(page_cache.index_for_html, html_content)
+    else:
+        page_hash, page = await asyncio.to_thread(page_cache.index_for_hash, page_hash, data.get('dom_patches'))
+        if page is None:
+            return JSONResponse({
+                'status': 'error',
+                'code': 'page_not_cached',
+                'message': 'Unknown page_hash, resend html_content'
+            }, status_code=409)
+
+    page_elements = navigation.page_elements_text(page, html_content)
+
+    try:
+        commands = await structured_output.agenerate(
+            llm_gateway.acreate_message,
+            navigation.navigation_request(page_elements, transcript_text),
+            navigation.NAVIGATION_OUTPUT
+        )
+    except structured_output.StructuredOutputError as e:
+        log.warning("Unparseable navigation response", error=str(e))
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Failed to parse navigation commands',
+            'raw_response': e.raw
+        }, status_code=500)
+    except Exception as e:
+        log.warning("Claude API error", error=str(e))
+        return JSONResponse({
+            'status': 'error',
+            'message': f'Claude API error: {str(e)}'
+        }, status_code=500)
+
+    return JSONResponse({
+        'status': 'success',
+        'page_hash': page_hash,
+        'commands': commands
+    })
+
+
+routes = [
+    Route('/transcript', transcript, methods=['POST']),
+    Route('/summarize', summarize, methods=['POST']),
+    Route('/summarize/stream', summarize_stream, methods=['POST']),
+    Route('/execute-tool', execute_tool_route, methods=['POST']),
+    Route('/cache-stats', cache_stats, methods=['GET']),
+    Route('/startup-stats', startup_stats, methods=['GET']),
+    Route('/metrics', metrics_route, methods=['GET']),
+    Route('/list-tools', list_tools, methods=['GET']),
+    Route('/test-socket', test_socket, methods=['POST']),
+    Route('/stop_audio', stop_audio, methods=['POST']),
+    Route('/text_to_speech', text_to_speech, methods=['POST']),
+    Route('/text_to_speech/stream', text_to_speech_stream, methods=['POST']),
+    Route('/explain', explain, methods=['POST']),
+    Route('/fill-form', fill_form, methods=['POST']),
+    Route('/fill-form/stream', fill_form_stream, methods=['POST']),
+    Route('/navigation-chrome', navigation_chrome, methods=['POST']),
+]
+
+http_app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(log_config.ASGIRequestIdMiddleware),
+        Middleware(metrics.ASGIMetricsMiddleware, endpoints=[route.path for route in routes]),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ]
+)
+
+# Async clients are created on first use on the event loop; warming up
+# in the background only preloads the SDKs
+WARMUP_TASKS = {
+    'sdk': llm_gateway.preload_sdks
+}
+
+
+def on_startup():
+    startup.warm_up(WARMUP_TASKS)
+    log.info("Startup time", **startup.report())
+
+
+# Socket.IO is served on /socket.io/, everything else goes to the HTTP routes
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=on_startup)
+startup.mark("app setup")
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    log.info("Starting DEI Voice Assistant backend server", mode="asyncio", port=5001)
+    uvicorn.run(app, host='0.0.0.0', port=5001, log_config=None)
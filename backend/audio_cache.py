@@ -0,0 +1,164 @@
+"""
+Bounded cache for synthesized text-to-speech audio.
+
+Replaces the unbounded module-level tts_cache dict. The memory tier is an
+LRU with a byte budget (O(1) eviction, TTL checked on lookup instead of
+scanning every entry). When TTS_CACHE_DIR is set, every clip is also
+written to a file-per-entry disk tier with its own byte budget, so hot
+audio survives restarts and memory evictions without holding it in RAM.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from response_cache import LRUCache
+
+MEMORY_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("TTS_CACHE_TTL", "3600"))
+DISK_DIR = os.getenv("TTS_CACHE_DIR", "")
+DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class DiskTier:
+    """File-per-entry audio store with LRU eviction by access time."""
+
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Index existing files once at startup, oldest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Left over from a write interrupted by a crash
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".mp3"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self.bytes += size
+        self._evict()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._files:
+                self.misses += 1
+                return None
+            self._files.move_to_end(name)
+
+        # Read outside the lock so concurrent lookups don't serialize on disk I/O
+        path = self._path(name)
+        try:
+            expired = time.time() - os.path.getmtime(path) > self.ttl
+            if not expired:
+                with open(path, "rb") as f:
+                    data = f.read()
+                # Refresh the modification time so hot entries don't expire
+                os.utime(path)
+        except OSError:
+            expired, data = True, None
+
+        with self._lock:
+            if expired:
+                self._remove(name)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return data
+
+    def put(self, name, data):
+        if len(data) > self.max_bytes:
+            return
+        # Write to a temp file and rename so readers never see partial audio
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self.bytes -= self._files.pop(name, 0)
+            self._files[name] = len(data)
+            self.bytes += len(data)
+            self._evict()
+
+    def _remove(self, name):
+        self.bytes -= self._files.pop(name, 0)
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._files:
+            self._remove(next(iter(self._files)))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._files), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class AudioCache:
+    """Two-tier (memory, optional disk) cache of MP3 bytes keyed by voice and text."""
+
+    def __init__(self, memory_max_bytes, ttl, disk_dir="", disk_max_bytes=0):
+        # The byte budget is what bounds memory; the entry limit is only a backstop
+        self.memory = LRUCache(max_entries=100000, max_bytes=memory_max_bytes, ttl=ttl)
+        self.disk = DiskTier(disk_dir, disk_max_bytes, ttl) if disk_dir else None
+
+    @staticmethod
+    def key(voice, text, model="tts-1"):
+        # Whitespace differences don't change the speech, so they share audio
+        text = " ".join(text.split())
+        return hashlib.sha256(f"{model}:{voice}:{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            data = self.disk.get(f"{key}.mp3")
+            if data is not None:
+                # Promote hot disk entries back into memory
+                self.memory.put(key, data, len(data))
+        return data
+
+    def put(self, key, data):
+        self.memory.put(key, data, len(data))
+        if self.disk is not None:
+            self.disk.put(f"{key}.mp3", data)
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+tts_cache = AudioCache(MEMORY_MAX_BYTES, TTL_SECONDS, DISK_DIR, DISK_MAX_BYTES)
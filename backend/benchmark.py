@@ -0,0 +1,418 @@
+"""
+Offline load and latency benchmark for the backend.
+
+Starts stub_upstream.py in-process, launches the backend (Flask threading
+mode or the asyncio server) against it with ANTHROPIC_BASE_URL /
+OPENAI_BASE_URL pointing at the stub, and drives every endpoint at the
+configured concurrency. For each scenario it reports throughput and
+mean / p50 / p95 / p99 / max latency (plus time to first byte for the
+streaming endpoints). No real API calls are made.
+
+Payloads are unique per request by default so the server-side caches
+miss; --warm repeats one payload to measure the cached path instead.
+
+Examples:
+    python benchmark.py
+    python benchmark.py --server asyncio --concurrency 32 --requests 200
+    python benchmark.py --scenarios summarize,fill_form --llm-latency 1.5
+    python benchmark.py --json baseline.json
+    python benchmark.py --compare baseline.json --max-regression 0.2
+
+--compare exits with status 1 when a scenario's p95 latency grew, or its
+throughput dropped, by more than --max-regression against the baseline.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+import stub_upstream
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _noise_png(seed, size=64):
+    """A grayscale PNG of random noise, different (and hashing differently) per seed."""
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + bytes(rng.randrange(256) for _ in range(size)) for _ in range(size))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    png = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 0, 0, 0, 0))
+    png += chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+    return base64.b64encode(png).decode("ascii")
+
+
+TRANSCRIPTS = [
+    "summarize this page for me",
+    "read the selected text out loud",
+    "explain what this paragraph means",
+    "fill in this form with my details",
+    "scroll down to the pricing section",
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _text(chars, i, warm):
+    seed = "benchmark" if warm else f"benchmark request {i}"
+    sentence = f"This is {seed}, a paragraph about accessible browsing and voice assistants. "
+    return (sentence * (chars // len(sentence) + 1))[:chars]
+
+
+def _page_html(elements, i, warm):
+    suffix = "" if warm else f"-{i}"
+    items = "".join(
+        f'<li><a href="/item{n}{suffix}">Item {n}{suffix}</a> <button id="buy{n}">Buy item {n}</button></li>'
+        for n in range(elements)
+    )
+    return f"<html><body><nav><a href='/'>Home</a></nav><main><h1>Catalog{suffix}</h1><ul>{items}</ul></main></body></html>"
+
+
+def _form(fields, i, warm):
+    suffix = "" if warm else f"_{i}"
+    form = []
+    for n in range(fields):
+        if n % 4 == 3:
+            # Some unlabeled elements so the structuring call is exercised too
+            form.append({"type": "text", "label": "", "id": f"field{n}{suffix}", "name": "", "position": n})
+        else:
+            form.append({"type": "text", "label": f"Question {n}{suffix}", "id": f"field{n}{suffix}", "name": f"field{n}", "position": n})
+    return form
+
+
+def _post_json(client, path, payload):
+    response = client.post(path, json=payload)
+    response.raise_for_status()
+    return None
+
+
+def _post_stream(client, path, payload):
+    """POST and read the streamed body; returns the time to the first byte."""
+    started = time.perf_counter()
+    ttfb = None
+    with client.stream("POST", path, json=payload) as response:
+        response.raise_for_status()
+        for _ in response.iter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+    return ttfb
+
+
+def build_scenarios(args, base_url):
+    """Scenario name to a callable (client, request index) -> time to first byte or None."""
+    warm = args.warm
+
+    def transcript(client, i):
+        text = TRANSCRIPTS[i % len(TRANSCRIPTS)] + ("" if warm else f" please {i}")
+        return _post_json(client, "/transcript", {"transcript": text})
+
+    def summarize(client, i):
+        return _post_json(client, "/summarize", {"text": _text(args.text_chars, i, warm)})
+
+    def summarize_stream(client, i):
+        return _post_stream(client, "/summarize/stream", {"text": _text(args.text_chars, i, warm)})
+
+    def explain(client, i):
+        return _post_json(client, "/explain", {"text": _text(200, i, warm)})
+
+    def explain_image(client, i):
+        return _post_json(client, "/explain", {"image_data": "data:image/png;base64," + _noise_png(0 if warm else i)})
+
+    def fill_form(client, i):
+        return _post_json(client, "/fill-form", {
+            "form_data": _form(args.form_fields, i, warm),
+            "user_data": "My Personal Information:\n\n1. My name is Alex Doe\n2. My email is alex@example.com\n"
+        })
+
+    def navigation(client, i):
+        return _post_json(client, "/navigation-chrome", {
+            "html_content": _page_html(args.page_elements, i, warm),
+            "transcript": "click the buy button for item 3"
+        })
+
+    def tts(client, i):
+        return _post_json(client, "/text_to_speech", {"text": _text(args.tts_chars, i, warm), "voice": "alloy"})
+
+    def tts_stream(client, i):
+        return _post_stream(client, "/text_to_speech/stream", {"text": _text(args.tts_chars, i, warm), "voice": "alloy"})
+
+    def socketio_connect(client, i):
+        import socketio
+        sio = socketio.Client(reconnection=False)
+        try:
+            sio.connect(base_url, transports=[args.socketio_transport], wait_timeout=args.timeout)
+        finally:
+            # Only the connect is measured: over polling the client's disconnect
+            # can block for the 30 s long-poll timeout, so it runs in the background
+            threading.Thread(target=sio.disconnect, daemon=True).start()
+        return None
+
+    return {
+        "transcript": transcript,
+        "summarize": summarize,
+        "summarize_stream": summarize_stream,
+        "explain": explain,
+        "explain_image": explain_image,
+        "fill_form": fill_form,
+        "navigation": navigation,
+        "tts": tts,
+        "tts_stream": tts_stream,
+        "socketio": socketio_connect,
+    }
+
+
+def run_scenario(name, request, base_url, args):
+    """
+    Send args.requests requests at args.concurrency (after a short warm-up).
+
+    Returns:
+        dict: Counts, throughput and latency statistics in milliseconds
+    """
+    client = httpx.Client(
+        base_url=base_url,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    )
+    latencies = []
+    ttfbs = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            ttfb = request(client, i)
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if ttfb is not None:
+                ttfbs.append(ttfb)
+
+    def warm_up(i):
+        try:
+            request(client, -1 - i)
+        except Exception:
+            pass
+
+    # Warm-up requests (connections, lazy initialization) are not measured
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(warm_up, range(args.warmup)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+    client.close()
+
+    latencies.sort()
+    ttfbs.sort()
+    result = {
+        "requests": args.requests,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "concurrency": args.concurrency,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 0.50), 1),
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 1),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+        "max_ms": round(1000 * latencies[-1], 1) if latencies else 0.0,
+    }
+    if ttfbs:
+        result["ttfb_p50_ms"] = round(1000 * percentile(ttfbs, 0.50), 1)
+        result["ttfb_p95_ms"] = round(1000 * percentile(ttfbs, 0.95), 1)
+    if errors:
+        result["first_error"] = errors[0][:300]
+    return result
+
+
+def start_backend(args, stub_url):
+    """Launch the backend against the stub and wait until it answers."""
+    port = args.port or _free_port()
+    env = dict(
+        os.environ,
+        ANTHROPIC_API_KEY="benchmark",
+        OPENAI_API_KEY="benchmark",
+        ANTHROPIC_BASE_URL=stub_url,
+        OPENAI_BASE_URL=f"{stub_url}/v1",
+        PORT=str(port),
+        PYTHONUNBUFFERED="1"
+    )
+    if args.server == "asyncio":
+        command = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    else:
+        env["SERVER_MODE"] = "threading"
+        command = [sys.executable, "app.py"]
+
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    started = time.perf_counter()
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with status {process.returncode} (see --server-log)")
+        try:
+            if httpx.get(f"{base_url}/list-tools", timeout=1).status_code == 200:
+                return process, base_url, time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    stop_backend(process)
+    raise RuntimeError(f"Backend did not become ready within {args.startup_timeout}s")
+
+
+def stop_backend(process):
+    # The Flask reloader runs the app in a child process, so stop the whole group
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def compare(results, baseline, max_regression):
+    """
+    Returns:
+        list: Regression descriptions (empty when nothing regressed)
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or not result["ok"]:
+            continue
+        if before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if before["throughput_rps"] and result["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if result["errors"] > before.get("errors", 0):
+            regressions.append(f"{name}: errors {before.get('errors', 0)} -> {result['errors']}")
+    return regressions
+
+
+def print_table(results):
+    columns = ["ok", "errors", "throughput_rps", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "ttfb_p50_ms"]
+    headers = ["scenario", "ok", "err", "req/s", "mean", "p50", "p95", "p99", "max", "ttfb p50"]
+    rows = [[name] + [str(result.get(column, "")) for column in columns] for name, result in results.items()]
+    widths = [max(len(row[i]) for row in rows + [headers]) for i in range(len(headers))]
+    print("  ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+    for name, result in results.items():
+        if result.get("first_error"):
+            print(f"{name}: first error: {result['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load and latency benchmark (stubbed upstreams)")
+    parser.add_argument("--server", choices=["threading", "asyncio"], default="threading", help="Backend serving mode")
+    parser.add_argument("--url", help="Benchmark an already running backend instead of launching one")
+    parser.add_argument("--port", type=int, default=0, help="Port for the launched backend (default: a free port)")
+    parser.add_argument("--scenarios", default="all", help="Comma separated scenario names, or all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=4, help="Unmeasured requests per scenario first")
+    parser.add_argument("--warm", action="store_true", help="Repeat one payload (cache hits) instead of unique ones")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--text-chars", type=int, default=4000, help="Size of /summarize text")
+    parser.add_argument("--tts-chars", type=int, default=300, help="Size of text to speech input")
+    parser.add_argument("--form-fields", type=int, default=20, help="Fields per /fill-form request")
+    parser.add_argument("--page-elements", type=int, default=50, help="Items per /navigation-chrome page")
+    parser.add_argument("--socketio-transport", choices=["polling", "websocket"], default="polling")
+    parser.add_argument("--server-log", help="Write the backend's output to this file")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier --json run")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    stub_upstream.add_arguments(parser)
+    args = parser.parse_args()
+
+    stub_server, stub_url = stub_upstream.start(stub_upstream.config_from_args(args))
+    process = None
+    startup_seconds = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        process, base_url, startup_seconds = start_backend(args, stub_url)
+        print(f"Backend ({args.server}) ready at {base_url} in {startup_seconds:.2f}s; stub upstream at {stub_url}")
+
+    scenarios = build_scenarios(args, base_url)
+    names = list(scenarios) if args.scenarios == "all" else [name.strip() for name in args.scenarios.split(",")]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(scenarios)})")
+
+    results = {}
+    try:
+        for name in names:
+            print(f"Running {name}...", flush=True)
+            results[name] = run_scenario(name, scenarios[name], base_url, args)
+    finally:
+        if process is not None:
+            stop_backend(process)
+        stub_server.shutdown()
+
+    print()
+    print_table(results)
+    report = {
+        "server": args.server if not args.url else args.url,
+        "concurrency": args.concurrency,
+        "warm": args.warm,
+        "startup_seconds": round(startup_seconds, 3) if startup_seconds is not None else None,
+        "stub": {key: getattr(args, key) for key in ("llm_latency", "llm_jitter", "llm_response_chars",
+                                                     "llm_tokens_per_second", "tts_latency", "tts_bytes")},
+        "upstream_requests": dict(stub_server.RequestHandlerClass.config.requests),
+        "scenarios": results,
+    }
+    print(f"\nUpstream calls made: {report['upstream_requests']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Per-session and per-request cancellation handles.
+
+Replaces the single global tts_active flag. Each request registers a
+CancelToken under its client's session_id (and its own request_id);
+/stop_audio cancels only the tokens it targets. Cancelling a token runs
+its registered callbacks, which the gateway uses to close the in-flight
+upstream HTTP response, so the request is actually aborted and the
+worker thread is released.
+"""
+import threading
+import uuid
+
+
+class RequestCancelled(Exception):
+    """Raised inside a request whose cancel token was triggered."""
+
+
+class CancelToken:
+    def __init__(self, session_id=None, request_id=None):
+        self.session_id = session_id
+        self.request_id = request_id or uuid.uuid4().hex
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled(f"Request {self.request_id} was cancelled")
+
+    def add_callback(self, callback):
+        """Register a callback to run on cancel (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Aborting a connection that is already closing may raise
+                pass
+
+
+class CancellationRegistry:
+    """Tracks the live tokens by session and request id."""
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def register(self, session_id=None, request_id=None):
+        token = CancelToken(session_id, request_id)
+        with self._lock:
+            self._tokens[token.request_id] = token
+        return token
+
+    def unregister(self, token):
+        with self._lock:
+            if self._tokens.get(token.request_id) is token:
+                del self._tokens[token.request_id]
+
+    def cancel(self, session_id=None, request_id=None):
+        """
+        Cancel matching tokens.
+
+        A request_id targets one request, a session_id every request of that
+        session. With neither, only requests registered without a session are
+        cancelled, which keeps older clients working without letting them
+        interrupt clients that identify themselves.
+
+        Returns:
+            int: Number of requests cancelled
+        """
+        with self._lock:
+            if request_id:
+                matches = [token for token in self._tokens.values() if token.request_id == request_id]
+            elif session_id:
+                matches = [token for token in self._tokens.values() if token.session_id == session_id]
+            else:
+                matches = [token for token in self._tokens.values() if token.session_id is None]
+        for token in matches:
+            token.cancel()
+        return len(matches)
+
+
+tts_requests = CancellationRegistry()
@@ -0,0 +1,299 @@
+"""
+Reduce raw page HTML to a compact, indexed list of interactive elements.
+
+/navigation-chrome used to paste the whole page HTML (scripts, styles and
+all) into the prompt. This module parses the HTML with the standard
+library parser and keeps only what the model needs to pick a target:
+links, buttons, form controls, elements with an interactive ARIA role,
+landmarks and headings, each with its visible text, role and a stable
+CSS selector.
+"""
+import os
+import re
+from html.parser import HTMLParser
+
+MAX_ELEMENTS = int(os.getenv("NAV_MAX_ELEMENTS", "400"))
+MAX_TEXT_LENGTH = 80
+MAX_HREF_LENGTH = 100
+
+# Content of these elements is never shown to the user
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "canvas"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+             "param", "source", "track", "wbr"}
+
+INTERACTIVE_ROLES = {"button", "link", "checkbox", "radio", "tab", "menuitem", "option",
+                     "switch", "combobox", "textbox", "searchbox", "slider", "treeitem"}
+LANDMARK_TAGS = {"header": "banner", "nav": "navigation", "main": "main", "aside": "complementary",
+                 "footer": "contentinfo", "form": "form", "search": "search"}
+LANDMARK_ROLES = {"banner", "navigation", "main", "complementary", "contentinfo", "form",
+                  "search", "region", "dialog"}
+HEADING_TAGS = {"h1", "h2", "h3"}
+
+_CSS_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _clean(text, limit=MAX_TEXT_LENGTH):
+    text = _WHITESPACE_RE.sub(" ", text or "").strip()
+    if len(text) > limit:
+        text = text[:limit - 3].rstrip() + "..."
+    return text
+
+
+def _quote(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class _Node:
+    __slots__ = ("tag", "path", "child_counts")
+
+    def __init__(self, tag, path):
+        self.tag = tag
+        self.path = path
+        self.child_counts = {}
+
+
+class _DistillParser(HTMLParser):
+    def __init__(self, max_elements, root_path=""):
+        super().__init__(convert_charrefs=True)
+        self.max_elements = max_elements
+        self.stack = [_Node("#document", root_path)]
+        self.skip_depth = 0
+        self.elements = []
+        self.open_elements = []
+        self.labels = {}
+        self.open_labels = []
+        self.title = ""
+        self.in_title = False
+
+    # Element classification
+
+    def _role_for(self, tag, attrs):
+        role = (attrs.get("role") or "").strip().lower()
+        if role in INTERACTIVE_ROLES or role in LANDMARK_ROLES:
+            return role
+        if tag == "a" and attrs.get("href") is not None:
+            return "link"
+        if tag == "button" or (tag == "input" and attrs.get("type", "").lower() in ("button", "submit", "reset", "image")):
+            return "button"
+        if tag == "input":
+            input_type = attrs.get("type", "text").lower()
+            if input_type == "hidden":
+                return None
+            if input_type in ("checkbox", "radio"):
+                return input_type
+            return "textbox"
+        if tag == "textarea":
+            return "textbox"
+        if tag == "select":
+            return "combobox"
+        if tag == "summary":
+            return "button"
+        if tag in LANDMARK_TAGS:
+            return LANDMARK_TAGS[tag]
+        if tag in HEADING_TAGS:
+            return "heading"
+        if attrs.get("onclick") is not None or attrs.get("contenteditable") in ("", "true"):
+            return "button"
+        return None
+
+    def _selector_for(self, tag, attrs, path):
+        element_id = attrs.get("id")
+        if element_id and _CSS_IDENT_RE.match(element_id):
+            return f"#{element_id}"
+        if attrs.get("name") and tag in ("input", "select", "textarea", "button"):
+            return f'{tag}[name="{_quote(attrs["name"])}"]'
+        if attrs.get("aria-label"):
+            return f'{tag}[aria-label="{_quote(attrs["aria-label"])}"]'
+        if attrs.get("data-testid"):
+            return f'[data-testid="{_quote(attrs["data-testid"])}"]'
+        return path
+
+    # HTMLParser callbacks
+
+    def handle_starttag(self, tag, attr_list):
+        if self.skip_depth:
+            if tag in SKIPPED_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = 1
+            return
+
+        attrs = {name: (value if value is not None else "") for name, value in attr_list}
+        parent = self.stack[-1]
+        nth = parent.child_counts.get(tag, 0) + 1
+        parent.child_counts[tag] = nth
+        element_id = attrs.get("id")
+        if parent is self.stack[0] and parent.path:
+            # A fragment's top-level element is the region it replaces, so
+            # paths inside it continue the page's path to that region
+            path = parent.path
+        elif element_id and _CSS_IDENT_RE.match(element_id):
+            # Anchor descendant paths at the nearest element with an id
+            path = f"#{element_id}"
+        else:
+            step = tag if tag in ("html", "body") else f"{tag}:nth-of-type({nth})"
+            path = f"{parent.path} > {step}" if parent.path else step
+
+        if tag == "title":
+            self.in_title = True
+        if tag == "label":
+            self.open_labels.append([attrs.get("for"), []])
+
+        role = None if attrs.get("aria-hidden") == "true" else self._role_for(tag, attrs)
+        if role and len(self.elements) < self.max_elements:
+            element = {
+                "index": len(self.elements),
+                "tag": tag,
+                "role": role,
+                "selector": self._selector_for(tag, attrs, path),
+                "text": "",
+                "_id": attrs.get("id"),
+                "_parts": [],
+                # Paths of this element and its ancestors, used to find the
+                # elements inside a region when it is patched
+                "_scopes": tuple(node.path for node in self.stack[1:]) + (path,),
+            }
+            label = attrs.get("aria-label") or attrs.get("title") or attrs.get("alt")
+            if tag in ("input", "textarea", "select"):
+                label = label or attrs.get("placeholder") or attrs.get("name")
+                if attrs.get("type"):
+                    element["type"] = attrs["type"].lower()
+                if attrs.get("value") and element.get("type") in ("button", "submit", "reset"):
+                    label = label or attrs["value"]
+            if label:
+                element["text"] = _clean(label)
+            if role == "link" and attrs.get("href"):
+                element["href"] = _clean(attrs["href"], MAX_HREF_LENGTH)
+            self.elements.append(element)
+            if tag not in VOID_TAGS:
+                self.open_elements.append((tag, element))
+
+        if tag not in VOID_TAGS:
+            self.stack.append(_Node(tag, path))
+
+    def handle_startendtag(self, tag, attr_list):
+        if tag in SKIPPED_TAGS:
+            # A self-closing skipped element has no content to skip
+            return
+        self.handle_starttag(tag, attr_list)
+        if tag not in VOID_TAGS and not self.skip_depth:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            if tag in SKIPPED_TAGS:
+                self.skip_depth -= 1
+            return
+        if tag == "title":
+            self.in_title = False
+        if tag == "label" and self.open_labels:
+            target, parts = self.open_labels.pop()
+            if target:
+                self.labels[target] = _clean(" ".join(parts))
+
+        # Close the innermost open element with this tag (tolerates bad nesting)
+        for i in range(len(self.open_elements) - 1, -1, -1):
+            if self.open_elements[i][0] == tag:
+                _, element = self.open_elements.pop(i)
+                if not element["text"]:
+                    element["text"] = _clean(" ".join(element["_parts"]))
+                break
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                break
+
+    def handle_data(self, data):
+        if self.skip_depth or not data.strip():
+            return
+        if self.in_title:
+            self.title += data
+        for _, element in self.open_elements:
+            # Landmarks only keep a short prefix of their text as context
+            if len(element["_parts"]) < 20:
+                element["_parts"].append(data)
+        for _, parts in self.open_labels:
+            parts.append(data)
+
+
+def distill(html_content, max_elements=None, root_path=""):
+    """
+    Parse HTML into an indexed list of interactive elements.
+
+    Args:
+        html_content (str): Raw page HTML
+        max_elements (int): Cap on the number of elements returned
+        root_path (str): When distilling a fragment, the selector of the
+            region the fragment replaces
+
+    Returns:
+        dict: {"title": page title, "elements": [{"index", "tag", "role",
+        "text", "selector", optional "href"/"type"}]}
+    """
+    parser = _DistillParser(max_elements or MAX_ELEMENTS, root_path)
+    parser.feed(html_content)
+    parser.close()
+
+    for element in parser.elements:
+        if not element["text"]:
+            element["text"] = _clean(" ".join(element["_parts"]))
+        # <label for="..."> text wins over placeholders for form controls
+        if element["_id"] in parser.labels and element["tag"] in ("input", "select", "textarea"):
+            element["text"] = parser.labels[element["_id"]] or element["text"]
+        del element["_parts"]
+        del element["_id"]
+
+    return {"title": _clean(parser.title, 120), "elements": parser.elements}
+
+
+def replace_region(page, region, fragment_html):
+    """
+    Replace the elements inside a region with those distilled from its new HTML.
+
+    Args:
+        page (dict): A distilled page, as returned by distill
+        region (str): Selector of the changed region, as used in the page's
+            selectors (e.g. "#results" or "html > body > div:nth-of-type(2)")
+        fragment_html (str): The region's new outer HTML
+
+    Returns:
+        dict: A new distilled page with the elements re-indexed
+    """
+    fragment = distill(fragment_html, root_path=region)
+    kept = []
+    insert_at = None
+    for element in page["elements"]:
+        if region in element["_scopes"]:
+            if insert_at is None:
+                insert_at = len(kept)
+            continue
+        kept.append(element)
+    if insert_at is None:
+        insert_at = len(kept)
+
+    elements = kept[:insert_at] + fragment["elements"] + kept[insert_at:]
+    # Copy so that the cached page the elements came from is left untouched
+    elements = [dict(element, index=index) for index, element in enumerate(elements[:MAX_ELEMENTS])]
+    return {"title": page["title"], "elements": elements}
+
+
+def format_elements(page):
+    """
+    Render a distilled page as compact prompt text, one element per line:
+
+        [3] button "Sign in" sel=#login-btn
+    """
+    lines = []
+    if page.get("title"):
+        lines.append(f"Page title: {page['title']}")
+    for element in page["elements"]:
+        role = element["role"]
+        if element.get("type") and role == "textbox":
+            role = f"textbox[{element['type']}]"
+        line = f"[{element['index']}] {role} \"{element['text']}\" sel={element['selector']}"
+        if element.get("href"):
+            line += f" href={element['href']}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,140 @@
+"""
+Cache of /explain results.
+
+Users ask for explanations of the same selections again and again
+(common terms, the same chart, the same banner), and every request is a
+slow claude-3-opus call. Explanations are cached under:
+
+- text: the selection with Unicode and whitespace normalized
+- images: the SHA-256 digest of the image bytes
+
+An image that misses can still reuse the explanation of a recently cached
+near-duplicate (the same picture captured at another size or re-encoded):
+its dHash must be within EXPLAIN_CACHE_IMAGE_DISTANCE bits of the cached
+one, and its thumbnail must match pixel by pixel within
+image_pipeline.PIXEL_TOLERANCE. The dHash alone is not enough, since
+screenshots of different text in the same layout hash identically. A
+negative distance turns near-duplicate matching off.
+
+Keys include a version derived from the model and prompts, so changing
+either invalidates old entries. Bounded by entry count, bytes and TTL.
+"""
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict, namedtuple
+
+import explainer
+import image_pipeline
+from response_cache import LRUCache
+
+CACHE_ENABLED = os.getenv("EXPLAIN_CACHE_ENABLED", "true").lower() != "false"
+MAX_ENTRIES = int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", "2048"))
+MAX_BYTES = int(os.getenv("EXPLAIN_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("EXPLAIN_CACHE_TTL", str(24 * 3600)))
+# Max differing dHash bits (of 256) for a near-duplicate candidate; negative disables
+IMAGE_DISTANCE = int(os.getenv("EXPLAIN_CACHE_IMAGE_DISTANCE", "0"))
+# Recently cached images kept (with their thumbnails) for near-duplicate lookups
+NEAR_DUPLICATE_CANDIDATES = 128
+
+PROMPT_VERSION = hashlib.sha256(
+    "\0".join([explainer.EXPLAIN_MODEL, explainer.TEXT_PROMPT, explainer.IMAGE_PROMPT]).encode("utf-8")
+).hexdigest()[:12]
+
+
+# Cache key of an image with what near-duplicate lookups compare
+ImageKey = namedtuple("ImageKey", ["key", "dhash", "thumbnail"])
+
+
+def normalize_text(text):
+    """NFKC-normalize and collapse whitespace so re-selections of the same text match."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class ExplanationCache:
+    """LRU of explanations keyed by normalized text or image digest."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        # Recently cached image keys -> (dHash, thumbnail), for near-duplicate lookups
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self.near_hits = 0
+
+    def key(self, data):
+        """
+        Cache key for an /explain payload: a string for text, an ImageKey
+        for images.
+
+        Raises:
+            ValueError: If the image data can't be decoded
+        """
+        if data.get('text'):
+            text = normalize_text(data['text'])
+            digest = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+            return f"{PROMPT_VERSION}:text:{digest}"
+        image = image_pipeline.prepare(data['image_data'])
+        # Without Pillow there is no dHash or thumbnail, and only identical images match
+        return ImageKey(f"{PROMPT_VERSION}:image:{image.digest}", image.dhash, image.thumbnail)
+
+    def _near_duplicate_key(self, key):
+        """The key of a cached image showing the same picture as key, if any."""
+        with self._lock:
+            candidates = list(self._images.items())
+        matches = []
+        for cached_key, (cached_hash, cached_thumbnail) in candidates:
+            distance = image_pipeline.hamming_distance(key.dhash, cached_hash)
+            if distance <= IMAGE_DISTANCE:
+                matches.append((distance, cached_key, cached_thumbnail))
+        for _, cached_key, cached_thumbnail in sorted(matches, key=lambda match: match[0]):
+            if image_pipeline.pixel_difference(key.thumbnail, cached_thumbnail) <= image_pipeline.PIXEL_TOLERANCE:
+                return cached_key
+        return None
+
+    def get(self, key):
+        """Return the cached explanation for key, or None."""
+        if not CACHE_ENABLED or key is None:
+            return None
+        if not isinstance(key, ImageKey):
+            return self.cache.get(key)
+        explanation = self.cache.get(key.key)
+        if explanation is not None or IMAGE_DISTANCE < 0 or key.thumbnail is None:
+            return explanation
+
+        near_key = self._near_duplicate_key(key)
+        if near_key is None:
+            return None
+        explanation = self.cache.get(near_key)
+        if explanation is None:
+            # Expired or evicted
+            with self._lock:
+                self._images.pop(near_key, None)
+            return None
+        with self._lock:
+            self.near_hits += 1
+        return explanation
+
+    def put(self, key, explanation):
+        if not CACHE_ENABLED or key is None:
+            return
+        size = len(explanation.encode("utf-8", "surrogatepass"))
+        if not isinstance(key, ImageKey):
+            self.cache.put(key, explanation, size)
+            return
+        self.cache.put(key.key, explanation, size)
+        if key.thumbnail is not None:
+            with self._lock:
+                self._images[key.key] = (key.dhash, key.thumbnail)
+                self._images.move_to_end(key.key)
+                while len(self._images) > NEAR_DUPLICATE_CANDIDATES:
+                    self._images.popitem(last=False)
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self._lock:
+            stats["near_duplicate_hits"] = self.near_hits
+        return stats
+
+
+explanation_cache = ExplanationCache()
@@ -0,0 +1,63 @@
+"""
+Request building for /explain.
+
+Turns an /explain payload (selected text or a base64 image) into
+Messages API arguments. Shared by the Flask app and the asyncio server.
+Images go through image_pipeline first, which sniffs the real format
+and downscales and recompresses them to the model's budget.
+"""
+import image_pipeline
+
+EXPLAIN_MODEL = "claude-3-opus-20240229"
+
+TEXT_PROMPT = "Please explain the following text in simple, straightforward language. Use short sentences, avoid jargon, and focus on making the content accessible to everyone including neurodivergent individuals and non-native speakers. Keep the explanation very brief and to the point (2-3 short paragraphs maximum):\n\n{text}"
+
+IMAGE_PROMPT = "Please explain what you see in this image in simple, straightforward language. Use short sentences, avoid jargon, and focus on making the description accessible to everyone including neurodivergent individuals and non-native speakers. Keep the explanation very brief (2-3 short paragraphs maximum)."
+
+
+def explanation_request(data):
+    """
+    Build the Messages API arguments for an /explain payload.
+
+    Text takes precedence over image_data when both are present.
+
+    Args:
+        data (dict): Request JSON with "text" or "image_data"
+
+    Returns:
+        dict: Keyword arguments for create_message
+    """
+    if data.get('text'):
+        content = [
+            {
+                "type": "text",
+                "text": TEXT_PROMPT.format(text=data['text'])
+            }
+        ]
+    else:
+        image = image_pipeline.prepare(data['image_data'])
+        content = [
+            {
+                "type": "text",
+                "text": IMAGE_PROMPT
+            },
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": image.media_type,
+                    "data": image.data
+                }
+            }
+        ]
+
+    return {
+        "model": EXPLAIN_MODEL,
+        "max_tokens": 1000,
+        "messages": [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+    }
@@ -0,0 +1,151 @@
+"""
+Cache of structured forms keyed by a fingerprint of the form's schema.
+
+The same forms (job applications, sign-ups, checkouts) are filled again
+and again, so the structured form (question, possible_answers, html_id
+per field) is stored under a SHA-256 fingerprint of every element's id,
+name, type, label and option set. A later fill of the same form skips
+structuring and goes straight to answer generation.
+
+The extension gives radio groups and unnamed inputs ids with a random
+suffix, so those suffixes are left out of the fingerprint and cached
+fields are re-pointed at the current element ids on every hit.
+
+Entries are evicted LRU with a TTL. When FORM_CACHE_PATH is set every
+new entry is also appended to that JSONL file, which is reloaded (and
+compacted) at startup so the cache survives restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from response_cache import LRUCache
+
+MAX_ENTRIES = int(os.getenv("FORM_CACHE_MAX_ENTRIES", "512"))
+TTL_SECONDS = float(os.getenv("FORM_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_PATH = os.getenv("FORM_CACHE_PATH", "")
+
+# Ids generated by content.js end in a random Math.random() suffix
+_GENERATED_ID_RE = re.compile(r'^((?:aria_)?radio_group_.*|custom_group_\d+|element_\d+)_[a-z0-9]{1,9}$')
+
+
+def _stable_id(element_id):
+    match = _GENERATED_ID_RE.match(element_id or "")
+    return match.group(1) if match else (element_id or "")
+
+
+def _element_ref(element):
+    """The id the answers are matched on (see structure_request)."""
+    return element.get('id') or element.get('name') or ""
+
+
+def fingerprint(form_data):
+    """Hash the schema of a form: ids, names, types, labels and option sets."""
+    schema = []
+    for element in form_data:
+        options = sorted(
+            (str(value.get('value', '')), str(value.get('text', '')))
+            for value in element.get('possibleValues') or []
+        )
+        schema.append([
+            _stable_id(element.get('id')),
+            element.get('name') or "",
+            element.get('type') or "",
+            " ".join(str(element.get('label') or "").split()),
+            options
+        ])
+    payload = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class FormStructureCache:
+    """LRU of structured forms with optional JSONL persistence."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, path=CACHE_PATH):
+        # Forms are small; the entry limit is what bounds this cache
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=64 * 1024 * 1024, ttl=ttl)
+        self.path = path
+        self._file_lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _load(self):
+        """Replay the JSONL file (last write wins), then rewrite it compacted."""
+        entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        entries[entry["key"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        # A line cut short by a crash
+                        continue
+        except OSError:
+            return
+
+        now = time.time()
+        live = [entry for entry in entries.values() if now - entry.get("stored_at", 0) <= self.cache.ttl]
+        live.sort(key=lambda entry: entry.get("stored_at", 0))
+        for entry in live[-self.cache.max_entries:]:
+            fields = entry["fields"]
+            self.cache.put(entry["key"], fields, len(json.dumps(fields)), stored_at=entry["stored_at"])
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in live[-self.cache.max_entries:]:
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _append(self, key, fields, stored_at):
+        line = json.dumps({"key": key, "fields": fields, "stored_at": stored_at}) + "\n"
+        with self._file_lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass
+
+    def get(self, form_data):
+        """
+        Return the cached structured form for form_data, with html_ids
+        pointing at the current elements, or None on a miss.
+        """
+        fields = self.cache.get(fingerprint(form_data))
+        if fields is None:
+            return None
+        structured = []
+        for index, field in fields:
+            field = dict(field)
+            if index is not None and index < len(form_data):
+                field['html_id'] = _element_ref(form_data[index])
+            structured.append(field)
+        return structured
+
+    def put(self, form_data, structured_form):
+        """Store a complete structured form for form_data."""
+        refs = {}
+        for index, element in enumerate(form_data):
+            for ref in (element.get('id'), element.get('name')):
+                if ref:
+                    refs.setdefault(ref, index)
+        # Remember which element each field belongs to so ids can be remapped
+        fields = [(refs.get(field.get('html_id')), field) for field in structured_form]
+
+        key = fingerprint(form_data)
+        stored_at = time.time()
+        self.cache.put(key, fields, len(json.dumps(fields)), stored_at=stored_at)
+        if self.path:
+            self._append(key, fields, stored_at)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+structure_cache = FormStructureCache()
@@ -0,0 +1,376 @@
+"""
+Prompt building and the structured outputs for /fill-form.
+
+Filling a form takes two calls: one structures the raw form elements
+into questions with possible answers, the second answers them from the
+user's knowledge base. Shared by the Flask app and the asyncio server.
+
+Most elements already arrive with a clear label, an id or name and
+their options, so structure_locally turns those into fields directly.
+Only ambiguous elements (no usable label or id, duplicate labels,
+unknown input types) are sent to the structuring call, which is skipped
+entirely when there are none.
+
+Large forms are processed in batches of FORM_BATCH_SIZE fields: each
+batch is a separate call with its own output budget, the batches run
+concurrently on a bounded pool (or asyncio.gather), and the answers are
+merged by html_id. Fill time follows the largest batch instead of the
+whole form, and a long form no longer overflows max_tokens.
+
+Both calls return their result through a forced tool (STRUCTURE_OUTPUT,
+ANSWERS_OUTPUT), parsed and repaired by structured_output.py. Their
+instructions are static and sent as a cacheable system prompt ahead of
+the per-form content (see prompt_cache.py).
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import prompt_cache
+from structured_output import OutputSpec
+
+FORM_MODEL = "claude-3-sonnet-20240229"
+
+STRUCTURE_SYSTEM_PROMPT = "You are a helpful assistant that structures form data into a standard format. You always follow instructions exactly and record the result with the record_form_structure tool."
+
+ANSWER_SYSTEM_PROMPT = "You are a helpful assistant that fills in forms based on user data. You are accurate, concise, and follow instructions precisely."
+
+# Identical for every form, so they come first and are cached upstream
+STRUCTURE_INSTRUCTIONS = """Structure the form elements in the user's message into a standard format.
+For each element, provide the question, possible answers, and the html_id.
+
+IMPORTANT INSTRUCTIONS:
+1. Make sure to create an entry for EVERY form element provided, don't skip any.
+2. If no possible values are provided, use common sense to suggest appropriate values.
+3. For text fields, suggest appropriate formats or examples.
+4. If the label is unclear, try to determine the likely question based on context.
+5. Use the ID or name as the html_id, keeping it exactly as provided.
+6. For elements with the same label, use the position and surrounding context to differentiate them.
+
+--- OUTPUT FORMAT ---
+Call record_form_structure with one field (question, possible_answers, html_id) for each form element.
+
+Make sure to:
+1. Parse ALL form elements
+2. Record one entry per element, in element order
+3. For duplicate fields (same label), create a unique question by adding context or numbering
+"""
+
+ANSWER_INSTRUCTIONS = """Based on the user's personal information, generate appropriate answers for the form fields in the user's message.
+If the user data doesn't contain relevant information for a field, make a reasonable guess based on the context.
+
+--- OUTPUT INSTRUCTIONS ---
+Call record_form_answers with an answer (html_id, answer) for each field.
+
+IMPORTANT:
+1. If a field has possible answers, choose the most appropriate one from the list.
+2. For text fields, provide a valid response based on user data or make a reasonable guess.
+3. Make sure to provide an answer for EVERY field, don't skip any.
+4. If you're unsure about a field, make your best guess based on the context.
+5. Keep your answers realistic and appropriate.
+"""
+
+STRUCTURE_OUTPUT = OutputSpec(
+    "record_form_structure",
+    "Record the structured form: one entry per form element, in element order.",
+    {
+        "type": "object",
+        "properties": {
+            "fields": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question": {"type": "string", "description": "The question or field label (make this user-friendly and clear)"},
+                        "possible_answers": {"type": "array", "items": {"type": "string"}, "description": "Possible answers or appropriate formats"},
+                        "html_id": {"type": "string", "description": "The exact HTML ID or name to identify the field (use id, or if empty, use name)"}
+                    },
+                    "required": ["question", "possible_answers", "html_id"]
+                }
+            }
+        },
+        "required": ["fields"]
+    },
+    unwrap="fields",
+    stage="structure"
+)
+
+ANSWERS_OUTPUT = OutputSpec(
+    "record_form_answers",
+    "Record the answer for every form field.",
+    {
+        "type": "object",
+        "properties": {
+            "answers": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "html_id": {"type": "string", "description": "The HTML ID of the field (from the input)"},
+                        "answer": {"type": "string", "description": "The appropriate answer based on user data"}
+                    },
+                    "required": ["html_id", "answer"]
+                }
+            }
+        },
+        "required": ["answers"]
+    },
+    unwrap="answers",
+    stage="answer"
+)
+
+# Fields (or ambiguous elements) per structuring / answering call
+BATCH_SIZE = int(os.getenv("FORM_BATCH_SIZE", "15"))
+MAX_WORKERS = int(os.getenv("FORM_MAX_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="form-batch")
+
+LOCAL_STRUCTURE_ENABLED = os.getenv("FORM_LOCAL_STRUCTURE", "true").lower() != "false"
+
+# Labels longer than this are usually surrounding text, not a question
+MAX_LABEL_CHARS = 120
+
+# Free-text inputs: the format hint used as the possible answer
+TEXT_INPUT_FORMATS = {
+    "text": "Free text",
+    "textarea": "Free text",
+    "search": "Free text",
+    "email": "Email address (e.g. name@example.com)",
+    "tel": "Phone number (e.g. +1 555 123 4567)",
+    "url": "URL (e.g. https://example.com)",
+    "number": "A number",
+    "date": "Date (YYYY-MM-DD)",
+    "datetime-local": "Date and time (YYYY-MM-DDTHH:MM)",
+    "time": "Time (HH:MM)",
+    "month": "Month (YYYY-MM)",
+    "week": "Week (YYYY-W##)",
+    "password": "Password",
+}
+
+# Element types whose options are listed in possibleValues
+CHOICE_TYPES = {"select", "select-one", "select-multiple", "radio_group", "radio-group"}
+
+# The extension checks a checkbox for exactly these answers
+CHECKBOX_ANSWERS = ["yes", "no"]
+
+# The extension's label for free-text inputs and generated fallback labels
+_TEXT_INPUT_PLACEHOLDER = "Text input - any value possible"
+_GENERIC_LABEL_RE = re.compile(r'^(unlabeled field|[\w-]+ field \d+)$', re.IGNORECASE)
+_PLACEHOLDER_OPTION_RE = re.compile(r'^(-+|select\b.*|choose\b.*|please select\b.*|--.*--)$', re.IGNORECASE)
+
+
+def structure_request(form_data):
+    """Build the Messages API arguments for structuring the form elements."""
+    # Prepare the prompt; the instructions are in the system prompt
+    prompt = "Form elements to structure:\n"
+
+    # Add form elements details with better formatting
+    for i, element in enumerate(form_data):
+        prompt += f"\n--- ELEMENT {i+1} ---\n"
+        prompt += f"Type: {element.get('type', 'text')}\n"
+        prompt += f"Label: {element.get('label', 'Unlabeled field')}\n"
+        prompt += f"ID: {element.get('id', '')}\n"
+        prompt += f"Name: {element.get('name', '')}\n"
+        prompt += f"Position: {element.get('position', i)}\n"
+
+        # Include path and context if available
+        if element.get('positionPath'):
+            prompt += f"Position path: {element.get('positionPath')}\n"
+
+        if element.get('surroundingContext'):
+            prompt += f"Surrounding context: {element.get('surroundingContext')}\n"
+
+        if element.get('possibleValues') and len(element.get('possibleValues')) > 0:
+            prompt += "Possible values:\n"
+            for value in element.get('possibleValues'):
+                prompt += f"- {value.get('text', '')} (value: {value.get('value', '')})\n"
+
+    return {
+        "model": FORM_MODEL,
+        "max_tokens": 1500,
+        "temperature": 0.2,  # Lower temperature for more deterministic output
+        "system": prompt_cache.system(f"{STRUCTURE_SYSTEM_PROMPT}\n\n{STRUCTURE_INSTRUCTIONS}"),
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+
+
+def answers_request(structured_form, user_data):
+    """Build the Messages API arguments for answering the structured fields."""
+    # Prepare the prompt; the instructions are in the system prompt
+    prompt = "USER'S PERSONAL INFORMATION:\n"
+    prompt += user_data if user_data else "No personal information provided."
+
+    prompt += "\n\nFORM FIELDS TO FILL:\n"
+
+    # Add form fields
+    for i, field in enumerate(structured_form):
+        prompt += f"\n--- FIELD {i+1} ---\n"
+        prompt += f"Question: {field.get('question', 'Unlabeled field')}\n"
+
+        if field.get('possible_answers') and len(field.get('possible_answers')) > 0:
+            prompt += "Possible answers:\n"
+            for answer in field.get('possible_answers'):
+                prompt += f"- {answer}\n"
+
+        prompt += f"HTML ID: {field.get('html_id', '')}\n"
+
+    return {
+        "model": FORM_MODEL,
+        "max_tokens": 1500,
+        "temperature": 0.2,  # Lower temperature for more deterministic output
+        "system": prompt_cache.system(f"{ANSWER_SYSTEM_PROMPT}\n\n{ANSWER_INSTRUCTIONS}"),
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+
+
+def _clean_label(label):
+    label = " ".join(str(label or "").split())
+    return label.rstrip(" :*").strip()
+
+
+def _choice_answers(element):
+    """Option texts of a choice element, without "Select..." placeholders."""
+    answers = []
+    for value in element.get('possibleValues') or []:
+        text = " ".join(str(value.get('text') or value.get('value') or '').split())
+        if not text or _PLACEHOLDER_OPTION_RE.match(text) or text in answers:
+            continue
+        answers.append(text)
+    return answers
+
+
+def structure_element(element, duplicate_labels=()):
+    """
+    Structure one form element without the model.
+
+    Returns:
+        dict: {question, possible_answers, html_id}, or None if the element
+        is ambiguous and needs the model
+    """
+    html_id = element.get('id') or element.get('name')
+    label = _clean_label(element.get('label'))
+    if not html_id or not label or _GENERIC_LABEL_RE.match(label):
+        return None
+    if len(label) > MAX_LABEL_CHARS or label.lower() in duplicate_labels:
+        return None
+
+    element_type = str(element.get('type') or 'text').lower()
+    values = element.get('possibleValues') or []
+    if element_type == "checkbox":
+        possible_answers = list(CHECKBOX_ANSWERS)
+    elif element_type in CHOICE_TYPES:
+        possible_answers = _choice_answers(element)
+        if not possible_answers:
+            return None
+    elif element_type in TEXT_INPUT_FORMATS:
+        if any(value.get('text') not in (None, '', _TEXT_INPUT_PLACEHOLDER) for value in values):
+            # A free-text type with real options (e.g. a datalist); let the model decide
+            return None
+        possible_answers = [TEXT_INPUT_FORMATS[element_type]]
+    else:
+        return None
+
+    return {
+        "question": label,
+        "possible_answers": possible_answers,
+        "html_id": html_id
+    }
+
+
+def structure_locally(form_data):
+    """
+    Structure every unambiguous element locally.
+
+    Returns:
+        tuple: (fields in element order with None for ambiguous elements,
+        indexes of the ambiguous elements)
+    """
+    if not LOCAL_STRUCTURE_ENABLED:
+        return [None] * len(form_data), list(range(len(form_data)))
+
+    counts = {}
+    for element in form_data:
+        label = _clean_label(element.get('label')).lower()
+        counts[label] = counts.get(label, 0) + 1
+    duplicate_labels = {label for label, count in counts.items() if count > 1}
+
+    fields = [structure_element(element, duplicate_labels) for element in form_data]
+    ambiguous = [i for i, field in enumerate(fields) if field is None]
+    return fields, ambiguous
+
+
+def merge_structured(fields, batches):
+    """
+    Combine locally structured fields with the model's fields for the
+    ambiguous elements.
+
+    Args:
+        fields (list): structure_locally's fields, None where ambiguous
+        batches (list): (element indexes, model fields) per structuring
+            call; model fields are None if the call failed
+
+    If the model returned one field per element of a batch they keep their
+    original position, otherwise they follow the other fields. Elements of
+    a failed batch are dropped.
+    """
+    merged = list(fields)
+    extra_fields = []
+    for indexes, model_fields in batches:
+        if not model_fields:
+            continue
+        if len(model_fields) != len(indexes):
+            extra_fields.extend(model_fields)
+            continue
+        for index, field in zip(indexes, model_fields):
+            merged[index] = field
+    return [field for field in merged if field is not None] + extra_fields
+
+
+def batches(items, size=BATCH_SIZE):
+    """Split items into consecutive lists of at most size items."""
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def submit_batches(fn, item_batches):
+    """Run fn(batch) for every batch on the form pool; returns the futures in batch order."""
+    return [metrics.submit(_executor, fn, batch) for batch in item_batches]
+
+
+def merge_answers(structured_form, answer_batches):
+    """
+    Merge the answers of every batch by html_id, in the form's field
+    order. The first answer for an html_id wins; answers for ids not in
+    the form follow the others.
+    """
+    by_id = {}
+    extra_answers = []
+    for answers in answer_batches:
+        for answer in answers or []:
+            if not isinstance(answer, dict):
+                continue
+            html_id = answer.get('html_id')
+            if html_id in by_id:
+                continue
+            if html_id is None:
+                extra_answers.append(answer)
+            else:
+                by_id[html_id] = answer
+
+    merged = []
+    for field in structured_form:
+        answer = by_id.pop(field.get('html_id'), None)
+        if answer is not None:
+            merged.append(answer)
+    return merged + list(by_id.values()) + extra_answers
@@ -0,0 +1,229 @@
+"""
+Image preprocessing for /explain.
+
+The extension sends whatever it captured, often a full-resolution PNG
+screenshot, and the media type in the data URL is not always right.
+prepare() decodes the image once, sniffs the real format from its magic
+bytes, and (with Pillow installed) downscales it to the pixel budget the
+model actually uses and recompresses it under a byte budget: PNG when
+that fits, otherwise JPEG at decreasing quality. Images already within
+budget are passed through untouched.
+
+Each prepared image carries a SHA-256 digest of the decoded bytes, a
+256-bit difference hash (dHash) and a small grayscale thumbnail. The
+dHash only captures the coarse layout: screenshots of different text in
+the same layout often hash identically, so it can only shortlist
+candidates. pixel_difference() compares the thumbnails, which do tell
+such screenshots apart while a rescaled or re-encoded copy of the same
+capture stays within PIXEL_TOLERANCE.
+
+Prepared images are kept in a small LRU keyed by digest, so the same
+capture sent again is not decoded and resized twice.
+
+Without Pillow, images are only sniffed and passed through, and there is
+no perceptual hash or thumbnail.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+from collections import namedtuple
+
+from response_cache import LRUCache
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+
+# Anthropic downscales images beyond ~1568px / ~1.15 megapixels anyway
+MAX_EDGE = int(os.getenv("EXPLAIN_IMAGE_MAX_EDGE", "1568"))
+MAX_PIXELS = int(os.getenv("EXPLAIN_IMAGE_MAX_PIXELS", "1150000"))
+MAX_BYTES = int(os.getenv("EXPLAIN_IMAGE_MAX_BYTES", "1000000"))
+JPEG_QUALITY = int(os.getenv("EXPLAIN_IMAGE_JPEG_QUALITY", "85"))
+MIN_JPEG_QUALITY = 50
+
+# Thumbnails for pixel_difference(): long edge in pixels, and the largest
+# per-pixel difference (0-255) between two captures of the same picture
+THUMBNAIL_EDGE = 256
+PIXEL_TOLERANCE = 32
+
+# Formats the Messages API accepts, by magic bytes
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+PreparedImage = namedtuple(
+    "PreparedImage",
+    ["media_type", "data", "width", "height", "digest", "dhash", "thumbnail", "original_bytes", "bytes"]
+)
+
+_prepared = LRUCache(max_entries=64, max_bytes=64 * 1024 * 1024, ttl=3600)
+
+
+def sniff_media_type(raw):
+    """Return the media type of the image bytes, or None if not a supported format."""
+    for signature, media_type in SIGNATURES:
+        if raw.startswith(signature):
+            return media_type
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def decode_base64(image_data):
+    """
+    Decode a base64 image, with or without a data URL prefix.
+
+    Raises:
+        ValueError: If the data is not valid base64
+    """
+    if ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    try:
+        return base64.b64decode("".join(image_data.split()), validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+
+
+def dhash(image, size=16):
+    """Difference hash of a Pillow image (size * size bits) as hex digits."""
+    gray = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:0{size * size // 4}x}"
+
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two dHashes."""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def thumbnail(image):
+    """Grayscale copy of a Pillow image within THUMBNAIL_EDGE pixels, for pixel_difference()."""
+    gray = image.convert("L")
+    gray.thumbnail((THUMBNAIL_EDGE, THUMBNAIL_EDGE), Image.LANCZOS)
+    return gray
+
+
+def pixel_difference(thumbnail_a, thumbnail_b):
+    """
+    Largest per-pixel difference (0-255) between two thumbnails.
+
+    Thumbnails of different aspect ratios are different pictures (255).
+    """
+    (width_a, height_a), (width_b, height_b) = thumbnail_a.size, thumbnail_b.size
+    if abs(width_a - width_b) > 1 or abs(height_a - height_b) > 1:
+        return 255
+    if thumbnail_b.size != thumbnail_a.size:
+        thumbnail_b = thumbnail_b.resize(thumbnail_a.size, Image.LANCZOS)
+    return ImageChops.difference(thumbnail_a, thumbnail_b).getextrema()[1]
+
+
+def _fit(width, height, max_edge=MAX_EDGE, max_pixels=MAX_PIXELS):
+    """The largest size within both budgets keeping the aspect ratio."""
+    scale = min(1.0, max_edge / max(width, height), (max_pixels / (width * height)) ** 0.5)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _encode(image, media_type, quality=JPEG_QUALITY):
+    buffer = io.BytesIO()
+    if media_type == "image/jpeg":
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _recompress(image):
+    """
+    Encode a resized image under MAX_BYTES.
+
+    PNG (lossless, good for flat UI screenshots) is used when it fits,
+    otherwise JPEG at decreasing quality, then smaller sizes.
+
+    Returns:
+        tuple: (media type, encoded bytes, image)
+    """
+    if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+        image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+    while True:
+        media_type, encoded = "image/png", _encode(image, "image/png")
+        if len(encoded) <= MAX_BYTES:
+            break
+        if not _has_alpha(image):
+            for quality in range(JPEG_QUALITY, MIN_JPEG_QUALITY - 1, -10):
+                media_type, encoded = "image/jpeg", _encode(image, "image/jpeg", quality)
+                if len(encoded) <= MAX_BYTES:
+                    return media_type, encoded, image
+        if min(image.size) <= 64:
+            # Best effort; the API still accepts images over the budget
+            break
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+    return media_type, encoded, image
+
+
+def _process(raw, digest):
+    media_type = sniff_media_type(raw)
+    if Image is None:
+        if media_type is None:
+            raise ValueError("Unsupported image format")
+        return PreparedImage(media_type, base64.b64encode(raw).decode("ascii"), None, None,
+                             digest, None, None, len(raw), len(raw))
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        # Animated GIFs are explained from their first frame
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Could not decode image: {e}")
+    image = ImageOps.exif_transpose(image)
+    image_hash = dhash(image)
+    image_thumbnail = thumbnail(image)
+    width, height = image.size
+    target = _fit(width, height)
+
+    if media_type is not None and target == (width, height) and len(raw) <= MAX_BYTES:
+        return PreparedImage(media_type, base64.b64encode(raw).decode("ascii"), width, height,
+                             digest, image_hash, image_thumbnail, len(raw), len(raw))
+
+    if target != (width, height):
+        image = image.resize(target, Image.LANCZOS)
+    media_type, encoded, image = _recompress(image)
+    return PreparedImage(media_type, base64.b64encode(encoded).decode("ascii"), image.width, image.height,
+                         digest, image_hash, image_thumbnail, len(raw), len(encoded))
+
+
+def prepare(image_data):
+    """
+    Decode, sniff, downscale and recompress a base64 image for the model.
+
+    Args:
+        image_data (str): Base64 image, optionally a data URL
+
+    Returns:
+        PreparedImage: The image to send with its digest, dHash and thumbnail
+
+    Raises:
+        ValueError: If the data is not a decodable image
+    """
+    raw = decode_base64(image_data)
+    digest = hashlib.sha256(raw).hexdigest()
+    prepared = _prepared.get(digest)
+    if prepared is None:
+        prepared = _process(raw, digest)
+        _prepared.put(digest, prepared, len(prepared.data))
+    return prepared
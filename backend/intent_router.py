@@ -0,0 +1,242 @@
+"""
+Local fast-path intent router for /transcript.
+
+Most voice commands ("summarize this page", "translate this", "fill the
+form") are trivially routable, so they are resolved here without a
+network call:
+
+1. Keyword/pattern rules with a fixed confidence per rule.
+2. A small multinomial naive Bayes classifier over word uni/bigrams,
+   trained on the seed examples below plus any logged transcripts
+   (one JSON object per line: {"transcript": ..., "tool": ...}).
+
+Transcripts routed by the LLM are learned right away and appended to the
+log, which is replayed when the classifier is first used after a restart.
+The log is rotated to INTENT_ROUTER_LOG_PATH + ".1" every
+INTENT_ROUTER_LOG_MAX_EXAMPLES lines, so at most twice that many
+examples are kept.
+
+Only decisions at or above the confidence threshold are returned; the
+caller falls back to the LLM selector for everything else.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, namedtuple
+
+ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() != "false"
+CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.85"))
+# JSONL file of {"transcript", "tool"} pairs used for training; LLM-routed
+# transcripts are appended to it so the classifier improves over time
+TRAINING_LOG_PATH = os.getenv("INTENT_ROUTER_LOG_PATH", "")
+MAX_LOGGED_EXAMPLES = int(os.getenv("INTENT_ROUTER_LOG_MAX_EXAMPLES", "5000"))
+
+RouteDecision = namedtuple("RouteDecision", ["tool", "confidence", "path"])
+
+# (tool, pattern, confidence)
+RULES = [
+    ("summarize", r"\b(summari[sz]e|summary|tl;?dr|sum (it |this )?up|give me the gist)\b", 0.95),
+    ("fill the form", r"\b(fill (out |in )?(the |this |my )?(form|application)|auto-?fill|complete (the |this )?form)\b", 0.95),
+    ("translate", r"\b(translat(e|ion)|in spanish)\b", 0.92),
+    ("analyze_sentiment", r"\b(sentiment|(tone|mood) of)\b", 0.9),
+    ("extract_entities", r"\b((named )?entities|extract (the |all )?(names|people|organi[sz]ations|locations|dates))\b", 0.9),
+    ("find", r"\b(key (facts|points|information)|important (facts|information)|find (the |me )?(information|info|facts))\b", 0.88),
+]
+_COMPILED_RULES = [(tool, re.compile(pattern, re.IGNORECASE), confidence) for tool, pattern, confidence in RULES]
+
+SEED_EXAMPLES = [
+    ("summarize this page", "summarize"),
+    ("can you summarize the article", "summarize"),
+    ("give me a short overview of this", "summarize"),
+    ("what is this page about", "summarize"),
+    ("read me the main points of this article", "summarize"),
+    ("briefly tell me what this says", "summarize"),
+    ("fill the form", "fill the form"),
+    ("fill out this application for me", "fill the form"),
+    ("complete the signup form with my details", "fill the form"),
+    ("enter my information in the form", "fill the form"),
+    ("put my details into these fields", "fill the form"),
+    ("find the key facts", "find"),
+    ("find the price on this page", "find"),
+    ("look for the opening hours", "find"),
+    ("where does it mention the deadline", "find"),
+    ("search this page for the contact email", "find"),
+    ("who are the people mentioned here", "extract_entities"),
+    ("list the organizations and locations", "extract_entities"),
+    ("extract the names and dates", "extract_entities"),
+    ("which companies are mentioned", "extract_entities"),
+    ("is this review positive or negative", "analyze_sentiment"),
+    ("what is the tone of this text", "analyze_sentiment"),
+    ("how does the author feel about it", "analyze_sentiment"),
+    ("is this message angry", "analyze_sentiment"),
+    ("translate this", "translate"),
+    ("translate this page to spanish", "translate"),
+    ("say this in spanish", "translate"),
+    ("what does this say in another language", "translate"),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _features(text):
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes with Laplace smoothing; fit() can be called again to learn more examples."""
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.class_counts = Counter()
+        self.feature_counts = {}
+        self.feature_totals = Counter()
+        self.vocabulary = set()
+        self._lock = threading.Lock()
+
+    def fit(self, examples):
+        with self._lock:
+            for text, label in examples:
+                self.class_counts[label] += 1
+                counts = self.feature_counts.setdefault(label, Counter())
+                for feature in _features(text):
+                    counts[feature] += 1
+                    self.feature_totals[label] += 1
+                    self.vocabulary.add(feature)
+        return self
+
+    def predict(self, text):
+        """
+        Returns:
+            tuple: (label, posterior probability), or (None, 0.0) when the
+            text shares no features with the training data
+        """
+        with self._lock:
+            features = [f for f in _features(text) if f in self.vocabulary]
+            if not features or not self.class_counts:
+                return None, 0.0
+
+            total_examples = sum(self.class_counts.values())
+            vocabulary_size = len(self.vocabulary)
+            scores = {}
+            for label, count in self.class_counts.items():
+                counts = self.feature_counts[label]
+                denominator = self.feature_totals[label] + self.alpha * vocabulary_size
+                score = math.log(count / total_examples)
+                for feature in features:
+                    score += math.log((counts[feature] + self.alpha) / denominator)
+                scores[label] = score
+
+        # Softmax over the log scores
+        best = max(scores, key=scores.get)
+        peak = scores[best]
+        normalizer = sum(math.exp(score - peak) for score in scores.values())
+        return best, 1.0 / normalizer
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+_log_lock = threading.Lock()
+# Lines in the current (not rotated) training log, counted on first use
+_logged_lines = None
+
+
+def _load_logged_examples(path):
+    examples = []
+    if not path or not os.path.exists(path):
+        return examples
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("transcript") and entry.get("tool"):
+                examples.append((entry["transcript"], entry["tool"]))
+    return examples
+
+
+def _count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def get_classifier():
+    """Train the classifier on first use."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                examples = SEED_EXAMPLES
+                if TRAINING_LOG_PATH:
+                    # Oldest first: the rotated log, then the current one
+                    examples = examples + _load_logged_examples(TRAINING_LOG_PATH + ".1")
+                    examples = examples + _load_logged_examples(TRAINING_LOG_PATH)
+                _classifier = NaiveBayesClassifier().fit(examples)
+    return _classifier
+
+
+def match_rules(text):
+    """
+    Apply the pattern rules.
+
+    Returns:
+        RouteDecision or None if no rule, or rules for more than one tool, matched
+    """
+    matches = {}
+    for tool, pattern, confidence in _COMPILED_RULES:
+        if pattern.search(text):
+            matches[tool] = max(confidence, matches.get(tool, 0.0))
+    if len(matches) != 1:
+        return None
+    tool, confidence = matches.popitem()
+    return RouteDecision(tool, confidence, "rules")
+
+
+def route(text, threshold=None):
+    """
+    Resolve a transcript to a tool locally.
+
+    Args:
+        text (str): The transcript text
+        threshold (float): Minimum confidence, defaults to INTENT_ROUTER_THRESHOLD
+
+    Returns:
+        RouteDecision or None when the LLM selector should decide
+    """
+    if not ROUTER_ENABLED:
+        return None
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+
+    decision = match_rules(text)
+    if decision and decision.confidence >= threshold:
+        return decision
+
+    label, confidence = get_classifier().predict(text)
+    if label and confidence >= threshold:
+        return RouteDecision(label, confidence, "classifier")
+    return None
+
+
+def record_example(text, tool):
+    """
+    Learn an LLM-routed transcript, and append it to the training log if
+    one is configured (rotating the log when it is full).
+    """
+    global _logged_lines
+    get_classifier().fit([(text, tool)])
+    if not TRAINING_LOG_PATH:
+        return
+    with _log_lock:
+        if _logged_lines is None:
+            _logged_lines = _count_lines(TRAINING_LOG_PATH)
+        if _logged_lines >= MAX_LOGGED_EXAMPLES:
+            os.replace(TRAINING_LOG_PATH, TRAINING_LOG_PATH + ".1")
+            _logged_lines = 0
+        with open(TRAINING_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"transcript": text, "tool": tool}) + "\n")
+        _logged_lines += 1
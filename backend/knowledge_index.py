@@ -0,0 +1,285 @@
+"""
+Local retrieval over the user's knowledge base for /fill-form.
+
+generate_form_answers used to paste the whole knowledge base into every
+prompt. Instead the user_data text is segmented into snippets (one per
+numbered item or line, long items split into sentences, section headings
+kept as context) and indexed for BM25 lexical scoring. For each form
+field the best matching snippets are selected, so the prompt only holds
+what the form asks about and stays small as the knowledge base grows.
+
+Indexes are kept per knowledge base and updated incrementally: when the
+knowledge base changes only added and removed snippets are (un)indexed.
+The extension sends a stable per-profile knowledge_base_id; requests
+without one are keyed by a hash of their user_data, so different users
+never share (and keep rebuilding) one index.
+Small knowledge bases are sent whole, since there is nothing to save.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+RETRIEVAL_ENABLED = os.getenv("KNOWLEDGE_RETRIEVAL_ENABLED", "true").lower() != "false"
+# Knowledge bases up to this many characters are sent in full
+FULL_TEXT_CHARS = int(os.getenv("KNOWLEDGE_FULL_TEXT_CHARS", "2000"))
+# Upper bound on the selected snippets' total size
+MAX_CONTEXT_CHARS = int(os.getenv("KNOWLEDGE_MAX_CHARS", "4000"))
+TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+MAX_INDEXES = 64
+SNIPPET_MAX_CHARS = 300
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_ITEM_RE = re.compile(r'^\s*(?:\d+[.)]|[-*•])\s+')
+_SENTENCE_RE = re.compile(r'(?<=[.!?;])\s+')
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_CAMEL_RE = re.compile(r'(?<=[a-z])(?=[A-Z])')
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "has",
+    "have", "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "this",
+    "to", "was", "what", "which", "with", "you", "your", "please", "enter",
+    "select", "field", "input", "text", "free", "any", "value", "possible", "e", "g"
+}
+
+# Words a form and a knowledge base commonly use for the same thing
+SYNONYMS = {
+    "phone": ["mobile", "cell", "telephone", "tel", "number"],
+    "email": ["mail", "e-mail"],
+    "address": ["street", "live", "city", "zip", "postal", "postcode", "state", "country"],
+    "name": ["called", "first", "last", "full", "surname"],
+    "birth": ["born", "birthday", "dob", "age"],
+    "dob": ["born", "birthday", "birth"],
+    "gender": ["sex", "male", "female", "man", "woman", "pronouns"],
+    "job": ["work", "employer", "company", "position", "title", "occupation", "role"],
+    "company": ["employer", "work", "organization"],
+    "school": ["university", "college", "education", "degree", "studied", "graduated"],
+    "education": ["university", "college", "school", "degree", "studied"],
+    "experience": ["years", "worked", "work"],
+    "salary": ["pay", "compensation", "income"],
+    "linkedin": ["profile", "url"],
+    "website": ["site", "url", "portfolio"],
+    "nationality": ["citizen", "citizenship", "country"],
+    "citizenship": ["citizen", "nationality", "visa", "authorized"],
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords, with naive plural stripping."""
+    text = _CAMEL_RE.sub(" ", str(text or ""))
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower().replace("_", " ")):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def query_tokens(field):
+    """Tokens for one structured form field, expanded with synonyms."""
+    tokens = tokenize(field.get('question', '')) + tokenize(field.get('html_id', ''))
+    expanded = list(tokens)
+    for token in tokens:
+        expanded.extend(SYNONYMS.get(token, ()))
+    return expanded
+
+
+def segment(user_data):
+    """
+    Split knowledge base text into snippets.
+
+    Numbered or bulleted items and lines are separate snippets, a line
+    ending in ":" is a section heading prefixed to the snippets below it,
+    and snippets over SNIPPET_MAX_CHARS are split into sentences.
+
+    Returns:
+        list: Snippet strings in document order
+    """
+    snippets = []
+    heading = ""
+    for line in (user_data or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        line = _ITEM_RE.sub("", line)
+        if line.endswith(":") and len(line) < 80:
+            heading = line[:-1].strip()
+            if heading.lower() == "my personal information":
+                heading = ""
+            continue
+
+        pieces = [line]
+        if len(line) > SNIPPET_MAX_CHARS:
+            pieces = [piece for piece in _SENTENCE_RE.split(line) if piece.strip()]
+        for piece in pieces:
+            snippets.append(f"{heading}: {piece}" if heading else piece)
+    return snippets
+
+
+def _snippet_id(snippet):
+    return hashlib.sha1(snippet.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class KnowledgeIndex:
+    """Incrementally maintained BM25 index over knowledge base snippets."""
+
+    def __init__(self):
+        self._docs = {}
+        self._postings = {}
+        self._order = []
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def _add(self, doc_id, snippet):
+        counts = Counter(tokenize(snippet))
+        length = sum(counts.values())
+        self._docs[doc_id] = (snippet, counts, length)
+        self._total_length += length
+        for token in counts:
+            self._postings.setdefault(token, set()).add(doc_id)
+
+    def _remove(self, doc_id):
+        _, counts, length = self._docs.pop(doc_id)
+        self._total_length -= length
+        for token in counts:
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[token]
+
+    def sync(self, snippets):
+        """
+        Make the index match the given snippets, only (un)indexing the
+        ones that were added or removed since the last sync.
+
+        Returns:
+            tuple: (number added, number removed)
+        """
+        with self._lock:
+            ids = [_snippet_id(snippet) for snippet in snippets]
+            wanted = dict(zip(ids, snippets))
+            removed = [doc_id for doc_id in self._docs if doc_id not in wanted]
+            added = [doc_id for doc_id in wanted if doc_id not in self._docs]
+            for doc_id in removed:
+                self._remove(doc_id)
+            for doc_id in added:
+                self._add(doc_id, wanted[doc_id])
+            self._order = list(dict.fromkeys(ids))
+            return len(added), len(removed)
+
+    def search(self, tokens, top_k=TOP_K):
+        """
+        Score snippets against query tokens with BM25.
+
+        Returns:
+            list: Up to top_k (score, doc_id) pairs with a positive score, best first
+        """
+        with self._lock:
+            total_docs = len(self._docs)
+            if not total_docs:
+                return []
+            average_length = self._total_length / total_docs or 1
+            scores = {}
+            for token in set(tokens):
+                posting = self._postings.get(token)
+                if not posting:
+                    continue
+                idf = math.log(1 + (total_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id in posting:
+                    _, counts, length = self._docs[doc_id]
+                    tf = counts[token]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (
+                        tf + K1 * (1 - B + B * length / average_length)
+                    )
+            return sorted(((score, doc_id) for doc_id, score in scores.items()), reverse=True)[:top_k]
+
+    def select(self, fields, top_k=TOP_K, max_chars=MAX_CONTEXT_CHARS):
+        """
+        Pick the snippets relevant to a structured form.
+
+        Each field contributes its top_k snippets; fields are visited in
+        rounds (best snippet of every field first) until max_chars is
+        reached, and the result keeps the knowledge base's order.
+
+        Returns:
+            list: Selected snippet strings
+        """
+        with self._lock:
+            rankings = [[doc_id for _, doc_id in self.search(query_tokens(field), top_k)] for field in fields]
+            chosen = set()
+            size = 0
+            for rank in range(top_k):
+                for ranking in rankings:
+                    if rank >= len(ranking) or ranking[rank] in chosen:
+                        continue
+                    doc_id = ranking[rank]
+                    snippet_size = len(self._docs[doc_id][0]) + 1
+                    if size + snippet_size > max_chars:
+                        continue
+                    chosen.add(doc_id)
+                    size += snippet_size
+            return [self._docs[doc_id][0] for doc_id in self._order if doc_id in chosen]
+
+    def retrieve(self, snippets, fields):
+        """Sync to the given snippets and select for fields in one step."""
+        with self._lock:
+            self.sync(snippets)
+            return self.select(fields)
+
+    def stats(self):
+        with self._lock:
+            return {"snippets": len(self._docs), "terms": len(self._postings)}
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def index_key(user_data, knowledge_base_id=None):
+    """The index a request uses: its knowledge_base_id, or one derived from the text."""
+    if knowledge_base_id:
+        return f"id:{knowledge_base_id}"
+    return "text:" + hashlib.sha1(user_data.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def get_index(key):
+    """Return the index for a knowledge base, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = KnowledgeIndex()
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(key)
+        return index
+
+
+def relevant_user_data(user_data, structured_form, knowledge_base_id=None):
+    """
+    Reduce the knowledge base text to the snippets relevant to the form.
+
+    Args:
+        user_data (str): Knowledge base text sent by the extension
+        structured_form (list): Structured fields with question and html_id
+        knowledge_base_id (str): Optional id of the client's knowledge base
+
+    Returns:
+        str: The text to put in the answer prompt
+    """
+    if not RETRIEVAL_ENABLED or not user_data or len(user_data) <= FULL_TEXT_CHARS:
+        return user_data
+
+    snippets = get_index(index_key(user_data, knowledge_base_id)).retrieve(segment(user_data), structured_form)
+    if not snippets:
+        return ""
+    return "My Personal Information (relevant excerpts):\n\n" + "\n".join(
+        f"{i + 1}. {snippet}" for i, snippet in enumerate(snippets)
+    )
@@ -0,0 +1,622 @@
+"""
+Process-wide gateway for every upstream LLM and TTS call.
+
+All endpoints go through this module instead of building their own
+anthropic.Anthropic / openai.OpenAI clients. The gateway owns:
+
+- long-lived clients with a pooled, keep-alive HTTP connection pool
+- per-model concurrency limits (a semaphore per model name)
+- connect/read timeouts
+- retry with exponential backoff and jitter for transient failures
+- single-flight coalescing: identical concurrent temperature 0 requests
+  share one upstream call (see singleflight.py)
+- upstream timings, retries and token counts, including prompt cache
+  reads and writes (see metrics.py and prompt_cache.py)
+
+The asyncio serving mode (asgi_app.py) uses the async counterparts
+(acreate_message, astream_text, acreate_speech), which share the same
+configuration, retry policy and response cache but run on AsyncAnthropic
+/ AsyncOpenAI clients, so waiting on the upstream does not hold a thread.
+
+Everything is configured from the environment (see the LLM_* variables
+in .env.example), so upstream behaviour can be tuned in one place.
+
+The anthropic and openai SDKs take about two seconds to import, so they
+are imported when the first client is created rather than at startup.
+"""
+import asyncio
+import importlib
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import httpx
+
+import cancellation
+import metrics
+import prompt_cache
+import singleflight
+import startup
+from response_cache import response_cache, is_cacheable, is_deterministic, cache_key
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return int(default)
+
+
+def _parse_model_limits(raw):
+    """Parse "model=limit,model=limit" into a dict."""
+    limits = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        model, limit = item.split("=", 1)
+        try:
+            limits[model.strip()] = max(1, int(limit))
+        except ValueError:
+            continue
+    return limits
+
+
+# Timeouts (seconds)
+REQUEST_TIMEOUT = _env_float("LLM_TIMEOUT_SECONDS", 60)
+CONNECT_TIMEOUT = _env_float("LLM_CONNECT_TIMEOUT_SECONDS", 5)
+
+# Retry policy
+MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 3)
+RETRY_BASE_DELAY = _env_float("LLM_RETRY_BASE_DELAY", 0.5)
+RETRY_MAX_DELAY = _env_float("LLM_RETRY_MAX_DELAY", 8)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Connection pool
+POOL_MAX_CONNECTIONS = _env_int("LLM_POOL_MAX_CONNECTIONS", 100)
+POOL_MAX_KEEPALIVE = _env_int("LLM_POOL_MAX_KEEPALIVE", 20)
+POOL_KEEPALIVE_EXPIRY = _env_float("LLM_POOL_KEEPALIVE_EXPIRY", 60)
+
+# Per-model concurrency, e.g. LLM_MODEL_CONCURRENCY="claude-3-opus-20240229=4,tts-1=8"
+DEFAULT_MODEL_CONCURRENCY = _env_int("LLM_DEFAULT_CONCURRENCY", 16)
+MODEL_CONCURRENCY = _parse_model_limits(os.getenv("LLM_MODEL_CONCURRENCY", ""))
+
+_client_lock = threading.Lock()
+_anthropic_client = None
+_openai_client = None
+
+_semaphore_lock = threading.Lock()
+_model_semaphores = {}
+
+# Identical concurrent deterministic requests share one upstream call
+message_flights = singleflight.SingleFlight()
+async_message_flights = singleflight.AsyncSingleFlight()
+
+_async_anthropic_client = None
+_async_openai_client = None
+_async_model_semaphores = {}
+
+
+def _timeout():
+    return httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+    )
+
+
+def _sdk(name):
+    """Import an SDK module on first use."""
+    if name not in sys.modules:
+        with startup.timed(f"import {name}"):
+            return importlib.import_module(name)
+    return importlib.import_module(name)
+
+
+def preload_sdks():
+    """Import both SDKs ahead of the first request (the "sdk" warm-up task)."""
+    for name in ("anthropic", "openai"):
+        _sdk(name)
+
+
+def get_anthropic_client():
+    """Return the shared Anthropic client, creating it on first use."""
+    global _anthropic_client
+    if _anthropic_client is None:
+        anthropic = _sdk("anthropic")
+        with _client_lock:
+            if _anthropic_client is None:
+                _anthropic_client = anthropic.Anthropic(
+                    api_key=os.getenv("ANTHROPIC_API_KEY"),
+                    timeout=_timeout(),
+                    # Retries are handled by the gateway so that they also
+                    # respect the per-model concurrency limits.
+                    max_retries=0,
+                    http_client=anthropic.DefaultHttpxClient(limits=_limits(), timeout=_timeout())
+                )
+    return _anthropic_client
+
+
+def get_openai_client():
+    """Return the shared OpenAI client, creating it on first use."""
+    global _openai_client
+    if _openai_client is None:
+        openai = _sdk("openai")
+        with _client_lock:
+            if _openai_client is None:
+                _openai_client = openai.OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    timeout=_timeout(),
+                    max_retries=0,
+                    http_client=openai.DefaultHttpxClient(limits=_limits(), timeout=_timeout())
+                )
+    return _openai_client
+
+
+def get_async_anthropic_client():
+    """Return the shared AsyncAnthropic client, creating it on first use."""
+    global _async_anthropic_client
+    if _async_anthropic_client is None:
+        anthropic = _sdk("anthropic")
+        _async_anthropic_client = anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            timeout=_timeout(),
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout())
+        )
+    return _async_anthropic_client
+
+
+def get_async_openai_client():
+    """Return the shared AsyncOpenAI client, creating it on first use."""
+    global _async_openai_client
+    if _async_openai_client is None:
+        openai = _sdk("openai")
+        _async_openai_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=_timeout(),
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout())
+        )
+    return _async_openai_client
+
+
+def _semaphore_for(model):
+    semaphore = _model_semaphores.get(model)
+    if semaphore is None:
+        with _semaphore_lock:
+            semaphore = _model_semaphores.get(model)
+            if semaphore is None:
+                limit = MODEL_CONCURRENCY.get(model, DEFAULT_MODEL_CONCURRENCY)
+                semaphore = threading.BoundedSemaphore(limit)
+                _model_semaphores[model] = semaphore
+    return semaphore
+
+
+@contextmanager
+def model_slot(model):
+    """Hold one of the concurrency slots for the given model."""
+    semaphore = _semaphore_for(model)
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _async_semaphore_for(model):
+    # Only touched from the event loop thread, so no lock is needed
+    semaphore = _async_model_semaphores.get(model)
+    if semaphore is None:
+        limit = MODEL_CONCURRENCY.get(model, DEFAULT_MODEL_CONCURRENCY)
+        semaphore = asyncio.BoundedSemaphore(limit)
+        _async_model_semaphores[model] = semaphore
+    return semaphore
+
+
+def _is_retryable(error):
+    # An SDK's errors can only occur once it has been imported
+    connection_errors = tuple(
+        sys.modules[name].APIConnectionError for name in ("anthropic", "openai") if name in sys.modules
+    )
+    if connection_errors and isinstance(error, connection_errors):
+        # Also covers the APITimeoutError subclasses
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def _retry_delay(error, attempt):
+    """Honour Retry-After when the upstream sends it, otherwise back off exponentially."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+    return delay * (0.5 + random.random() / 2)
+
+
+@contextmanager
+def _measured(kind, model):
+    """Time an upstream call (retries included) and count it if it fails."""
+    started = time.perf_counter()
+    try:
+        yield
+    except cancellation.RequestCancelled:
+        raise
+    except Exception:
+        metrics.UPSTREAM_ERRORS.inc(kind=kind, model=model)
+        raise
+    finally:
+        metrics.observe_upstream(kind, model, time.perf_counter() - started)
+
+
+def call_with_retry(model, call):
+    """
+    Run an upstream call under the model's concurrency limit, retrying
+    transient failures with exponential backoff.
+
+    Args:
+        model (str): Model name used to pick the concurrency limit
+        call (callable): Zero-argument callable making the SDK request
+
+    Returns:
+        The SDK response object
+    """
+    attempt = 0
+    while True:
+        try:
+            with model_slot(model):
+                return call()
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            metrics.UPSTREAM_RETRIES.inc(model=model)
+            # Sleep outside the slot so waiting callers can use it
+            time.sleep(_retry_delay(e, attempt))
+            attempt += 1
+
+
+def _message_key(kind, cache, kwargs):
+    """Cache and coalescing key for deterministic requests, otherwise None."""
+    return cache_key(kind, kwargs) if cache and is_deterministic(kwargs) else None
+
+
+def _record_usage(model, usage):
+    """Record a Messages API response's token counts, including prompt cache reads and writes."""
+    metrics.record_usage(model, usage)
+    prompt_cache.token_stats.record(usage)
+
+
+def _cache_lookup(key):
+    """Look key up in the response cache, counting the hit or miss."""
+    cached = response_cache.get(key)
+    metrics.LLM_CACHE_LOOKUPS.inc(endpoint=metrics.current_endpoint(), result="miss" if cached is None else "hit")
+    return cached
+
+
+def create_message(cache=True, accept=None, **kwargs):
+    """
+    Call the Anthropic Messages API through the shared client.
+
+    Accepts the same keyword arguments as client.messages.create.
+    Temperature 0 requests are answered from the response cache when an
+    identical request was made before, and identical concurrent ones
+    share a single upstream call; pass cache=False to bypass both.
+    accept, if given, is called with the response and only responses it
+    returns True for are cached (e.g. output that passed validation).
+    """
+    key = _message_key("message", cache, kwargs)
+    cacheable = key is not None and is_cacheable(kwargs)
+    if cacheable:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            return cached
+
+    client = get_anthropic_client()
+
+    def fetch():
+        with _measured("message", kwargs.get("model")):
+            response = call_with_retry(kwargs.get("model"), partial(client.messages.create, **kwargs))
+        _record_usage(kwargs.get("model"), response.usage)
+        if cacheable and (accept is None or accept(response)):
+            response_cache.put(key, response, len(response.model_dump_json()))
+        return response
+
+    if key is None:
+        return fetch()
+    return message_flights.do(key, fetch)
+
+
+def _stream_upstream(client, kwargs):
+    """Yield text deltas, retrying transient failures until the first token."""
+    model = kwargs.get("model")
+    attempt = 0
+    with _measured("stream", model):
+        while True:
+            started = False
+            try:
+                with model_slot(model):
+                    with client.messages.stream(**kwargs) as stream:
+                        for text in stream.text_stream:
+                            started = True
+                            yield text
+                        _record_usage(model, stream.get_final_message().usage)
+                return
+            except Exception as e:
+                if started or attempt >= MAX_RETRIES or not _is_retryable(e):
+                    raise
+                metrics.UPSTREAM_RETRIES.inc(model=model)
+                time.sleep(_retry_delay(e, attempt))
+                attempt += 1
+
+
+def stream_text(cache=True, **kwargs):
+    """
+    Stream a Messages API response from the shared client, yielding text
+    deltas as they arrive.
+
+    Transient failures are retried only until the first token has been
+    yielded; after that the error is raised to the caller.
+
+    Accepts the same keyword arguments as client.messages.stream.
+    Cached temperature 0 responses are yielded as a single chunk. When an
+    identical temperature 0 stream is already in flight, the caller waits
+    for it and receives its full text as a single chunk.
+    """
+    key = _message_key("stream", cache, kwargs)
+    cacheable = key is not None and is_cacheable(kwargs)
+    if cacheable:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            yield cached
+            return
+
+    flight = None
+    while key is not None and singleflight.COALESCE_ENABLED:
+        call, leader = message_flights.acquire(key)
+        if leader:
+            flight = call
+            break
+        try:
+            full_text = message_flights.wait(call)
+        except singleflight.FlightAbandoned:
+            continue
+        yield full_text
+        return
+
+    parts = []
+    try:
+        for text in _stream_upstream(get_anthropic_client(), kwargs):
+            parts.append(text)
+            yield text
+        full_text = "".join(parts)
+        if cacheable:
+            response_cache.put(key, full_text, len(full_text.encode("utf-8")))
+        if flight is not None:
+            message_flights.finish(key, flight, result=full_text)
+    except Exception as e:
+        if flight is not None:
+            message_flights.finish(key, flight, error=e)
+        raise
+    finally:
+        # The consumer stopped early (e.g. the client disconnected)
+        if flight is not None and not flight.done():
+            message_flights.finish(key, flight, error=singleflight.FlightAbandoned())
+
+
+def _speech_with_cancel(client, cancel_token, kwargs):
+    """Stream speech bytes so that cancelling the token closes the connection."""
+    cancel_token.raise_if_cancelled()
+    with client.audio.speech.with_streaming_response.create(**kwargs) as response:
+        cancel_token.add_callback(response.close)
+        try:
+            chunks = []
+            for chunk in response.iter_bytes(16384):
+                cancel_token.raise_if_cancelled()
+                chunks.append(chunk)
+        except Exception:
+            # Closing the response mid-read surfaces as a read error
+            cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            cancel_token.remove_callback(response.close)
+    return b"".join(chunks)
+
+
+def create_speech(cancel_token=None, **kwargs):
+    """
+    Call the OpenAI speech API through the shared client.
+
+    Accepts the same keyword arguments as client.audio.speech.create.
+    When a cancellation.CancelToken is given, cancelling it aborts the
+    upstream HTTP request and raises cancellation.RequestCancelled.
+
+    Returns:
+        bytes: The synthesized audio
+    """
+    client = get_openai_client()
+    model = kwargs.get("model")
+    metrics.TTS_CHARACTERS.observe(len(kwargs.get("input") or ""), model=model)
+    with _measured("speech", model):
+        if cancel_token is None:
+            audio = call_with_retry(model, partial(client.audio.speech.create, **kwargs)).content
+        else:
+            audio = call_with_retry(model, partial(_speech_with_cancel, client, cancel_token, kwargs))
+    metrics.TTS_AUDIO_BYTES.observe(len(audio), model=model)
+    return audio
+
+
+async def async_call_with_retry(model, call):
+    """
+    Async version of call_with_retry.
+
+    Args:
+        model (str): Model name used to pick the concurrency limit
+        call (callable): Zero-argument callable returning the SDK coroutine
+
+    Returns:
+        The SDK response object
+    """
+    attempt = 0
+    while True:
+        try:
+            async with _async_semaphore_for(model):
+                return await call()
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            metrics.UPSTREAM_RETRIES.inc(model=model)
+            await asyncio.sleep(_retry_delay(e, attempt))
+            attempt += 1
+
+
+async def acreate_message(cache=True, accept=None, **kwargs):
+    """Async version of create_message, using the shared AsyncAnthropic client."""
+    key = _message_key("message", cache, kwargs)
+    cacheable = key is not None and is_cacheable(kwargs)
+    if cacheable:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            return cached
+
+    client = get_async_anthropic_client()
+
+    async def fetch():
+        with _measured("message", kwargs.get("model")):
+            response = await async_call_with_retry(kwargs.get("model"), partial(client.messages.create, **kwargs))
+        _record_usage(kwargs.get("model"), response.usage)
+        if cacheable and (accept is None or accept(response)):
+            response_cache.put(key, response, len(response.model_dump_json()))
+        return response
+
+    if key is None:
+        return await fetch()
+    return await async_message_flights.do(key, fetch)
+
+
+async def _astream_upstream(client, kwargs):
+    """Async version of _stream_upstream."""
+    model = kwargs.get("model")
+    attempt = 0
+    with _measured("stream", model):
+        while True:
+            started = False
+            try:
+                async with _async_semaphore_for(model):
+                    async with client.messages.stream(**kwargs) as stream:
+                        async for text in stream.text_stream:
+                            started = True
+                            yield text
+                        _record_usage(model, (await stream.get_final_message()).usage)
+                return
+            except Exception as e:
+                if started or attempt >= MAX_RETRIES or not _is_retryable(e):
+                    raise
+                metrics.UPSTREAM_RETRIES.inc(model=model)
+                await asyncio.sleep(_retry_delay(e, attempt))
+                attempt += 1
+
+
+async def astream_text(cache=True, **kwargs):
+    """Async version of stream_text: an async generator of text deltas."""
+    key = _message_key("stream", cache, kwargs)
+    cacheable = key is not None and is_cacheable(kwargs)
+    if cacheable:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            yield cached
+            return
+
+    flight = None
+    while key is not None and singleflight.COALESCE_ENABLED:
+        call, leader = async_message_flights.acquire(key)
+        if leader:
+            flight = call
+            break
+        try:
+            full_text = await async_message_flights.wait(call)
+        except singleflight.FlightAbandoned:
+            continue
+        yield full_text
+        return
+
+    parts = []
+    upstream = _astream_upstream(get_async_anthropic_client(), kwargs)
+    try:
+        async for text in upstream:
+            parts.append(text)
+            yield text
+        full_text = "".join(parts)
+        if cacheable:
+            response_cache.put(key, full_text, len(full_text.encode("utf-8")))
+        if flight is not None:
+            async_message_flights.finish(key, flight, result=full_text)
+    except Exception as e:
+        if flight is not None:
+            async_message_flights.finish(key, flight, error=e)
+        raise
+    finally:
+        await upstream.aclose()
+        if flight is not None and not flight.done():
+            async_message_flights.finish(key, flight, error=singleflight.FlightAbandoned())
+
+
+async def _aspeech_with_cancel(client, cancel_token, kwargs):
+    """Download speech in a task that cancelling the token cancels."""
+    cancel_token.raise_if_cancelled()
+
+    async def download():
+        async with client.audio.speech.with_streaming_response.create(**kwargs) as response:
+            return await response.read()
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(download())
+    # /stop_audio may run on another thread in mixed deployments
+    cancel = partial(loop.call_soon_threadsafe, task.cancel)
+    cancel_token.add_callback(cancel)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if task.cancelled() and cancel_token.cancelled:
+            cancel_token.raise_if_cancelled()
+        raise
+    finally:
+        cancel_token.remove_callback(cancel)
+
+
+async def acreate_speech(cancel_token=None, **kwargs):
+    """
+    Async version of create_speech, using the shared AsyncOpenAI client.
+
+    Returns:
+        bytes: The synthesized audio
+    """
+    client = get_async_openai_client()
+    model = kwargs.get("model")
+    metrics.TTS_CHARACTERS.observe(len(kwargs.get("input") or ""), model=model)
+    with _measured("speech", model):
+        if cancel_token is None:
+            audio = (await async_call_with_retry(model, partial(client.audio.speech.create, **kwargs))).content
+        else:
+            audio = await async_call_with_retry(model, partial(_aspeech_with_cancel, client, cancel_token, kwargs))
+    metrics.TTS_AUDIO_BYTES.observe(len(audio), model=model)
+    return audio
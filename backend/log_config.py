@@ -0,0 +1,217 @@
+"""
+Structured, leveled logging for the backend.
+
+Configured from the environment (see the LOG_* variables in .env.example):
+
+- LOG_LEVEL picks the level; debug records cost one level check when off
+- LOG_FORMAT=json writes one JSON object per line, "text" is key=value
+- every record carries the request ID of the HTTP request it belongs to
+  (the X-Request-ID header, or a generated one echoed back in it)
+- LOG_SAMPLE_RATE keeps that fraction of requests' debug/info records;
+  warnings and errors are always kept. Sampling is per request, so a
+  sampled request is logged completely
+- field values and messages are capped at LOG_MAX_FIELD_CHARS
+
+Records are handed to a queue and written by a background thread, so
+request threads and the event loop never block on stdout.
+
+Usage:
+    log = log_config.get_logger(__name__)
+    log.info("Form structured", fields=12, cached=False)
+
+Never log form contents, knowledge base text or prompts; log their sizes.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+import zlib
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "300"))
+SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Socket.IO / Engine.IO log every packet; only useful when debugging the socket layer
+SOCKETIO_LOGGING = os.getenv("SOCKETIO_LOGGING", "false").lower() == "true"
+
+DEBUG = LOG_LEVEL == "DEBUG"
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = contextvars.ContextVar("log_request_id", default="-")
+_listener = None
+
+
+def new_request_id(header=None):
+    """The client's X-Request-ID if it is safe to log, otherwise a new ID."""
+    if header and _REQUEST_ID_RE.match(header):
+        return header
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id):
+    """Tag records logged in the current context with request_id; returns a reset token."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def _cap(value):
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > MAX_FIELD_CHARS:
+        return f"{text[:MAX_FIELD_CHARS]}...(+{len(text) - MAX_FIELD_CHARS} chars)"
+    return text
+
+
+def _text_value(value):
+    if isinstance(value, str) and (not value or not value.isprintable() or any(c in value for c in ' ="')):
+        return json.dumps(value)
+    return value
+
+
+class _ContextFilter(logging.Filter):
+    """Attach the request ID and apply per-request sampling."""
+
+    def filter(self, record):
+        request_id = _request_id.get()
+        record.request_id = request_id
+        if SAMPLE_RATE >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if request_id == "-":
+            return random.random() < SAMPLE_RATE
+        # Same decision for every record of a request
+        return zlib.crc32(request_id.encode("utf-8")) % 10000 < SAMPLE_RATE * 10000
+
+
+class _Formatter(logging.Formatter):
+    """key=value or JSON lines with the record's structured fields."""
+
+    def __init__(self, json_lines):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = {key: _cap(value) for key, value in (getattr(record, "fields", None) or {}).items()}
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+        message = _cap(record.getMessage())
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        if self.json_lines:
+            return json.dumps({
+                "ts": timestamp,
+                "level": record.levelname,
+                "logger": record.name,
+                "request_id": getattr(record, "request_id", "-"),
+                "msg": message,
+                **fields
+            }, default=str)
+        line = f"{timestamp} {record.levelname:<7} {record.name} [{getattr(record, 'request_id', '-')}] {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={_text_value(value)}" for key, value in fields.items())
+        return line
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The queue never leaves the process, so formatting is left to the
+        # listener thread instead of the caller
+        return record
+
+
+class StructuredLogger:
+    """Logger taking keyword fields: log.info("Message", key=value)."""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def enabled(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level, message, fields, exc_info=None):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, exc_info=exc_info, extra={"fields": fields}, stacklevel=3)
+
+    def debug(self, message, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message, **fields):
+        self._log(logging.ERROR, message, fields)
+
+    def exception(self, message, **fields):
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+
+def configure():
+    """Route all logging through the background writer. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(_Formatter(LOG_FORMAT == "json"))
+    log_queue = queue.SimpleQueue()
+    queue_handler = _InProcessQueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # Per-request access lines only at debug level
+    logging.getLogger("werkzeug").setLevel(logging.DEBUG if DEBUG else logging.WARNING)
+    logging.getLogger("uvicorn.access").setLevel(logging.DEBUG if DEBUG else logging.WARNING)
+    for name in ("httpx", "httpcore", "anthropic", "openai"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class ASGIRequestIdMiddleware:
+    """Give each HTTP request of an ASGI app a request ID and echo it in X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        request_id = new_request_id(header)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers") or []) + [(b"x-request-id", request_id.encode("ascii"))]
+            await send(message)
+
+        token = set_request_id(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            reset_request_id(token)
@@ -0,0 +1,370 @@
+"""
+Request, stage, upstream and token metrics in the Prometheus text format.
+
+Every HTTP request is timed per endpoint. Within a request, handlers
+wrap their steps in stage("name") (prompt building, JSON parsing, local
+retrieval, ...) and llm_gateway times every upstream call and records
+its input/output token counts, labelled with the endpoint and the stage
+it ran in. So a slow /fill-form shows whether the time went to the
+structuring or the answering pass, to the upstream or to local work.
+
+The current endpoint and stage live in context variables, which follow
+the request into asyncio tasks and asyncio.to_thread; thread pools
+must run work in a copy of the caller's context (see submit).
+
+Cache and coalescing counters are collected from the caches' own stats
+when /metrics is scraped. Only the standard library is used.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 100000)
+SIZE_BUCKETS = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+
+_endpoint = contextvars.ContextVar("metrics_endpoint", default="none")
+_stage = contextvars.ContextVar("metrics_stage", default="")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative histogram with labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "dei_request_duration_seconds", "HTTP request duration, including streamed bodies.",
+    ["endpoint", "method", "status"]
+)
+STAGE_DURATION = Histogram(
+    "dei_stage_duration_seconds", "Duration of a named stage within a request.",
+    ["endpoint", "stage"]
+)
+UPSTREAM_DURATION = Histogram(
+    "dei_upstream_duration_seconds", "Upstream LLM / TTS call duration, including retries.",
+    ["endpoint", "stage", "kind", "model"]
+)
+UPSTREAM_ERRORS = Counter(
+    "dei_upstream_errors_total", "Upstream calls that failed after retries.",
+    ["kind", "model"]
+)
+UPSTREAM_RETRIES = Counter(
+    "dei_upstream_retries_total", "Retried upstream attempts.",
+    ["model"]
+)
+INPUT_TOKENS = Histogram(
+    "dei_llm_input_tokens", "Input tokens per upstream Messages API call.",
+    ["endpoint", "model"], buckets=TOKEN_BUCKETS
+)
+OUTPUT_TOKENS = Histogram(
+    "dei_llm_output_tokens", "Output tokens per upstream Messages API call.",
+    ["endpoint", "model"], buckets=TOKEN_BUCKETS
+)
+CACHE_READ_TOKENS = Histogram(
+    "dei_llm_cache_read_input_tokens", "Input tokens read from the upstream prompt cache per Messages API call.",
+    ["endpoint", "model"], buckets=TOKEN_BUCKETS
+)
+CACHE_WRITE_TOKENS = Histogram(
+    "dei_llm_cache_write_input_tokens", "Input tokens written to the upstream prompt cache per Messages API call.",
+    ["endpoint", "model"], buckets=TOKEN_BUCKETS
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "dei_llm_cache_lookups_total", "Response cache lookups for deterministic LLM calls.",
+    ["endpoint", "result"]
+)
+TTS_CHARACTERS = Histogram(
+    "dei_tts_input_characters", "Characters sent per upstream speech call.",
+    ["model"], buckets=SIZE_BUCKETS
+)
+TTS_AUDIO_BYTES = Histogram(
+    "dei_tts_audio_bytes", "Audio bytes returned per upstream speech call.",
+    ["model"], buckets=SIZE_BUCKETS
+)
+STRUCTURED_OUTPUTS = Counter(
+    "dei_structured_outputs_total", "Structured model outputs by result (valid, repaired, salvaged, failed).",
+    ["output", "result"]
+)
+
+_METRICS = [
+    REQUEST_DURATION, STAGE_DURATION, UPSTREAM_DURATION, UPSTREAM_ERRORS, UPSTREAM_RETRIES,
+    INPUT_TOKENS, OUTPUT_TOKENS, CACHE_READ_TOKENS, CACHE_WRITE_TOKENS, LLM_CACHE_LOOKUPS, TTS_CHARACTERS, TTS_AUDIO_BYTES,
+    STRUCTURED_OUTPUTS
+]
+
+_caches = {}
+_flight_groups = {}
+
+
+def register_caches(caches, flight_groups=None):
+    """
+    Export cache and coalescing stats on every scrape.
+
+    Args:
+        caches (dict): Cache name to a stats() callable (LRUCache.stats shape)
+        flight_groups (dict): Flight group name to a stats() callable (SingleFlight.stats shape)
+    """
+    _caches.update(caches)
+    _flight_groups.update(flight_groups or {})
+
+
+def _collected():
+    """Render the registered caches' and flight groups' stats."""
+    families = {
+        "dei_cache_hits_total": ("counter", "Cache hits.", "hits"),
+        "dei_cache_misses_total": ("counter", "Cache misses.", "misses"),
+        "dei_cache_evictions_total": ("counter", "Cache evictions.", "evictions"),
+        "dei_cache_entries": ("gauge", "Entries currently cached.", "entries"),
+        "dei_cache_bytes": ("gauge", "Bytes currently cached.", "bytes"),
+    }
+    stats = {}
+    for name, stats_fn in sorted(_caches.items()):
+        cache_stats = stats_fn()
+        # Tiered caches report one stats dict per tier
+        tiers = {tier: tier_stats for tier, tier_stats in cache_stats.items() if isinstance(tier_stats, dict)}
+        if tiers:
+            stats.update((f"{name}_{tier}", tier_stats) for tier, tier_stats in tiers.items())
+        else:
+            stats[name] = cache_stats
+    lines = []
+    for metric, (kind, documentation, field) in families.items():
+        lines.append(f"# HELP {metric} {documentation}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for cache, cache_stats in stats.items():
+            if field in cache_stats:
+                lines.append(f'{metric}{{cache="{_escape(cache)}"}} {cache_stats[field]}')
+
+    flights = {name: stats_fn() for name, stats_fn in sorted(_flight_groups.items())}
+    for metric, documentation, field in (
+        ("dei_coalesced_requests_total", "Requests that waited on an identical in-flight upstream call.", "coalesced"),
+        ("dei_flight_leaders_total", "Requests that made the upstream call for their flight.", "leaders"),
+    ):
+        lines.append(f"# HELP {metric} {documentation}")
+        lines.append(f"# TYPE {metric} counter")
+        for group, group_stats in flights.items():
+            lines.append(f'{metric}{{group="{_escape(group)}"}} {group_stats[field]}')
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    lines.extend(_collected())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def current_endpoint():
+    return _endpoint.get()
+
+
+def current_stage():
+    return _stage.get()
+
+
+def set_endpoint(endpoint):
+    """Label everything measured in the current context with endpoint; returns a reset token."""
+    return _endpoint.set(endpoint)
+
+
+def reset_endpoint(token):
+    _endpoint.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the current request; upstream calls inside are labelled with it."""
+    previous = _stage.get()
+    _stage.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, endpoint=_endpoint.get(), stage=name)
+        # Not reset(token): a closed stream generator may finish in another context
+        _stage.set(previous)
+
+
+def submit(executor, fn, *args):
+    """executor.submit(fn, *args), running fn in a copy of the caller's context."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def iter_in_context(iterable):
+    """
+    Iterate in a copy of the caller's context. WSGI servers consume
+    streamed bodies after the view has returned, outside the request's
+    context, so stream generators are wrapped to keep the endpoint label.
+    """
+    context = contextvars.copy_context()
+    iterator = iter(iterable)
+
+    def generate():
+        try:
+            while True:
+                try:
+                    item = context.run(next, iterator)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                context.run(close)
+
+    return generate()
+
+
+def observe_upstream(kind, model, seconds):
+    UPSTREAM_DURATION.observe(seconds, endpoint=_endpoint.get(), stage=_stage.get(), kind=kind, model=model)
+
+
+def record_usage(model, usage):
+    """
+    Record the token counts of a Messages API response's usage block.
+    Input tokens are the uncached ones; prompt cache reads and writes are
+    recorded separately.
+    """
+    if usage is None:
+        return
+    endpoint = _endpoint.get()
+    input_tokens = getattr(usage, "input_tokens", None)
+    output_tokens = getattr(usage, "output_tokens", None)
+    cache_read_tokens = getattr(usage, "cache_read_input_tokens", None)
+    cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None)
+    if input_tokens is not None:
+        INPUT_TOKENS.observe(input_tokens, endpoint=endpoint, model=model)
+    if output_tokens is not None:
+        OUTPUT_TOKENS.observe(output_tokens, endpoint=endpoint, model=model)
+    if cache_read_tokens is not None:
+        CACHE_READ_TOKENS.observe(cache_read_tokens, endpoint=endpoint, model=model)
+    if cache_write_tokens is not None:
+        CACHE_WRITE_TOKENS.observe(cache_write_tokens, endpoint=endpoint, model=model)
+
+
+def observe_request(endpoint, method, status, seconds):
+    REQUEST_DURATION.observe(seconds, endpoint=endpoint, method=method, status=status)
+
+
+class ASGIMetricsMiddleware:
+    """
+    Time HTTP requests of an ASGI app (until the body is fully sent) and
+    label everything measured during them with the endpoint.
+    """
+
+    def __init__(self, app, endpoints=()):
+        self.app = app
+        self.endpoints = set(endpoints)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Unknown paths share one label so scanners can't blow up cardinality
+        endpoint = scope["path"] if scope["path"] in self.endpoints else "unmatched"
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = set_endpoint(endpoint)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            observe_request(endpoint, scope.get("method", ""), status["code"], time.perf_counter() - started)
+            reset_endpoint(token)
@@ -0,0 +1,81 @@
+"""
+Prompt building and the structured output for /navigation-chrome.
+
+The page itself is distilled and cached by dom_distill.py / page_cache.py;
+this module turns the element index and the transcript into the command
+request. Shared by the Flask app and the asyncio server.
+"""
+import dom_distill
+import prompt_cache
+from structured_output import OutputSpec
+
+NAVIGATION_MODEL = "claude-3-opus-20240229"
+
+NAVIGATION_INSTRUCTIONS = """Based on the page elements and user's voice transcript in the user's message, determine the appropriate navigation commands.
+Focus on identifying clickable elements, form inputs, or areas that match the user's intent.
+
+Each page element is listed as: [index] role "visible text" sel=CSS selector (href=link target for links).
+
+Record the commands with the navigation_commands tool, where each command has:
+- "type": "click" | "scroll" | "focus" | "navigate"
+- "target": the sel= CSS selector of the chosen element (or a URL for "navigate")
+- "confidence": 0.0 to 1.0 indicating confidence in the command
+- "explanation": Brief explanation of why this action was chosen
+"""
+
+NAVIGATION_OUTPUT = OutputSpec(
+    "navigation_commands",
+    "Record the navigation commands to run, most likely first.",
+    {
+        "type": "object",
+        "properties": {
+            "commands": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "type": {"type": "string", "enum": ["click", "scroll", "focus", "navigate"]},
+                        "target": {"type": "string", "description": "The sel= CSS selector of the chosen element (or a URL for navigate)"},
+                        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+                        "explanation": {"type": "string", "description": "Brief explanation of why this action was chosen"}
+                    },
+                    "required": ["type", "target", "confidence"]
+                }
+            }
+        },
+        "required": ["commands"]
+    },
+    unwrap="commands",
+    stage="navigation"
+)
+
+
+def page_elements_text(page, html_content=None):
+    """Format a distilled page's elements for the prompt."""
+    page_elements = dom_distill.format_elements(page)
+    if not page['elements'] and html_content:
+        # Older clients send the page text rather than markup
+        page_elements = html_content
+    return page_elements
+
+
+def navigation_request(page_elements, transcript):
+    """
+    Build the Messages API arguments for choosing navigation commands.
+
+    The static instructions and then the page's element index are the
+    cacheable prefix, so follow-up commands on the same page (page_hash)
+    only send the transcript uncached.
+    """
+    return {
+        "model": NAVIGATION_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.0,
+        "system": prompt_cache.system(NAVIGATION_INSTRUCTIONS),
+        "messages": [
+            {"role": "user", "content": [
+                prompt_cache.text_block(f"Page Elements:\n{page_elements}", cache=True),
+                prompt_cache.text_block(f"User Transcript:\n{transcript}")
+            ]}
+        ]
+    }
@@ -0,0 +1,99 @@
+"""
+Cache of distilled page element indexes for /navigation-chrome.
+
+Voice navigation usually sends several commands against the same page.
+The distilled index (see dom_distill.py) is cached under a SHA-256 hash
+of the page HTML, so follow-up requests can send just that page_hash
+instead of re-uploading the markup. When only part of the DOM changed,
+the client sends page_hash plus dom_patches and only the changed
+regions are re-distilled; the patched index is stored under a new hash.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import dom_distill
+
+MAX_PAGES = int(os.getenv("NAV_PAGE_CACHE_SIZE", "256"))
+TTL_SECONDS = float(os.getenv("NAV_PAGE_CACHE_TTL", "1800"))
+
+
+def content_hash(html_content):
+    return hashlib.sha256(html_content.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class PageIndexCache:
+    """Thread-safe LRU of distilled pages with a TTL."""
+
+    def __init__(self, max_pages=MAX_PAGES, ttl=TTL_SECONDS):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, page_hash):
+        with self._lock:
+            entry = self._pages.get(page_hash)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._pages[page_hash]
+                self.misses += 1
+                return None
+            self._pages.move_to_end(page_hash)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, page_hash, page):
+        with self._lock:
+            self._pages[page_hash] = (page, time.time())
+            self._pages.move_to_end(page_hash)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"pages": len(self._pages), "hits": self.hits, "misses": self.misses}
+
+
+page_index_cache = PageIndexCache()
+
+
+def index_for_html(html_content):
+    """
+    Return (page_hash, distilled page) for full page HTML, distilling
+    only on a cache miss.
+    """
+    page_hash = content_hash(html_content)
+    page = page_index_cache.get(page_hash)
+    if page is None:
+        page = dom_distill.distill(html_content)
+        page_index_cache.put(page_hash, page)
+    return page_hash, page
+
+
+def index_for_hash(page_hash, dom_patches=None):
+    """
+    Return (page_hash, distilled page) for a previously seen page, applying
+    any DOM patches.
+
+    Args:
+        page_hash (str): Hash returned by an earlier request
+        dom_patches (list): Optional [{"selector": region, "html": outer HTML}]
+
+    Returns:
+        tuple: (new page_hash, page), or (page_hash, None) if the page is not cached
+    """
+    page = page_index_cache.get(page_hash)
+    if page is None or not dom_patches:
+        return page_hash, page
+
+    for patch in dom_patches:
+        page = dom_distill.replace_region(page, patch["selector"], patch.get("html", ""))
+    patched_hash = content_hash(page_hash + json.dumps(dom_patches, sort_keys=True))
+    page_index_cache.put(patched_hash, page)
+    return patched_hash, page
@@ -0,0 +1,78 @@
+"""
+Anthropic prompt caching for the static prompt prefixes.
+
+Request builders put what is identical on every call first (tool
+definitions, then the system instructions, then per-page content such as
+the navigation element index) and mark the end of that prefix with a
+cache_control breakpoint. The upstream then reuses the processed prefix
+for about five minutes: cache reads are billed at a tenth of the input
+price and skip prefill, which lowers time to first token.
+
+Prefixes shorter than the model's minimum (1024 tokens for Sonnet and
+Opus) are simply not cached upstream, so marking them costs nothing. Set
+PROMPT_CACHE_ENABLED=false to send requests without breakpoints.
+
+Cache reads and writes reported in each response's usage are totalled in
+token_stats (served by /cache-stats) and recorded in metrics.py.
+"""
+import os
+import threading
+
+ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() != "false"
+
+_BREAKPOINT = {"type": "ephemeral"}
+
+
+def text_block(text, cache=False):
+    """A text content block, marked as the end of a cacheable prefix if cache is set."""
+    block = {"type": "text", "text": text}
+    if cache and ENABLED:
+        block["cache_control"] = dict(_BREAKPOINT)
+    return block
+
+
+def system(text):
+    """A system prompt that ends a cacheable prefix (it follows the tool definitions)."""
+    if not ENABLED:
+        return text
+    return [text_block(text, cache=True)]
+
+
+class TokenStats:
+    """Totals of the prompt cache fields of Messages API usage blocks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_read_calls = 0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+
+    def record(self, usage):
+        if usage is None:
+            return
+        read = getattr(usage, "cache_read_input_tokens", None) or 0
+        written = getattr(usage, "cache_creation_input_tokens", None) or 0
+        with self._lock:
+            self.calls += 1
+            self.cache_read_calls += 1 if read else 0
+            self.input_tokens += getattr(usage, "input_tokens", None) or 0
+            self.cache_read_tokens += read
+            self.cache_write_tokens += written
+
+    def stats(self):
+        with self._lock:
+            prompt_tokens = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+            return {
+                "enabled": ENABLED,
+                "calls": self.calls,
+                "cache_read_calls": self.cache_read_calls,
+                "uncached_input_tokens": self.input_tokens,
+                "cache_read_tokens": self.cache_read_tokens,
+                "cache_write_tokens": self.cache_write_tokens,
+                "cache_read_ratio": round(self.cache_read_tokens / prompt_tokens, 4) if prompt_tokens else 0.0
+            }
+
+
+token_stats = TokenStats()
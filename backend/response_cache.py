@@ -0,0 +1,114 @@
+"""
+Response cache for deterministic (temperature 0) LLM calls.
+
+Identical requests, for example several users summarizing the same
+popular page, are answered from memory instead of making another
+upstream round trip. Entries are keyed by a hash of the model plus the
+full request (system prompt, messages, tools, sampling parameters), and
+the cache is bounded by entry count, a byte budget and a TTL, with LRU
+eviction.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "false"
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a TTL, an entry limit and a byte budget.
+
+    Callers pass the size of each value in bytes when storing it.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size, stored_at=None):
+        """Store value; stored_at keeps the original age of a reloaded entry."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, stored_at or time.time())
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = LRUCache(MAX_ENTRIES, MAX_BYTES, TTL_SECONDS)
+
+
+def is_deterministic(request_kwargs):
+    """Temperature 0 requests always produce the same response."""
+    return request_kwargs.get("temperature") == 0
+
+
+def is_cacheable(request_kwargs):
+    """Only deterministic (temperature 0) requests are cached."""
+    return CACHE_ENABLED and is_deterministic(request_kwargs)
+
+
+def cache_key(kind, request_kwargs):
+    """
+    Hash the full request. kind separates entries for different response
+    shapes (a Message object vs. streamed text) of the same request.
+    """
+    payload = json.dumps(request_kwargs, sort_keys=True, default=str)
+    digest = hashlib.sha256(payload.encode("utf-8", "surrogatepass")).hexdigest()
+    return f"{kind}:{request_kwargs.get('model')}:{digest}"
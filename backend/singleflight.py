@@ -0,0 +1,201 @@
+"""
+Single-flight coalescing of identical concurrent upstream calls.
+
+The response and TTS caches are only filled once an upstream call
+returns, so when many clients ask for the same summary or audio at the
+same moment they would all miss and all call upstream. A flight group
+lets the first caller for a key (the leader) make the call while every
+concurrent caller with the same key (a follower) waits for the leader's
+result instead of making its own.
+
+Followers receive the leader's exception too, except when the leader
+gave up without a result (its client disconnected or cancelled), which
+is raised as FlightAbandoned so followers can retry on their own.
+"""
+import asyncio
+import os
+import threading
+from concurrent import futures
+
+COALESCE_ENABLED = os.getenv("COALESCE_REQUESTS", "true").lower() != "false"
+
+
+class FlightAbandoned(Exception):
+    """The leader stopped before producing a result; the caller should retry."""
+
+
+def _published_error(error, abandon_on):
+    """The exception followers see when the leader's call raised error."""
+    if isinstance(error, abandon_on) or not isinstance(error, Exception):
+        return FlightAbandoned()
+    return error
+
+
+class _Stats:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+
+    def as_dict(self, in_flight):
+        return {"in_flight": in_flight, "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+class SingleFlight:
+    """Flight group for threaded callers."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def acquire(self, key):
+        """
+        Join the flight for key, starting one if none is in progress.
+
+        Returns:
+            tuple: (future, True if the caller is the leader)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats.coalesced += 1
+                return call, False
+            call = futures.Future()
+            self._calls[key] = call
+            self._stats.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """Publish the leader's outcome and close the flight."""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        if call.done():
+            return
+        if error is not None:
+            call.set_exception(error)
+        else:
+            call.set_result(result)
+
+    def wait(self, call, cancel_token=None):
+        """
+        Wait for a flight's result as a follower.
+
+        Raises cancellation.RequestCancelled if the follower's own token is
+        cancelled while waiting.
+        """
+        if cancel_token is None:
+            return call.result()
+        cancelled = futures.Future()
+        callback = lambda: cancelled.done() or cancelled.set_result(None)
+        cancel_token.add_callback(callback)
+        try:
+            futures.wait([call, cancelled], return_when=futures.FIRST_COMPLETED)
+        finally:
+            cancel_token.remove_callback(callback)
+        cancel_token.raise_if_cancelled()
+        return call.result()
+
+    def do(self, key, fn, cancel_token=None, abandon_on=()):
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key (str): Identity of the request (e.g. its cache key)
+            fn (callable): Zero-argument callable making the upstream call
+            cancel_token (CancelToken): Optional token of this caller
+            abandon_on (tuple): Exception types that only concern the
+                leader (e.g. its own cancellation); followers retry instead
+
+        Returns:
+            The leader's result
+        """
+        if not COALESCE_ENABLED:
+            return fn()
+        while True:
+            call, leader = self.acquire(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self.finish(key, call, error=_published_error(e, abandon_on))
+                    raise
+                self.finish(key, call, result=result)
+                return result
+            try:
+                return self.wait(call, cancel_token)
+            except FlightAbandoned:
+                continue
+
+    def stats(self):
+        with self._lock:
+            return self._stats.as_dict(len(self._calls))
+
+
+class AsyncSingleFlight:
+    """Flight group for coroutines running on one event loop."""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = _Stats()
+
+    def acquire(self, key):
+        call = self._calls.get(key)
+        if call is not None:
+            self._stats.coalesced += 1
+            return call, False
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        self._stats.leaders += 1
+        return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.done():
+            return
+        if error is not None:
+            call.set_exception(error)
+            # Nobody may be waiting; don't log "exception was never retrieved"
+            call.exception()
+        else:
+            call.set_result(result)
+
+    async def wait(self, call, cancel_token=None):
+        # Shielded so a follower going away doesn't cancel the shared result
+        if cancel_token is None:
+            return await asyncio.shield(call)
+        loop = asyncio.get_running_loop()
+        cancelled = loop.create_future()
+        callback = lambda: loop.call_soon_threadsafe(lambda: cancelled.done() or cancelled.set_result(None))
+        cancel_token.add_callback(callback)
+        try:
+            await asyncio.wait([asyncio.shield(call), cancelled], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancel_token.remove_callback(callback)
+            cancelled.cancel()
+        cancel_token.raise_if_cancelled()
+        return call.result()
+
+    async def do(self, key, fn, cancel_token=None, abandon_on=()):
+        """Async version of SingleFlight.do; fn returns a coroutine."""
+        if not COALESCE_ENABLED:
+            return await fn()
+        while True:
+            call, leader = self.acquire(key)
+            if leader:
+                try:
+                    result = await fn()
+                except BaseException as e:
+                    # CancelledError means the leader's client went away
+                    self.finish(key, call, error=_published_error(e, abandon_on))
+                    raise
+                self.finish(key, call, result=result)
+                return result
+            try:
+                return await self.wait(call, cancel_token)
+            except FlightAbandoned:
+                continue
+
+    def stats(self):
+        return self._stats.as_dict(len(self._calls))
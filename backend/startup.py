@@ -0,0 +1,101 @@
+"""
+Startup time breakdown and optional warm-up.
+
+app.py marks the end of each startup phase (imports, app setup, ...)
+with mark(); lazily initialized components record how long their first
+use took with timed(). report() returns the breakdown, served at
+/startup-stats and printed when the server starts.
+
+Heavy components (the SDK clients, the LangChain agent) are created on
+first use so cold starts stay fast. Set STARTUP_WARMUP to a comma
+separated list of warm-up task names (or "all") to build them right
+after startup instead, in a background thread so the port opens
+immediately; WARMUP_BLOCKING=true waits for them before serving.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import log_config
+
+WARMUP_TASKS = [name.strip() for name in os.getenv("STARTUP_WARMUP", "").split(",") if name.strip()]
+WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "false").lower() == "true"
+
+STARTED = time.perf_counter()
+
+_phases = []
+_lazy = {}
+_last_mark = STARTED
+_lock = threading.Lock()
+
+log = log_config.get_logger(__name__)
+
+
+def mark(name):
+    """Record the time since the previous mark as startup phase name."""
+    global _last_mark
+    now = time.perf_counter()
+    with _lock:
+        _phases.append((name, now - _last_mark))
+        _last_mark = now
+
+
+@contextmanager
+def timed(name):
+    """Record how long a lazily initialized component took to build."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _lazy[name] = time.perf_counter() - started
+
+
+def report():
+    """
+    Returns:
+        dict: Seconds per startup phase, total time to the last mark, and
+        the build time of each lazily initialized component so far
+    """
+    with _lock:
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in _phases},
+            "startup_seconds": round(_last_mark - STARTED, 4),
+            "lazy_init": {name: round(seconds, 4) for name, seconds in _lazy.items()},
+        }
+
+
+def warm_up(tasks, names=None, blocking=WARMUP_BLOCKING):
+    """
+    Run the selected warm-up tasks.
+
+    Args:
+        tasks (dict): Task name to zero-argument callable
+        names (list): Names to run, "all" for every task; defaults to STARTUP_WARMUP
+        blocking (bool): Run in the calling thread instead of a background thread
+
+    Returns:
+        threading.Thread: The background thread, or None
+    """
+    names = WARMUP_TASKS if names is None else names
+    if "all" in names:
+        names = list(tasks)
+    selected = [(name, tasks[name]) for name in names if name in tasks]
+    if not selected:
+        return None
+
+    def run():
+        for name, task in selected:
+            try:
+                with timed(f"warmup:{name}"):
+                    task()
+            except Exception:
+                log.exception("Warm-up task failed", task=name)
+
+    if blocking:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,339 @@
+"""
+Schema-constrained model output with one shared validating parser.
+
+Endpoints that need structured data from the model (tool selection,
+entity extraction, sentiment, form structuring and answering,
+navigation commands) describe it as an OutputSpec: a JSON schema that
+is sent as a forced tool, so the model returns a tool_use block whose
+input already has the requested shape instead of JSON embedded in prose.
+
+generate() / agenerate() make the call and parse the result:
+
+1. read the tool_use input (or, if the model answered in text anyway,
+   the first JSON value in the text)
+2. coerce near misses locally: numbers sent as strings, scalars where
+   a list was expected, out-of-range confidences, enum case
+3. validate against the schema; on errors, send the errors back as a
+   tool_result and let the model correct itself, at most
+   STRUCTURED_OUTPUT_REPAIRS times
+4. if it is still invalid, drop the invalid items of top-level lists
+   and return the rest; otherwise raise StructuredOutputError
+
+Only responses that pass validation are stored in the gateway's response
+cache, so a bad output is not served again to retries of the same
+request. Outcomes are counted in metrics (dei_structured_outputs_total).
+"""
+import json
+import os
+
+import log_config
+import metrics
+
+MAX_REPAIRS = int(os.getenv("STRUCTURED_OUTPUT_REPAIRS", "1"))
+
+log = log_config.get_logger(__name__)
+
+_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+class StructuredOutputError(ValueError):
+    """The model's output did not match the schema, even after repair."""
+
+    def __init__(self, message, errors=(), raw=""):
+        super().__init__(message)
+        self.errors = list(errors)
+        self.raw = raw
+
+
+class OutputSpec:
+    """
+    A structured output: a tool whose input schema is the output.
+
+    Args:
+        name (str): Tool name
+        description (str): Tool description (what to call it with)
+        schema (dict): JSON schema of the tool input (must be an object)
+        unwrap (str): Property returned instead of the whole input, for
+            outputs that are a list (tool inputs must be objects)
+        stage (str): Metrics stage prefix for parsing and repairs
+    """
+
+    def __init__(self, name, description, schema, unwrap=None, stage=None):
+        self.name = name
+        self.description = description
+        self.schema = schema
+        self.unwrap = unwrap
+        self.stage = stage or name
+
+    @property
+    def tool(self):
+        return {"name": self.name, "description": self.description, "input_schema": self.schema}
+
+    def constrain(self, request):
+        """Messages API arguments that force the model to call this output's tool."""
+        return dict(request, tools=[self.tool], tool_choice={"type": "tool", "name": self.name})
+
+
+def _type_ok(value, expected):
+    kinds = expected if isinstance(expected, list) else [expected]
+    for kind in kinds:
+        if kind in ("integer", "number") and isinstance(value, bool):
+            continue
+        if isinstance(value, _TYPES.get(kind, object)):
+            return True
+    return False
+
+
+def validate(value, schema, path="$"):
+    """
+    Check value against the subset of JSON schema the specs use (type,
+    properties, required, items, enum, minimum, maximum).
+
+    Returns:
+        list: Error messages, empty if value is valid
+    """
+    errors = []
+    expected = schema.get("type")
+    if expected is not None and not _type_ok(value, expected):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} is less than {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} is greater than {schema['maximum']}")
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}: missing required property {name!r}")
+        for name, subschema in (schema.get("properties") or {}).items():
+            if name in value:
+                errors.extend(validate(value[name], subschema, f"{path}.{name}"))
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def coerce(value, schema):
+    """Fix near misses that don't need the model; returns the coerced value."""
+    expected = schema.get("type")
+    if expected == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    elif expected == "string" and isinstance(value, bool):
+        value = "yes" if value else "no"
+    elif expected in ("number", "integer") and isinstance(value, str):
+        try:
+            value = float(value.strip().rstrip("%")) if expected == "number" else int(value.strip())
+        except ValueError:
+            return value
+    elif expected == "array" and value is not None and not isinstance(value, list):
+        value = [value]
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "maximum" in schema and value > schema["maximum"]:
+            # A 0-100 confidence where 0-1 was asked for
+            value = value / 100 if schema["maximum"] == 1 and value <= 100 else schema["maximum"]
+        if "minimum" in schema and value < schema["minimum"]:
+            value = schema["minimum"]
+    if isinstance(value, str) and "enum" in schema and value not in schema["enum"]:
+        matches = [option for option in schema["enum"] if str(option).lower() == value.strip().lower()]
+        if matches:
+            value = matches[0]
+    if isinstance(value, dict):
+        properties = schema.get("properties") or {}
+        value = {key: coerce(item, properties[key]) if key in properties else item for key, item in value.items()}
+    if isinstance(value, list) and "items" in schema:
+        value = [coerce(item, schema["items"]) for item in value]
+    return value
+
+
+def _salvage(value, schema):
+    """
+    Drop the invalid items of the top-level lists of an object.
+
+    Returns:
+        tuple: (salvaged value, items dropped), or (None, 0) if it can't be salvaged
+    """
+    if not isinstance(value, dict):
+        return None, 0
+    salvaged = dict(value)
+    dropped = 0
+    for name, subschema in (schema.get("properties") or {}).items():
+        items = salvaged.get(name)
+        if subschema.get("type") == "array" and isinstance(items, list) and "items" in subschema:
+            valid = [item for item in items if not validate(item, subschema["items"])]
+            dropped += len(items) - len(valid)
+            salvaged[name] = valid
+    if dropped == 0 or validate(salvaged, schema):
+        return None, 0
+    return salvaged, dropped
+
+
+def _json_in_text(text):
+    """
+    The first JSON object or array in text. A list cut off by max_tokens
+    yields the objects that were complete.
+    """
+    decoder = json.JSONDecoder()
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+    try:
+        return decoder.raw_decode(text, start)[0]
+    except json.JSONDecodeError:
+        pass
+    if text[start] != "[":
+        return None
+    objects = []
+    position = start + 1
+    while True:
+        position = text.find("{", position)
+        if position == -1:
+            break
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        objects.append(item)
+    return objects or None
+
+
+def _response_text(response):
+    return "".join(getattr(block, "text", "") for block in response.content if getattr(block, "type", None) == "text")
+
+
+def extract(response, spec):
+    """
+    The structured value in a Messages API response, before validation.
+
+    Returns:
+        tuple: (value or None, the tool_use block or None)
+    """
+    for block in response.content:
+        if getattr(block, "type", None) == "tool_use" and block.name == spec.name:
+            return block.input, block
+    value = _json_in_text(_response_text(response))
+    if isinstance(value, list) and spec.unwrap:
+        value = {spec.unwrap: value}
+    return value, None
+
+
+def _content_params(response):
+    """A response's content blocks as request parameters, for the repair turn."""
+    content = []
+    for block in response.content:
+        if block.type == "text" and block.text:
+            content.append({"type": "text", "text": block.text})
+        elif block.type == "tool_use":
+            content.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+    return content
+
+
+def repair_request(request, response, spec, errors):
+    """Messages API arguments asking the model to correct its output."""
+    problems = "\n".join(f"- {error}" for error in errors[:20])
+    instruction = f"The {spec.name} input is invalid:\n{problems}\nCall {spec.name} again with the complete, corrected input."
+    _, tool_block = extract(response, spec)
+    if tool_block is not None:
+        feedback = [{"type": "tool_result", "tool_use_id": tool_block.id, "is_error": True, "content": instruction}]
+    else:
+        feedback = instruction
+    content = _content_params(response) or [{"type": "text", "text": "(no output)"}]
+    return dict(request, messages=list(request["messages"]) + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": feedback}
+    ])
+
+
+def check(response, spec):
+    """
+    Parse, coerce and validate a response.
+
+    Returns:
+        tuple: (value, errors)
+    """
+    value, _ = extract(response, spec)
+    if value is None:
+        return None, [f"no {spec.name} call or JSON in the response"]
+    value = coerce(value, spec.schema)
+    return value, validate(value, spec.schema)
+
+
+def _result(value, spec):
+    return value.get(spec.unwrap) if spec.unwrap else value
+
+
+def _finish(spec, value, errors, response, repairs):
+    """Return the valid (or salvaged) value, or raise."""
+    if not errors:
+        metrics.STRUCTURED_OUTPUTS.inc(output=spec.name, result="repaired" if repairs else "valid")
+        return _result(value, spec)
+    salvaged, dropped = _salvage(value, spec.schema)
+    if salvaged is not None:
+        log.warning("Dropped invalid items from structured output", output=spec.name, dropped=dropped)
+        metrics.STRUCTURED_OUTPUTS.inc(output=spec.name, result="salvaged")
+        return _result(salvaged, spec)
+    metrics.STRUCTURED_OUTPUTS.inc(output=spec.name, result="failed")
+    raise StructuredOutputError(f"Invalid {spec.name} output: {errors[0]}", errors, _response_text(response))
+
+
+def _valid(spec):
+    """Response cache filter: only cache responses whose output is valid."""
+    return lambda response: not check(response, spec)[1]
+
+
+def generate(create_message, request, spec, max_repairs=MAX_REPAIRS):
+    """
+    Call the model with the output's tool forced and return the validated value.
+
+    Args:
+        create_message (callable): llm_gateway.create_message
+        request (dict): Messages API arguments (constrained or not)
+        spec (OutputSpec): The expected output
+
+    Raises:
+        StructuredOutputError: If the output is still invalid after repairs
+    """
+    request = spec.constrain(request)
+    accept = _valid(spec)
+    response = create_message(accept=accept, **request)
+    repairs = 0
+    while True:
+        with metrics.stage(f"{spec.stage}_parse"):
+            value, errors = check(response, spec)
+        if not errors or repairs >= max_repairs:
+            return _finish(spec, value, errors, response, repairs)
+        log.warning("Repairing structured output", output=spec.name, errors=len(errors), first_error=errors[0])
+        request = repair_request(request, response, spec, errors)
+        repairs += 1
+        with metrics.stage(f"{spec.stage}_repair"):
+            response = create_message(accept=accept, **request)
+
+
+async def agenerate(acreate_message, request, spec, max_repairs=MAX_REPAIRS):
+    """Async version of generate (pass llm_gateway.acreate_message)."""
+    request = spec.constrain(request)
+    accept = _valid(spec)
+    response = await acreate_message(accept=accept, **request)
+    repairs = 0
+    while True:
+        with metrics.stage(f"{spec.stage}_parse"):
+            value, errors = check(response, spec)
+        if not errors or repairs >= max_repairs:
+            return _finish(spec, value, errors, response, repairs)
+        log.warning("Repairing structured output", output=spec.name, errors=len(errors), first_error=errors[0])
+        request = repair_request(request, response, spec, errors)
+        repairs += 1
+        with metrics.stage(f"{spec.stage}_repair"):
+            response = await acreate_message(accept=accept, **request)
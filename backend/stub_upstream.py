@@ -0,0 +1,372 @@
+"""
+Local stand-ins for the Anthropic Messages API and the OpenAI speech API.
+
+Used by benchmark.py to measure the backend without spending API money:
+point the app at the stub with ANTHROPIC_BASE_URL=http://host:port and
+OPENAI_BASE_URL=http://host:port/v1. Latency and payload sizes are
+configurable, and responses have the shape each endpoint expects:
+
+- tool calls (tools in the request) return a tool_use block for the
+  forced (or first) tool with every required argument filled in
+- form structuring / answering prompts return the fields / answers for
+  every element / HTML ID in the prompt, as the forced tool's list
+  argument or as a JSON array when no tool is given
+- navigation prompts return a list of commands the same way
+- anything else returns llm_response_chars of filler text, streamed as
+  SSE at llm_tokens_per_second when the request has "stream": true
+- usage reports prompt cache writes and reads: the first request with a
+  given prefix up to its last cache_control breakpoint writes it, later
+  ones read it (prefixes under prompt_cache_min_tokens are not cached)
+- POST /v1/audio/speech returns tts_bytes of fake MP3 data in chunks
+
+Only the standard library is used. Run standalone with:
+    python stub_upstream.py --port 8900 --llm-latency 0.8
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = (
+    "This is a benchmark response from the local stub upstream. It stands in for the model "
+    "output so that the backend can be measured without calling the real API. "
+)
+
+_ELEMENT_ID_RE = re.compile(r'--- ELEMENT \d+ ---.*?\nID: ([^\n]*)\nName: ([^\n]*)', re.DOTALL)
+_HTML_ID_RE = re.compile(r'HTML ID: ([^\n]*)')
+
+
+class StubConfig:
+    """Latency and payload settings shared by every request handler."""
+
+    def __init__(self, llm_latency=0.5, llm_jitter=0.1, llm_response_chars=600,
+                 llm_tokens_per_second=80.0, tts_latency=0.3, tts_bytes=48000, tts_chunk_bytes=4096,
+                 tts_chunk_delay=0.01, prompt_cache_min_tokens=1024):
+        self.llm_latency = llm_latency
+        self.llm_jitter = llm_jitter
+        self.llm_response_chars = llm_response_chars
+        self.llm_tokens_per_second = llm_tokens_per_second
+        self.tts_latency = tts_latency
+        self.tts_bytes = tts_bytes
+        self.tts_chunk_bytes = tts_chunk_bytes
+        self.tts_chunk_delay = tts_chunk_delay
+        self.prompt_cache_min_tokens = prompt_cache_min_tokens
+        self.requests = {"messages": 0, "speech": 0}
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def cache_prefix(self, prefix):
+        """Record a cacheable prefix; returns True if it was already cached."""
+        with self._lock:
+            if prefix in self._cached_prefixes:
+                return True
+            self._cached_prefixes.add(prefix)
+            return False
+
+    def delay(self, base):
+        time.sleep(max(0.0, base + random.uniform(-self.llm_jitter, self.llm_jitter)))
+
+
+def _prompt_text(body):
+    """All text in the request's system prompt and messages."""
+    parts = []
+    system = body.get("system")
+    if isinstance(system, str):
+        parts.append(system)
+    elif isinstance(system, list):
+        parts.extend(block.get("text", "") for block in system if isinstance(block, dict))
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(block.get("text", "") for block in content if isinstance(block, dict))
+    return "\n".join(parts)
+
+
+def _filler(chars):
+    return (FILLER * (chars // len(FILLER) + 1))[:max(1, chars)]
+
+
+def _schema_value(schema):
+    """A value of the schema's type with every required property filled in."""
+    kind = schema.get("type")
+    if schema.get("enum"):
+        return schema["enum"][0]
+    if kind in ("number", "integer"):
+        return 1
+    if kind == "boolean":
+        return True
+    if kind == "array":
+        return []
+    if kind == "object":
+        properties = schema.get("properties") or {}
+        return {name: _schema_value(properties.get(name) or {}) for name in schema.get("required") or []}
+    return "benchmark"
+
+
+def _tool_input(tool, items=None):
+    """
+    The tool's input; items, when given, go into its (first) list argument,
+    like the outputs in structured_output.py.
+    """
+    schema = tool.get("input_schema") or {}
+    arguments = _schema_value(dict(schema, type="object"))
+    if items is not None:
+        for name, subschema in (schema.get("properties") or {}).items():
+            if subschema.get("type") == "array":
+                arguments[name] = items
+                break
+    return arguments
+
+
+def _structured_items(prompt):
+    """The list a form or navigation prompt asks for, or None for other prompts."""
+    if "Form elements to structure" in prompt:
+        return [{
+            "question": f"Question {i + 1}",
+            "possible_answers": ["Free text"],
+            "html_id": element_id.strip() or name.strip()
+        } for i, (element_id, name) in enumerate(_ELEMENT_ID_RE.findall(prompt))]
+    if "FORM FIELDS TO FILL" in prompt:
+        return [{"html_id": html_id.strip(), "answer": "benchmark"} for html_id in _HTML_ID_RE.findall(prompt)]
+    if "navigation commands" in prompt:
+        return [{"type": "scroll", "target": "body", "confidence": 0.9, "explanation": "Benchmark command"}]
+    return None
+
+
+def message_content(body, config):
+    """
+    Build the content blocks of a stub Messages API response.
+
+    Returns:
+        tuple: (content blocks, stop reason)
+    """
+    items = _structured_items(_prompt_text(body))
+    tools = body.get("tools") or []
+    if tools:
+        choice = body.get("tool_choice") or {}
+        tool = tools[0]
+        if choice.get("type") == "tool":
+            tool = next((t for t in tools if t.get("name") == choice.get("name")), tool)
+        return [{
+            "type": "tool_use",
+            "id": f"toolu_stub_{random.randrange(16 ** 12):012x}",
+            "name": tool["name"],
+            "input": _tool_input(tool, items)
+        }], "tool_use"
+
+    text = json.dumps(items) if items is not None else _filler(config.llm_response_chars)
+    return [{"type": "text", "text": text}], "end_turn"
+
+
+def _prompt_parts(body):
+    """
+    The request's tools, system blocks and message blocks in prefix order.
+
+    Returns:
+        tuple: (serialized parts, index of the part with the last cache_control or -1)
+    """
+    blocks = list(body.get("tools") or [])
+    system = body.get("system")
+    blocks.extend(system if isinstance(system, list) else [system] if system else [])
+    for message in body.get("messages", []):
+        content = message.get("content")
+        blocks.extend(content if isinstance(content, list) else [content])
+    parts = [json.dumps(block, sort_keys=True) for block in blocks]
+    breakpoints = [i for i, block in enumerate(blocks) if isinstance(block, dict) and block.get("cache_control")]
+    return parts, breakpoints[-1] if breakpoints else -1
+
+
+def _usage(body, content, config):
+    parts, breakpoint = _prompt_parts(body)
+    prompt_tokens = max(1, sum(len(part) for part in parts) // 4)
+    cached_tokens = sum(len(part) for part in parts[:breakpoint + 1]) // 4
+    cache_read = cache_write = 0
+    if breakpoint >= 0 and cached_tokens >= config.prompt_cache_min_tokens:
+        prefix = (body.get("model"), tuple(parts[:breakpoint + 1]))
+        if config.cache_prefix(prefix):
+            cache_read = cached_tokens
+        else:
+            cache_write = cached_tokens
+    return {
+        "input_tokens": max(1, prompt_tokens - cache_read - cache_write),
+        "output_tokens": max(1, len(json.dumps(content)) // 4),
+        "cache_creation_input_tokens": cache_write,
+        "cache_read_input_tokens": cache_read
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        body = self._read_json()
+        try:
+            if path.endswith("/messages"):
+                self.config.count("messages")
+                self._messages(body)
+            elif path.endswith("/audio/speech"):
+                self.config.count("speech")
+                self._speech()
+            else:
+                self._send_json(404, {"error": {"type": "not_found_error", "message": path}})
+        except (BrokenPipeError, ConnectionResetError):
+            # The backend cancelled the request
+            pass
+
+    def _messages(self, body):
+        config = self.config
+        content, stop_reason = message_content(body, config)
+        usage = _usage(body, content, config)
+        message = {
+            "id": f"msg_stub_{random.randrange(16 ** 12):012x}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "stub"),
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": usage
+        }
+        config.delay(config.llm_latency)
+        if not body.get("stream"):
+            self._send_json(200, message)
+            return
+
+        def event(name, data):
+            self._write_chunk(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+        self._start_chunked("text/event-stream")
+        event("message_start", {"type": "message_start", "message": dict(
+            message, content=[], stop_reason=None, usage=dict(usage, output_tokens=1)
+        )})
+        for index, block in enumerate(content):
+            if block["type"] == "text":
+                event("content_block_start", {"type": "content_block_start", "index": index,
+                                              "content_block": {"type": "text", "text": ""}})
+                text = block["text"]
+                # Deltas of about four tokens (roughly four characters per token)
+                step = 16
+                pause = (step / 4) / config.llm_tokens_per_second if config.llm_tokens_per_second > 0 else 0
+                for start in range(0, len(text), step):
+                    event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                  "delta": {"type": "text_delta", "text": text[start:start + step]}})
+                    if pause:
+                        time.sleep(pause)
+            else:
+                event("content_block_start", {"type": "content_block_start", "index": index,
+                                              "content_block": dict(block, input={})})
+                event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                              "delta": {"type": "input_json_delta",
+                                                        "partial_json": json.dumps(block["input"])}})
+            event("content_block_stop", {"type": "content_block_stop", "index": index})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+        self._end_chunked()
+
+    def _speech(self):
+        config = self.config
+        config.delay(config.tts_latency)
+        self._start_chunked("audio/mpeg")
+        remaining = config.tts_bytes
+        # An MPEG frame header so the payload at least looks like MP3
+        chunk = b"\xff\xfb\x90\x64" + b"\x00" * max(0, config.tts_chunk_bytes - 4)
+        while remaining > 0:
+            self._write_chunk(chunk[:remaining])
+            remaining -= len(chunk)
+            if config.tts_chunk_delay:
+                time.sleep(config.tts_chunk_delay)
+        self._end_chunked()
+
+
+def start(config=None, host="127.0.0.1", port=0):
+    """
+    Start the stub in a background thread.
+
+    Returns:
+        tuple: (server, base URL)
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-upstream", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_arguments(parser):
+    """Add the stub's latency and payload options to an argparse parser."""
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before a Messages response (default 0.5)")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="Random +/- seconds added to each latency")
+    parser.add_argument("--llm-response-chars", type=int, default=600, help="Size of free-text responses")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80.0, help="Streaming pace (0 = no delay)")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="Seconds before speech audio starts")
+    parser.add_argument("--tts-bytes", type=int, default=48000, help="Size of each speech response")
+
+
+def config_from_args(args):
+    return StubConfig(
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        llm_response_chars=args.llm_response_chars,
+        llm_tokens_per_second=args.llm_tokens_per_second,
+        tts_latency=args.tts_latency,
+        tts_bytes=args.tts_bytes
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub Anthropic / OpenAI upstream for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, url = start(config_from_args(args), args.host, args.port)
+    print(f"Stub upstream listening on {url} (ANTHROPIC_BASE_URL={url}, OPENAI_BASE_URL={url}/v1)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,216 @@
+"""
+Summarization prompts and the map-reduce mode for large pages.
+
+Short text is summarized with a single request. Past
+SUMMARY_MAP_REDUCE_THRESHOLD characters the text is split on structural
+boundaries (headings, paragraphs, then sentences), the chunks are
+summarized concurrently on a bounded thread pool, and the partial
+summaries are reduced into one final summary. Chunk calls run in
+parallel, so latency stays roughly flat as pages grow instead of
+growing linearly and eventually overflowing the context window.
+
+The a-prefixed functions are the asyncio equivalents used by asgi_app.py;
+they run the map step with asyncio.gather instead of the thread pool.
+"""
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_gateway
+import metrics
+
+SUMMARY_MODEL = "claude-3-5-sonnet-20241022"
+
+# Inputs longer than this (in characters) use map-reduce in "auto" mode
+MAP_REDUCE_THRESHOLD = int(os.getenv("SUMMARY_MAP_REDUCE_THRESHOLD", "24000"))
+CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "12000"))
+MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="summary-map")
+
+_HEADING_RE = re.compile(r"\n(?=#{1,6} |[A-Z][A-Z0-9 ,:'-]{3,80}\n)")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def summary_request(text_content):
+    """
+    Build the Messages API arguments used to summarize text in one call.
+
+    Shared by the blocking and streaming summarize endpoints.
+    """
+    return {
+        "model": SUMMARY_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.0,
+        "messages": [
+            {"role": "user", "content": f"Provide a concise summary of the following text content. Focus on the main points and key information:\n\n{text_content}"}
+        ]
+    }
+
+
+def chunk_request(chunk, index, total):
+    """Build the Messages API arguments for summarizing one chunk (map step)."""
+    return {
+        "model": SUMMARY_MODEL,
+        "max_tokens": 500,
+        "temperature": 0.0,
+        "messages": [
+            {"role": "user", "content": f"The following is part {index} of {total} of a longer page. Summarize the main points and key information in this part only. Be concise:\n\n{chunk}"}
+        ]
+    }
+
+
+def reduce_request(partial_summaries):
+    """Build the Messages API arguments for combining chunk summaries (reduce step)."""
+    sections = "\n\n".join(
+        f"Part {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries)
+    )
+    return {
+        "model": SUMMARY_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.0,
+        "messages": [
+            {"role": "user", "content": f"The following are summaries of consecutive parts of one page. Combine them into a single concise summary of the whole page. Focus on the main points and key information:\n\n{sections}"}
+        ]
+    }
+
+
+def _split_oversized(piece, max_chars):
+    """Split a block longer than max_chars on sentences, then hard-cut."""
+    pieces = []
+    for sentence in _SENTENCE_RE.split(piece):
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if sentence:
+            pieces.append(sentence)
+    return pieces
+
+
+def split_text(text, max_chars=None):
+    """
+    Split text into chunks of at most max_chars, preferring structural
+    boundaries: headings first, then paragraphs, then sentences.
+
+    Returns:
+        list: Text chunks in document order
+    """
+    max_chars = max_chars or CHUNK_SIZE
+
+    blocks = []
+    for section in _HEADING_RE.split(text):
+        for paragraph in _PARAGRAPH_RE.split(section):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph) > max_chars:
+                blocks.extend(_split_oversized(paragraph, max_chars))
+            else:
+                blocks.append(paragraph)
+
+    # Greedily pack blocks into chunks
+    chunks = []
+    current = ""
+    for block in blocks:
+        if current and len(current) + len(block) + 2 > max_chars:
+            chunks.append(current)
+            current = block
+        else:
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def choose_mode(text, requested_mode="auto"):
+    """Resolve "auto" to "single" or "map_reduce" based on input size."""
+    if requested_mode in ("single", "map_reduce"):
+        return requested_mode
+    return "map_reduce" if len(text) > MAP_REDUCE_THRESHOLD else "single"
+
+
+def _summarize_chunk(args):
+    chunk, index, total = args
+    response = llm_gateway.create_message(**chunk_request(chunk, index, total))
+    return response.content[0].text
+
+
+def map_chunks(text):
+    """
+    Summarize every chunk of the text concurrently (map step).
+
+    Returns:
+        list: Partial summaries in document order
+    """
+    chunks = split_text(text)
+    total = len(chunks)
+    futures = [metrics.submit(_executor, _summarize_chunk, (chunk, i + 1, total)) for i, chunk in enumerate(chunks)]
+    return [future.result() for future in futures]
+
+
+def final_request(text, mode):
+    """
+    Return the Messages API arguments for the final summary call.
+
+    In map_reduce mode this runs the map step first and returns the
+    reduce request; partial summaries that are still too long are
+    reduced again. Used by the streaming endpoints so that only the last
+    call is streamed.
+    """
+    if mode != "map_reduce":
+        return summary_request(text)
+
+    partial_summaries = map_chunks(text)
+    combined = "\n\n".join(partial_summaries)
+    while len(combined) > MAP_REDUCE_THRESHOLD and len(partial_summaries) > 1:
+        partial_summaries = map_chunks(combined)
+        combined = "\n\n".join(partial_summaries)
+    return reduce_request(partial_summaries)
+
+
+async def amap_chunks(text):
+    """Async version of map_chunks, bounded to SUMMARY_MAX_WORKERS concurrent calls."""
+    chunks = split_text(text)
+    total = len(chunks)
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+
+    async def summarize_chunk(chunk, index):
+        async with semaphore:
+            response = await llm_gateway.acreate_message(**chunk_request(chunk, index, total))
+        return response.content[0].text
+
+    return list(await asyncio.gather(*(summarize_chunk(chunk, i + 1) for i, chunk in enumerate(chunks))))
+
+
+async def afinal_request(text, mode):
+    """Async version of final_request."""
+    if mode != "map_reduce":
+        return summary_request(text)
+
+    partial_summaries = await amap_chunks(text)
+    combined = "\n\n".join(partial_summaries)
+    while len(combined) > MAP_REDUCE_THRESHOLD and len(partial_summaries) > 1:
+        partial_summaries = await amap_chunks(combined)
+        combined = "\n\n".join(partial_summaries)
+    return reduce_request(partial_summaries)
+
+
+def summarize_text(text, mode="auto"):
+    """
+    Summarize text, using map-reduce for large inputs.
+
+    Returns:
+        tuple: (summary text, mode used)
+    """
+    mode = choose_mode(text, mode)
+    response = llm_gateway.create_message(**final_request(text, mode))
+    return response.content[0].text, mode
+
+
+async def asummarize_text(text, mode="auto"):
+    """Async version of summarize_text."""
+    mode = choose_mode(text, mode)
+    response = await llm_gateway.acreate_message(**(await afinal_request(text, mode)))
+    return response.content[0].text, mode
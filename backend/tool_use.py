@@ -0,0 +1,290 @@
+"""
+Native tool-use definitions for the /transcript tools.
+
+In fused mode the model picks a tool *and* produces its result in a single
+request: every tool that needs model output (find, extract_entities,
+analyze_sentiment, translate) declares that output as its input schema,
+so the tool_use block the model returns already is the tool result.
+Tools that are handled by the frontend (summarize, fill the form) take
+no input.
+
+The request builders and result parsers for the two-step mode live here
+too, so the Flask app and the asyncio server (asgi_app.py) send exactly
+the same prompts. In two-step mode the selection and the JSON-valued
+tools (extract_entities, analyze_sentiment) also return their output
+through a forced tool, parsed by structured_output.py.
+
+The tool definitions and system prompts are static, so the transcript
+comes last and everything before it is marked cacheable (see
+prompt_cache.py).
+"""
+import prompt_cache
+import structured_output
+
+TOOL_MODEL = "claude-3-5-sonnet-20241022"
+
+# Define available tools
+AVAILABLE_TOOLS = [
+    {
+        "name": "summarize",
+        "description": "Summarize the given text content"
+    },
+    {
+        "name": "fill the form",
+        "description": "fill the form with the basic user information"
+    },
+    {
+        "name": "find",
+        "description": "Find specific information within the text"
+    },
+    {
+        "name": "extract_entities",
+        "description": "Extract named entities from the text"
+    },
+    {
+        "name": "analyze_sentiment",
+        "description": "Analyze the sentiment of the text"
+    },
+    {
+        "name": "translate",
+        "description": "Translate the text to another language"
+    }
+]
+
+# Tools that only notify the frontend, which then does the actual work
+FRONTEND_TOOL_MESSAGES = {
+    "summarize": "Summarize tool called. Frontend will extract page content and request summarization.",
+    "fill the form": "Fill the form tool called. Frontend will extract page content and request filling the form."
+}
+
+# Prompts for the tools whose result is produced by the model in two-step mode
+TEXT_TOOL_PROMPTS = {
+    "find": "Extract the most important facts and key information from this transcript: \n\n{transcript}",
+    "extract_entities": "Extract named entities (people, organizations, locations, dates) from this transcript and record them with the extract_entities tool: \n\n{transcript}",
+    "analyze_sentiment": "Analyze the sentiment of this transcript (positive, negative, or neutral, with a 0-1 confidence and a short explanation) and record it with the analyze_sentiment tool: \n\n{transcript}",
+    "translate": "Translate the following transcript to Spanish: \n\n{transcript}"
+}
+
+# Input schemas keyed by the names used in AVAILABLE_TOOLS
+TOOL_INPUT_SCHEMAS = {
+    "summarize": {
+        "type": "object",
+        "properties": {}
+    },
+    "fill the form": {
+        "type": "object",
+        "properties": {}
+    },
+    "find": {
+        "type": "object",
+        "properties": {
+            "key_information": {
+                "type": "string",
+                "description": "The most important facts and key information from the transcript"
+            }
+        },
+        "required": ["key_information"]
+    },
+    "extract_entities": {
+        "type": "object",
+        "properties": {
+            "entities": {
+                "type": "object",
+                "description": "Named entities found in the transcript",
+                "properties": {
+                    "people": {"type": "array", "items": {"type": "string"}},
+                    "organizations": {"type": "array", "items": {"type": "string"}},
+                    "locations": {"type": "array", "items": {"type": "string"}},
+                    "dates": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["people", "organizations", "locations", "dates"]
+            }
+        },
+        "required": ["entities"]
+    },
+    "analyze_sentiment": {
+        "type": "object",
+        "properties": {
+            "sentiment": {"type": "string", "enum": ["positive", "negative", "neutral"]},
+            "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+            "explanation": {"type": "string"}
+        },
+        "required": ["sentiment", "confidence", "explanation"]
+    },
+    "translate": {
+        "type": "object",
+        "properties": {
+            "translation": {
+                "type": "string",
+                "description": "The transcript translated to Spanish"
+            }
+        },
+        "required": ["translation"]
+    }
+}
+
+# Extra guidance appended to the tool description so the model fills in the result
+RESULT_INSTRUCTIONS = {
+    "find": "Call this with the extracted key information.",
+    "extract_entities": "Call this with the people, organizations, locations and dates found.",
+    "analyze_sentiment": "Call this with the sentiment, a 0-1 confidence and a short explanation.",
+    "translate": "Call this with the full Spanish translation of the transcript."
+}
+
+# Text tools whose result is structured; their two-step call forces this tool
+TEXT_TOOL_OUTPUTS = {
+    name: structured_output.OutputSpec(name, RESULT_INSTRUCTIONS[name], TOOL_INPUT_SCHEMAS[name], stage="tool")
+    for name in ("extract_entities", "analyze_sentiment")
+}
+
+FUSED_SYSTEM_PROMPT = (
+    "You route voice transcripts from a browser assistant to exactly one tool. "
+    "Pick the most appropriate tool for the transcript and call it. "
+    "When a tool takes arguments, fill them in with the finished result computed from the transcript."
+)
+
+
+def api_tool_name(name):
+    """Tool names sent to the API may not contain spaces."""
+    return name.replace(" ", "_")
+
+
+def build_tool_definitions(available_tools):
+    """
+    Build Anthropic tool definitions from AVAILABLE_TOOLS.
+
+    Returns:
+        tuple: (list of tool definitions, dict mapping API names back to tool names)
+    """
+    definitions = []
+    name_map = {}
+    for tool in available_tools:
+        name = tool["name"]
+        description = tool["description"]
+        if name in RESULT_INSTRUCTIONS:
+            description = f"{description}. {RESULT_INSTRUCTIONS[name]}"
+        definitions.append({
+            "name": api_tool_name(name),
+            "description": description,
+            "input_schema": TOOL_INPUT_SCHEMAS.get(name, {"type": "object", "properties": {}})
+        })
+        name_map[api_tool_name(name)] = name
+    return definitions, name_map
+
+
+def find_tool_use(response):
+    """Return the first tool_use block of a Messages API response, or None."""
+    for block in response.content:
+        if getattr(block, "type", None) == "tool_use":
+            return block
+    return None
+
+
+def tool_result_from_input(tool_name, tool_input):
+    """
+    Shape a fused tool call's input like the result execute_tool would return.
+
+    Returns None for tools whose result is not produced by the model.
+    """
+    if tool_name in TOOL_INPUT_SCHEMAS:
+        tool_input = structured_output.coerce(tool_input, TOOL_INPUT_SCHEMAS[tool_name])
+    if tool_name == "find":
+        return {"key_information": tool_input.get("key_information", "")}
+    if tool_name == "extract_entities":
+        return {"entities": tool_input.get("entities", {})}
+    if tool_name == "analyze_sentiment":
+        return {"sentiment_analysis": tool_input}
+    if tool_name == "translate":
+        return {"translation": tool_input.get("translation", "")}
+    return None
+
+
+def frontend_tool_result(tool_name):
+    """Result returned for a tool that is handed off to the frontend."""
+    return {"status": "initiated", "message": FRONTEND_TOOL_MESSAGES[tool_name]}
+
+
+def text_tool_request(tool_name, transcript_text):
+    """Build the Messages API arguments for running a text tool on a transcript."""
+    return {
+        "model": TOOL_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.0,
+        "messages": [
+            {"role": "user", "content": TEXT_TOOL_PROMPTS[tool_name].format(transcript=transcript_text)}
+        ]
+    }
+
+
+def text_tool_result(tool_name, response):
+    """Shape a plain-text tool's (find, translate) Messages API response into the tool result."""
+    text = response.content[0].text
+    if tool_name == "find":
+        return {"key_information": text}
+    return {"translation": text}
+
+
+def unparsed_tool_result(tool_name, raw_text):
+    """Result for a structured text tool whose output could not be parsed or repaired."""
+    key = "entities" if tool_name == "extract_entities" else "sentiment_analysis"
+    return {key: raw_text, "parsing_error": True}
+
+
+def fused_request(transcript_text, tool_definitions):
+    """Build the Messages API arguments for fused selection and execution."""
+    return {
+        "model": TOOL_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.0,
+        # Cached together with the tool definitions, which precede it
+        "system": prompt_cache.system(FUSED_SYSTEM_PROMPT),
+        "tools": tool_definitions,
+        "tool_choice": {"type": "any"},
+        "messages": [
+            {"role": "user", "content": f"Transcript: {transcript_text}"}
+        ]
+    }
+
+
+def selection_output(available_tools=None):
+    """The structured output of the two-step selection call: one of the tool names."""
+    return structured_output.OutputSpec(
+        "select_tool",
+        "Record the tool selected to process the transcript.",
+        {
+            "type": "object",
+            "properties": {
+                "tool": {"type": "string", "enum": [tool["name"] for tool in available_tools or AVAILABLE_TOOLS]}
+            },
+            "required": ["tool"]
+        },
+        unwrap="tool",
+        stage="select"
+    )
+
+
+def selection_system_prompt(available_tools=None):
+    """The selection call's instructions and tool list; identical on every call."""
+    agent_prompt = """Based on the transcript in the user's message, select the most appropriate tool to process this content
+and record it with the select_tool tool.
+
+Available tools:
+"""
+    
+    # Add tool descriptions to the prompt
+    for tool in available_tools or AVAILABLE_TOOLS:
+        agent_prompt += f"\n- {tool['name']}: {tool['description']}"
+    return agent_prompt
+
+
+def selection_request(transcript_text, available_tools=None):
+    """Build the Messages API arguments for the two-step tool selection call."""
+    return {
+        "model": TOOL_MODEL,
+        "max_tokens": 500,
+        "temperature": 0.0,
+        "system": prompt_cache.system(selection_system_prompt(available_tools)),
+        "messages": [
+            {"role": "user", "content": f"Transcript: {transcript_text}"}
+        ]
+    }
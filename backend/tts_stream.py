@@ -0,0 +1,204 @@
+"""
+Sentence-chunked, streaming text-to-speech.
+
+Instead of truncating input to the 4096 character API limit and waiting
+for one long clip, text is split at sentence boundaries into segments
+that are synthesized concurrently on a bounded pool and streamed back in
+order. The first segment is kept short so playback can start after the
+first sentence. Every segment is cached on its own, so repeated
+sentences (and re-reads of the same summary) skip the upstream call,
+and concurrent requests for the same segment share one upstream call.
+
+asynthesize / astream_speech are the asyncio equivalents used by
+asgi_app.py; segments run as tasks on the event loop instead of a pool.
+"""
+import asyncio
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_gateway
+import metrics
+import singleflight
+from audio_cache import AudioCache, tts_cache
+from cancellation import RequestCancelled
+
+TTS_MODEL = "tts-1"
+# OpenAI's per-request input limit
+MAX_SEGMENT_CHARS = 4096
+# Later segments are grouped up to this size to limit the number of calls
+TARGET_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "600"))
+MAX_WORKERS = int(os.getenv("TTS_STREAM_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="tts-segment")
+
+# Concurrent misses for the same audio share one upstream call
+speech_flights = singleflight.SingleFlight()
+async_speech_flights = singleflight.AsyncSingleFlight()
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?。！？])\s+|\n{2,}")
+_CLAUSE_RE = re.compile(r"(?<=[,;:])\s+")
+
+
+def _split_long(sentence):
+    """Split a sentence longer than the API limit on clauses, then words."""
+    pieces = []
+    current = ""
+    for part in _CLAUSE_RE.split(sentence):
+        while len(part) > MAX_SEGMENT_CHARS:
+            cut = part.rfind(" ", 0, MAX_SEGMENT_CHARS)
+            cut = cut if cut > 0 else MAX_SEGMENT_CHARS
+            pieces.append(part[:cut])
+            part = part[cut:].lstrip()
+        if current and len(current) + len(part) + 1 > MAX_SEGMENT_CHARS:
+            pieces.append(current)
+            current = part
+        else:
+            current = f"{current} {part}" if current else part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_segments(text, target_chars=None):
+    """
+    Split text into speakable segments at sentence boundaries.
+
+    The first segment is a single sentence so audio starts quickly; later
+    sentences are grouped up to target_chars. No segment exceeds the API limit.
+
+    Returns:
+        list: Segments in reading order
+    """
+    target_chars = target_chars or TARGET_SEGMENT_CHARS
+    sentences = []
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) > MAX_SEGMENT_CHARS:
+            sentences.extend(_split_long(sentence))
+        else:
+            sentences.append(sentence)
+
+    if not sentences:
+        return []
+    segments = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + len(sentence) + 1 > target_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+def fetch_speech(key, text, voice, cancel_token=None):
+    """
+    Synthesize text upstream after a cache miss and store the audio under key.
+
+    Identical concurrent requests wait for the first one's upstream call.
+    If that request is cancelled, the others carry on with their own call.
+    """
+    def fetch():
+        audio_data = llm_gateway.create_speech(
+            cancel_token=cancel_token, model=TTS_MODEL, voice=voice, input=text
+        )
+        tts_cache.put(key, audio_data)
+        return audio_data
+
+    return speech_flights.do(key, fetch, cancel_token=cancel_token, abandon_on=(RequestCancelled,))
+
+
+def synthesize(text, voice, cancel_token=None):
+    """Return MP3 bytes for text, using the segment cache when possible."""
+    key = AudioCache.key(voice, text, TTS_MODEL)
+    audio_data = tts_cache.get(key)
+    if audio_data is None:
+        audio_data = fetch_speech(key, text, voice, cancel_token)
+    return audio_data
+
+
+def stream_speech(text, voice, cancel_token=None):
+    """
+    Synthesize text segment by segment and yield MP3 chunks in order.
+
+    Up to TTS_STREAM_WORKERS segments ahead of the one being played are
+    synthesized concurrently; each is yielded only after all the
+    segments before it.
+
+    Args:
+        text (str): Text to read
+        voice (str): OpenAI voice name
+        cancel_token (CancelToken): Optional token; cancelling it aborts the
+            segments in flight and ends the stream
+    """
+    segments = split_segments(text)
+    pending = deque()
+    next_index = 0
+    try:
+        while pending or next_index < len(segments):
+            while next_index < len(segments) and len(pending) < MAX_WORKERS:
+                pending.append(metrics.submit(_executor, synthesize, segments[next_index], voice, cancel_token))
+                next_index += 1
+            future = pending.popleft()
+            if cancel_token is not None and cancel_token.cancelled:
+                future.cancel()
+                return
+            try:
+                audio_data = future.result()
+            except RequestCancelled:
+                return
+            yield audio_data
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def afetch_speech(key, text, voice, cancel_token=None):
+    """Async version of fetch_speech."""
+    async def fetch():
+        audio_data = await llm_gateway.acreate_speech(
+            cancel_token=cancel_token, model=TTS_MODEL, voice=voice, input=text
+        )
+        await asyncio.to_thread(tts_cache.put, key, audio_data)
+        return audio_data
+
+    return await async_speech_flights.do(key, fetch, cancel_token=cancel_token, abandon_on=(RequestCancelled,))
+
+
+async def asynthesize(text, voice, cancel_token=None):
+    """Async version of synthesize; cache lookups run off the event loop (disk tier)."""
+    key = AudioCache.key(voice, text, TTS_MODEL)
+    audio_data = await asyncio.to_thread(tts_cache.get, key)
+    if audio_data is None:
+        audio_data = await afetch_speech(key, text, voice, cancel_token)
+    return audio_data
+
+
+async def astream_speech(text, voice, cancel_token=None):
+    """Async version of stream_speech: an async generator of MP3 chunks."""
+    segments = split_segments(text)
+    pending = deque()
+    next_index = 0
+    try:
+        while pending or next_index < len(segments):
+            while next_index < len(segments) and len(pending) < MAX_WORKERS:
+                pending.append(asyncio.ensure_future(asynthesize(segments[next_index], voice, cancel_token)))
+                next_index += 1
+            task = pending.popleft()
+            if cancel_token is not None and cancel_token.cancelled:
+                task.cancel()
+                return
+            try:
+                audio_data = await task
+            except RequestCancelled:
+                return
+            yield audio_data
+    finally:
+        for task in pending:
+            task.cancel()
@@ -10,9 +10,23 @@ function debugLog(...args) {
   }
 }
 
+// The TTS session id shared by the popup, background worker and pages
+// (see getTtsSessionId in content.js)
+async function getTtsSessionId() {
+  const stored = await chrome.storage.local.get('deiTtsSessionId');
+  if (stored.deiTtsSessionId) {
+    return stored.deiTtsSessionId;
+  }
+  const ttsSessionId = crypto.randomUUID();
+  await chrome.storage.local.set({ deiTtsSessionId: ttsSessionId });
+  return ttsSessionId;
+}
+
 // Background script initialization
 chrome.runtime.onInstalled.addListener(() => {
   debugLog("DEI Voice Assistant Extension Installed");
+  // Create the shared TTS session id before the popup or a page needs it
+  getTtsSessionId();
 });
 
 // Message handler for communication with the popup
@@ -67,14 +81,15 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
         console.log("Popup not available, handling TTS directly");
         
         // Make the API call directly from background if popup is closed
-        fetch("http://127.0.0.1:5001/text_to_speech", {
+        getTtsSessionId().then(ttsSessionId => fetch("http://127.0.0.1:5001/text_to_speech", {
           method: "POST",
           headers: { "Content-Type": "application/json" },
           body: JSON.stringify({ 
             text: request.data.text,
-            voice: "alloy" // OpenAI voice option
+            voice: "alloy", // OpenAI voice option
+            session_id: ttsSessionId
           })
-        })
+        }))
         .then(response => {
           if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
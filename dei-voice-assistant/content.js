@@ -863,25 +863,107 @@ function stopNavRecording() {
 }
 
 
+// The backend caches a distilled element index per page hash, so follow-up
+// navigation commands only send that hash plus the regions of the DOM that
+// changed since the last request instead of the whole page markup
+const NAV_MAX_PATCHES = 5;
+const NAV_REGION_ID = /^[A-Za-z_][A-Za-z0-9_-]*$/;
+let navPageHash = null;
+let navPageUrl = null;
+let navDirtyRegions = new Set();
+let navFullResyncNeeded = true;
+
+// Nearest ancestor with an id the backend can use as a region selector
+function findNavRegion(node) {
+  let element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+  while (element && element !== document.body && element !== document.documentElement) {
+    if (element.id && NAV_REGION_ID.test(element.id)) return element;
+    element = element.parentElement;
+  }
+  return null;
+}
+
+// Our own UI (ids prefixed "dei-", toasts, injected styles) never changes the page's element index
+function isExtensionNode(node) {
+  if (node.nodeType !== Node.ELEMENT_NODE) return false;
+  return node.id.startsWith('dei-') || node.dataset.deiUi === 'true' || node.nodeName === 'STYLE';
+}
+
+function isExtensionMutation(mutation) {
+  if (mutation.target === document.head) return true;
+  if (mutation.type !== 'childList') return false;
+  const nodes = [...mutation.addedNodes, ...mutation.removedNodes];
+  return nodes.length > 0 && nodes.every(isExtensionNode);
+}
+
+const navObserver = new MutationObserver(mutations => {
+  for (const mutation of mutations) {
+    if (isExtensionMutation(mutation)) continue;
+    const region = findNavRegion(mutation.target);
+    if (!region) {
+      navFullResyncNeeded = true;
+    } else if (!region.id.startsWith('dei-')) {
+      navDirtyRegions.add(region);
+    }
+  }
+  if (navDirtyRegions.size > NAV_MAX_PATCHES) navFullResyncNeeded = true;
+});
+navObserver.observe(document.documentElement, {
+  childList: true,
+  subtree: true,
+  characterData: true,
+  // Only attributes that affect the distilled index (not e.g. highlight styles)
+  attributeFilter: ['id', 'href', 'role', 'name', 'type', 'value', 'placeholder', 'title', 'alt', 'aria-label', 'aria-hidden', 'disabled']
+});
+
+// Build the page part of a /navigation-chrome request
+function buildNavPagePayload() {
+  const fullPage = { html_content: document.documentElement.outerHTML };
+  if (!navPageHash || navFullResyncNeeded || navPageUrl !== location.href) {
+    return fullPage;
+  }
+  
+  const patches = [];
+  for (const region of navDirtyRegions) {
+    if (!document.contains(region)) return fullPage;
+    patches.push({ selector: `#${region.id}`, html: region.outerHTML });
+  }
+  return patches.length ? { page_hash: navPageHash, dom_patches: patches } : { page_hash: navPageHash };
+}
+
+async function sendNavRequest(text, pagePayload) {
+  const response = await fetch("http://127.0.0.1:5001/navigation-chrome", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      transcript: text,
+      ...pagePayload,
+    }),
+  });
+  return { status: response.status, data: await response.json() };
+}
+
 // Function to process navigation command
 async function processNavCommand(text) {
   debugLog("Processing navigation command:", text);
   
   try {
-    // Get page content
-    const pageContent = await extractPageContent();
+    // Send the page markup (or just its hash and changed regions); the
+    // backend distills it to the interactive elements with CSS selectors
+    const pagePayload = buildNavPagePayload();
+    navDirtyRegions = new Set();
+    navFullResyncNeeded = false;
     
-    // Send to navigation endpoint
-    const response = await fetch("http://127.0.0.1:5001/navigation-chrome", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        transcript: text,
-        html_content: pageContent,
-      }),
-    });
+    let { status, data } = await sendNavRequest(text, pagePayload);
+    if (status === 409 && data.code === "page_not_cached") {
+      // The backend evicted this page; resend the full markup
+      ({ status, data } = await sendNavRequest(text, { html_content: document.documentElement.outerHTML }));
+    }
     
-    const data = await response.json();
+    if (data.page_hash) {
+      navPageHash = data.page_hash;
+      navPageUrl = location.href;
+    }
     
     if (data.status === "success" && data.commands) {
       // Execute the navigation commands
@@ -1227,49 +1309,24 @@ function handleReadAloud() {
   
   showToast('Generating audio...');
   
-  // Call the text_to_speech endpoint
-  fetch('http://127.0.0.1:5001/text_to_speech', {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json'
-    },
-    body: JSON.stringify({
-      text: textToRead,
-      voice: 'alloy' // Use a neutral voice
-    })
-  })
-  .then(response => {
-    debugLog("Got response from text_to_speech:", response.status);
-    if (!response.ok) {
-      throw new Error('Failed to generate audio');
-    }
-    return response.blob();
-  })
-  .then(audioBlob => {
-    debugLog("Received audio blob, size:", audioBlob.size);
-    
-    // Create a URL for the audio blob
-    const audioUrl = URL.createObjectURL(audioBlob);
-    
-    // Show the audio section
-    if (audioSection) {
-      audioSection.style.display = 'flex';
-    }
-    
-    // Update the audio player
-    if (audioPlayer) {
-      audioPlayer.src = audioUrl;
-      audioPlayer.style.display = 'block';
-      audioPlayer.play();
-    }
+  // Show the audio section
+  if (audioSection) {
+    audioSection.style.display = 'flex';
+  }
+  if (audioPlayer) {
+    audioPlayer.style.display = 'block';
+  }
+  
+  // Stream the audio so playback starts after the first sentence
+  playStreamedSpeech(textToRead, audioPlayer, () => showToast('Playing audio explanation'))
+  .then(() => {
+    debugLog("Finished streaming audio");
     
     // Update button
     if (readAloudBtn) {
       readAloudBtn.disabled = false;
       readAloudBtn.innerHTML = '<span style="font-size: 16px;">🔊</span> Read Aloud';
     }
-    
-    showToast('Playing audio explanation');
   })
   .catch(error => {
     debugLog("Error getting audio:", error);
@@ -1281,6 +1338,73 @@ function handleReadAloud() {
   });
 }
 
+// TTS session id shared by the popup, the background worker and every page
+// of this browser profile, so stopping audio anywhere (for example starting a
+// recording in the popup) also cancels read-aloud speech still being
+// synthesized, without touching other users' requests
+async function getTtsSessionId() {
+  const stored = await chrome.storage.local.get('deiTtsSessionId');
+  if (stored.deiTtsSessionId) {
+    return stored.deiTtsSessionId;
+  }
+  const ttsSessionId = crypto.randomUUID();
+  await chrome.storage.local.set({ deiTtsSessionId: ttsSessionId });
+  return ttsSessionId;
+}
+
+// Wait for a SourceBuffer to finish its current append
+function waitForSourceBuffer(sourceBuffer) {
+  if (!sourceBuffer.updating) return Promise.resolve();
+  return new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+}
+
+// Play MP3 audio from /text_to_speech/stream as it arrives, using Media
+// Source Extensions; onStart is called when playback begins
+async function playStreamedSpeech(text, audioPlayer, onStart, voice = 'alloy') {
+  const response = await fetch('http://127.0.0.1:5001/text_to_speech/stream', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({
+      text: text,
+      voice: voice,
+      session_id: await getTtsSessionId()
+    })
+  });
+  
+  debugLog("Got response from text_to_speech stream:", response.status);
+  if (!response.ok) {
+    throw new Error('Failed to generate audio');
+  }
+  
+  const mediaSource = new MediaSource();
+  audioPlayer.src = URL.createObjectURL(mediaSource);
+  await new Promise(resolve => mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+  const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+  
+  const reader = response.body.getReader();
+  let started = false;
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    
+    await waitForSourceBuffer(sourceBuffer);
+    sourceBuffer.appendBuffer(value);
+    await waitForSourceBuffer(sourceBuffer);
+    
+    if (!started) {
+      started = true;
+      audioPlayer.play().catch(error => debugLog("Error starting playback:", error));
+      if (onStart) onStart();
+    }
+  }
+  
+  if (mediaSource.readyState === 'open') {
+    mediaSource.endOfStream();
+  }
+}
+
 // Function to stop audio playback
 function stopAudio() {
   const audioPlayer = document.getElementById('dei-audio-player');
@@ -1292,9 +1416,15 @@ function stopAudio() {
   }
   
   // Also send a stop request to the backend to cancel any in-progress TTS
-  fetch('http://127.0.0.1:5001/stop_audio', {
-    method: 'POST'
-  }).catch(error => {
+  getTtsSessionId().then(ttsSessionId => fetch('http://127.0.0.1:5001/stop_audio', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({
+      session_id: ttsSessionId
+    })
+  })).catch(error => {
     debugLog("Error stopping audio on server:", error);
   });
 }
@@ -2009,6 +2139,7 @@ function showToast(message, duration = 3000) {
     animation: toastFadeIn 0.3s forwards;
   `;
   toast.textContent = message;
+  toast.dataset.deiUi = 'true';
   document.body.appendChild(toast);
   
   // Add animation for the toast
@@ -2035,6 +2166,63 @@ function showToast(message, duration = 3000) {
   }, duration);
 }
 
+// Stream a summary from the backend's Server-Sent Events endpoint.
+// onPartial is called with the text received so far as tokens arrive;
+// resolves with { summary } once the "done" event is received.
+async function streamSummary(text, onPartial) {
+  const response = await fetch('http://127.0.0.1:5001/summarize/stream', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({
+      text: text
+    })
+  });
+  
+  debugLog("Got response from summarize stream endpoint:", response.status);
+  if (!response.ok) {
+    throw new Error(`Network response was not ok: ${response.status}`);
+  }
+  
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let summary = '';
+  
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let eventName = 'message';
+      let eventData = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        else if (line.startsWith('data: ')) eventData += line.slice(6);
+      });
+      const payload = eventData ? JSON.parse(eventData) : {};
+      
+      if (eventName === 'token') {
+        summary += payload.text;
+        if (onPartial) onPartial(summary);
+      } else if (eventName === 'done') {
+        return { summary: payload.summary };
+      } else if (eventName === 'error') {
+        throw new Error(payload.error);
+      }
+    }
+  }
+  
+  return { summary };
+}
+
 // Function to summarize selected text
 function summarizeSelectedText(text) {
   debugLog("Summarizing text:", text.substring(0, 100) + (text.length > 100 ? '...' : ''));
@@ -2064,22 +2252,10 @@ function summarizeSelectedText(text) {
     loading.style.animation = 'pulse 1.5s infinite';
   }
   
-  // Send the text to the backend for summarization
-  fetch('http://127.0.0.1:5001/summarize', {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json'
-    },
-    body: JSON.stringify({
-      text: text
-    })
-  })
-  .then(response => {
-    debugLog("Got response from summarize endpoint:", response.status);
-    if (!response.ok) {
-      throw new Error(`Network response was not ok: ${response.status}`);
-    }
-    return response.json();
+  // Stream the summary from the backend, showing words as they arrive
+  streamSummary(text, partialSummary => {
+    if (loading) loading.style.display = 'none';
+    if (content) content.innerHTML = partialSummary.replace(/\n/g, '<br>');
   })
   .then(responseData => {
     debugLog("Got summarization data:", responseData);
@@ -2224,22 +2400,10 @@ function summarizePageContent(content) {
     loading.style.animation = 'pulse 1.5s infinite';
   }
   
-  // Send the content to the backend for summarization
-  fetch('http://127.0.0.1:5001/summarize', {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json'
-    },
-    body: JSON.stringify({
-      text: content
-    })
-  })
-  .then(response => {
-    debugLog("Got response from summarize endpoint:", response.status);
-    if (!response.ok) {
-      throw new Error(`Network response was not ok: ${response.status}`);
-    }
-    return response.json();
+  // Stream the summary from the backend, showing words as they arrive
+  streamSummary(content, partialSummary => {
+    if (loading) loading.style.display = 'none';
+    if (modalContent) modalContent.innerHTML = partialSummary.replace(/\n/g, '<br>');
   })
   .then(responseData => {
     debugLog("Got summarization data:", responseData);
@@ -4288,6 +4452,76 @@ function syncKnowledgeBaseData() {
   });
 }
 
+// Stable id of this browser profile's knowledge base, so the backend keeps
+// one retrieval index per user and updates it incrementally when it changes
+async function getKnowledgeBaseId() {
+  const stored = await chrome.storage.local.get('deiKnowledgeBaseId');
+  if (stored.deiKnowledgeBaseId) {
+    return stored.deiKnowledgeBaseId;
+  }
+  const knowledgeBaseId = crypto.randomUUID();
+  await chrome.storage.local.set({ deiKnowledgeBaseId: knowledgeBaseId });
+  return knowledgeBaseId;
+}
+
+// Fill a form through the backend's Server-Sent Events endpoint.
+// onAnswers is called with each batch of answers as it arrives;
+// resolves with all answers once the "done" event is received.
+async function streamFormAnswers(formData, userData, onAnswers) {
+  const response = await fetch('http://127.0.0.1:5001/fill-form/stream', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({
+      form_data: formData,
+      user_data: userData,
+      knowledge_base_id: await getKnowledgeBaseId()
+    })
+  });
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}`);
+  }
+  
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let formAnswers = [];
+  
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let eventName = 'message';
+      let eventData = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        else if (line.startsWith('data: ')) eventData += line.slice(6);
+      });
+      const payload = eventData ? JSON.parse(eventData) : {};
+      
+      if (eventName === 'answers') {
+        formAnswers = formAnswers.concat(payload.form_answers);
+        if (onAnswers) onAnswers(payload.form_answers);
+      } else if (eventName === 'done') {
+        return payload.form_answers;
+      } else if (eventName === 'error') {
+        throw new Error(payload.message);
+      }
+    }
+  }
+  
+  return formAnswers;
+}
+
 // Function to send form data to backend
 async function sendFormDataToBackend(formElements) {
   try {
@@ -4335,27 +4569,13 @@ async function sendFormDataToBackend(formElements) {
     // Show processing toast
     showToast(`Processing ${formData.length} form elements...`, 3000);
     
-    // Send data to backend
-    const response = await fetch('http://127.0.0.1:5001/fill-form', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify({
-        form_data: formData,
-        user_data: userData
-      })
+    // Send data to backend; long forms are answered in batches, and each
+    // batch is filled in as soon as it arrives
+    const formAnswers = await streamFormAnswers(formData, userData, answers => {
+      fillFormWithAnswers(answers, formElements);
     });
     
-    if (!response.ok) {
-      throw new Error(`Server responded with ${response.status}`);
-    }
-    
-    const data = await response.json();
-    
-    if (data.status === 'success' && data.form_answers) {
-      // Fill the form with the received answers
-      fillFormWithAnswers(data.form_answers, formElements);
+    if (formAnswers.length > 0) {
       showToast('Form filled successfully', 3000);
     } else {
       showToast('Could not generate form answers', 3000);
@@ -1,3 +1,14 @@
+// The TTS session id shared by the popup, background worker and pages
+async function getTtsSessionId() {
+  const stored = await chrome.storage.local.get('deiTtsSessionId');
+  if (stored.deiTtsSessionId) {
+    return stored.deiTtsSessionId;
+  }
+  const ttsSessionId = crypto.randomUUID();
+  await chrome.storage.local.set({ deiTtsSessionId: ttsSessionId });
+  return ttsSessionId;
+}
+
 document.addEventListener("DOMContentLoaded", () => {
   const recordBtn = document.getElementById("recordBtn");
   const wave = document.getElementById("wave");
@@ -12,6 +23,11 @@ document.addEventListener("DOMContentLoaded", () => {
   let recognition;
   const backendUrl = "http://127.0.0.1:5001/transcript"; // Adjust if needed
   
+  // TTS session id shared with the content scripts and the background worker
+  // (see getTtsSessionId in content.js), so stopping audio here also cancels
+  // page read-aloud speech that is still being synthesized
+  const ttsSessionReady = getTtsSessionId();
+  
   // Socket connection to the backend
   const socket = io("http://127.0.0.1:5001/");
   let isSocketConnected = false;
@@ -20,6 +36,8 @@ document.addEventListener("DOMContentLoaded", () => {
   socket.on("connect", () => {
     console.log("Popup connected to server socket");
     isSocketConnected = true;
+    // Only receive stop_audio events meant for this session
+    ttsSessionReady.then(ttsSessionId => socket.emit("join_session", { session_id: ttsSessionId }));
     updateStatus("Connected to server");
   });
   
@@ -205,10 +223,11 @@ document.addEventListener("DOMContentLoaded", () => {
     }
     
     // Tell the backend to stop any active TTS processes
-    fetch("http://127.0.0.1:5001/stop_audio", {
+    ttsSessionReady.then(ttsSessionId => fetch("http://127.0.0.1:5001/stop_audio", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-    })
+      body: JSON.stringify({ session_id: ttsSessionId }),
+    }))
     .then(response => {
       console.log("Audio stop request sent to backend");
     })
@@ -489,15 +508,16 @@ document.addEventListener("DOMContentLoaded", () => {
       const controller = new AbortController();
       const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
       
-      fetch("http://127.0.0.1:5001/text_to_speech", {
+      ttsSessionReady.then(ttsSessionId => fetch("http://127.0.0.1:5001/text_to_speech", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ 
           text: text,
-          voice: "alloy" // OpenAI voice option: alloy, echo, fable, onyx, nova, or shimmer
+          voice: "alloy", // OpenAI voice option: alloy, echo, fable, onyx, nova, or shimmer
+          session_id: ttsSessionId
         }),
         signal: controller.signal
-      })
+      }))
       .then(response => {
         clearTimeout(timeoutId);
         